@@ -1,7 +1,8 @@
-import time, crypt, base64, random
-from hashlib                    import md5
+import os, time, crypt, base64, random
+from hashlib                    import md5, sha256
 
 from manifold.util.log          import Log
+from manifold.util.singleton    import Singleton
 
 try:
     from manifold.conf  import ADMIN_USER
@@ -9,6 +10,12 @@ except:
     ADMIN_USER = 'admin' # XXX
 
 from manifold.core.query        import Query
+from manifold.core.record       import Record
+
+# Number of seconds a successful password authentication is kept in memory
+PASSWORD_AUTH_LIFETIME = 300
+# Number of seconds between two removals of the expired sessions from the Storage
+SESSION_CLEANUP_PERIOD = 600
 
 #-------------------------------------------------------------------------------
 # Helper functions
@@ -39,6 +46,103 @@ def make_user_dict(user):
 
 class AuthenticationFailure(Exception): pass
 
+#-------------------------------------------------------------------------------
+# AuthCache class
+#-------------------------------------------------------------------------------
+
+class AuthCache(object):
+    """
+    Keeps in memory the users resolved by successful authentications, so
+    that most of the requests do not query the Storage to be authenticated.
+    Entries are keyed by session token or by a salted digest of the
+    credentials (the credentials themselves are never stored).
+    """
+    __metaclass__ = Singleton
+
+    def __init__(self):
+        # {key : (expiration timestamp, user)}
+        self._entries = dict()
+        # Salt the digests of the credentials with a per-process secret
+        self._salt = os.urandom(16)
+
+    def get_password_key(self, username, password):
+        """
+        Returns:
+            The key related to a pair of credentials.
+        """
+        digest = sha256(self._salt)
+        digest.update(username.encode('utf-8'))
+        digest.update('\0')
+        digest.update(password.encode('utf-8'))
+        return ('password', digest.hexdigest())
+
+    def get_session_key(self, session):
+        """
+        Returns:
+            The key related to a session token.
+        """
+        return ('session', session)
+
+    def get(self, key):
+        """
+        Args:
+            key: A key returned by get_password_key or get_session_key.
+        Returns:
+            A copy of the authenticated user, None if not found or expired.
+        """
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        expires, user = entry
+        if expires <= time.time():
+            del self._entries[key]
+            return None
+        return Record(user)
+
+    def add(self, key, user, expires):
+        """
+        Args:
+            key: A key returned by get_password_key or get_session_key.
+            user: The authenticated user.
+            expires: The timestamp until which the authentication is valid.
+        """
+        self._entries[key] = (expires, Record(user))
+
+    def clear(self):
+        """
+        Forget every authentication.
+        """
+        self._entries.clear()
+
+    def invalidate(self, table_name, filter):
+        """
+        Forget the authentications possibly altered by an update or a
+        deletion of users or sessions. Creations do not alter any.
+        Args:
+            table_name: 'user' or 'session'.
+            filter: The Filter of the update or delete Query. An entry is
+                forgotten unless its user (resp. session) does not match it.
+        """
+        for key, (expires, user) in self._entries.items():
+            if table_name == 'user':
+                record = user
+            elif key[0] == 'session':
+                record = {'session': key[1], 'user_id': user.get('user_id'), 'expires': expires}
+            else:
+                continue
+            # Predicates on unknown fields match
+            if filter.match(record, ignore_missing = False):
+                del self._entries[key]
+
+    def clean(self):
+        """
+        Remove the expired entries.
+        """
+        now = time.time()
+        for key, (expires, _) in self._entries.items():
+            if expires <= now:
+                del self._entries[key]
+
 #-------------------------------------------------------------------------------
 # Auth class
 #-------------------------------------------------------------------------------
@@ -59,6 +163,11 @@ class PasswordAuth(AuthMethod):
         # Method.type_check() should have checked that all of the
         # mandatory fields were present.
         assert self.auth.has_key('Username')
+
+        key = AuthCache().get_password_key(self.auth['Username'].lower(), self.auth['AuthString'])
+        user = AuthCache().get(key)
+        if user:
+            return user
         
         # Get record (must be enabled)
         try:
@@ -67,12 +176,7 @@ class PasswordAuth(AuthMethod):
         except Exception, e:
             import traceback
             traceback.print_exc()
-            Log.warning("Authentication failed, delete expired sessions")
-            query_sessions = Query.delete('local:session').filter_by('expires', '<', int(time.time()))
-            try:
-                self.interface.execute_local_query(query_sessions)
-            except: pass
-
+            # Expired sessions are periodically deleted, see start_session_cleanup
             raise AuthenticationFailure, "No such account (PW): %s" % e
 
         # Compare encrypted plaintext against encrypted password stored in the DB
@@ -84,6 +188,7 @@ class PasswordAuth(AuthMethod):
             crypt.crypt(plaintext, password[:12]) != password:
             raise AuthenticationFailure, "Password verification failed"
 
+        AuthCache().add(key, user, time.time() + PASSWORD_AUTH_LIFETIME)
         return user
 
 class AnonymousAuth(AuthMethod):
@@ -134,6 +239,11 @@ class SessionAuth(AuthMethod):
     def check(self):
         assert self.auth.has_key('session')
 
+        key = AuthCache().get_session_key(self.auth['session'])
+        user = AuthCache().get(key)
+        if user:
+            return user
+
         query_sessions = Query.get('local:session').filter_by('session', '==', self.auth['session'])
         sessions = self.interface.execute_local_query(query_sessions)
         if not sessions:
@@ -149,6 +259,7 @@ class SessionAuth(AuthMethod):
             raise AuthenticationFailure, "No such user_id: %s" % e
         
         if user and session['expires'] > time.time():
+            AuthCache().add(key, user, session['expires'])
             return user
         else:
             query_sessions = Query.delete('local:session').filter_by('session', '==', session['session'])
@@ -158,7 +269,7 @@ class SessionAuth(AuthMethod):
             raise AuthenticationFailure, "Invalid session"
 
     def clean_sessions(self):
-        # Before a new session is added, delete expired sessions
+        # Delete expired sessions (see start_session_cleanup)
         query_sessions = Query.delete('local:session').filter_by('expires', '<', int(time.time()))
         try:
             self.interface.execute_local_query(query_sessions)
@@ -166,7 +277,6 @@ class SessionAuth(AuthMethod):
 
     def get_session(self, user):
         assert user, "A user associated to a session should not be NULL"
-        self.clean_sessions()
 
         # Generate 32 random bytes
         bytes = random.sample(xrange(0, 256), 32)
@@ -186,6 +296,29 @@ class SessionAuth(AuthMethod):
         return session['session']
 
 
+def start_session_cleanup(interface, period = SESSION_CLEANUP_PERIOD):
+    """
+    Periodically delete the expired sessions from the Storage (and the
+    expired authentications from the AuthCache) in the reactor, instead
+    of doing it while processing the requests.
+    Args:
+        interface: The Interface used to run local queries.
+        period: The number of seconds between two cleanups.
+    Returns:
+        The corresponding twisted.internet.task.LoopingCall instance.
+    """
+    from twisted.internet.task          import LoopingCall
+    from manifold.util.reactor_thread   import ReactorThread
+
+    def clean():
+        SessionAuth(None, interface).clean_sessions()
+        AuthCache().clean()
+
+    loop = LoopingCall(clean)
+    loop.clock = ReactorThread().reactor
+    ReactorThread().callInReactor(loop.start, period, False)
+    return loop
+
 class PLEAuth(AuthMethod):
     """
     Authentication towards PLE
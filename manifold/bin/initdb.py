@@ -2,12 +2,19 @@
 # -*- coding:utf-8 */
 
 from manifold.core.router import Router
+from manifold.util.storage import DBStorage
 
 def main():
+    DBStorage.init_options()
+
+    # Create the tables of the local storage (this is the only place where
+    # the schema is checked, see manifold.models)
+    from manifold.models import init_db
+    init_db()
+
     # Instantiate a TopHat router
     with Router() as router:
         pass
 
 if __name__ == '__main__':
     main()
-
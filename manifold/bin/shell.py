@@ -507,6 +507,7 @@ def main():
     Shell.init_options()
     Log.init_options()
     DBStorage.init_options()
+    Router.init_options()
     Options().parse()
     command = Options().execute
     if command:
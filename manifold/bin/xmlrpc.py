@@ -18,7 +18,7 @@ import sys, xmlrpclib, datetime, os.path
 from manifold.core.query            import Query
 from manifold.core.forwarder        import Forwarder
 from manifold.core.router           import Router
-from manifold.core.record           import Record, Records
+from manifold.core.record           import Record, Records, SharedRecord
 from manifold.core.result_value     import ResultValue
 from manifold.core.capabilities     import Capabilities
 from manifold.util.log              import Log
@@ -45,7 +45,15 @@ xmlrpclib.Marshaller.dispatch[int]      = xmlrpclib.Marshaller.dump_int
 xmlrpclib.Marshaller.dispatch[inet]     = xmlrpclib.Marshaller.dump_string
 xmlrpclib.Marshaller.dispatch[hostname] = xmlrpclib.Marshaller.dump_string
 xmlrpclib.Marshaller.dispatch[date]     = lambda s: xmlrpclib.Marshaller.dump_string(str(s))
-xmlrpclib.Marshaller.dispatch[Record]   = xmlrpclib.Marshaller.dump_struct
+def dump_record(self, value, write):
+    """
+    Marshal a Record into a XMLRPC struct (Records are neither
+    dictionaries nor objects having a __dict__).
+    """
+    self.dispatch[dict](self, value.get_dict(), write)
+
+xmlrpclib.Marshaller.dispatch[Record]   = dump_record
+xmlrpclib.Marshaller.dispatch[SharedRecord] = dump_record
 xmlrpclib.Marshaller.dispatch[Records]  = xmlrpclib.Marshaller.dump_array
 xmlrpclib.Marshaller.dispatch[ResultValue]   = xmlrpclib.Marshaller.dump_struct
 
@@ -145,6 +153,13 @@ class XMLRPCDaemon(Daemon):
         #from twisted.internet   import reactor
         # This also imports manifold.util.reactor_thread that uses reactor
         from manifold.core.router       import Router
+
+        # The RSpec parsing processes must be forked before any thread is started
+        try:
+            from manifold.gateways.sfa.parser_pool import RSpecParserPool
+            RSpecParserPool().start()
+        except ImportError, e:
+            Log.warning("RSpecs will be parsed in the reactor thread: %s" % e)
             
 
 
@@ -180,6 +195,10 @@ class XMLRPCDaemon(Daemon):
         else:
             self.interface = Router()
 
+        # Expired sessions are removed periodically rather than while authenticating
+        from manifold.auth import start_session_cleanup
+        start_session_cleanup(self.interface)
+
         try:
             def verifyCallback(connection, x509, errnum, errdepth, ok):
                 if not ok:
@@ -240,6 +259,7 @@ def main():
     Log.init_options()
     Daemon.init_options()
     DBStorage.init_options()
+    Router.init_options()
     Options().parse()
     
     XMLRPCDaemon().start()
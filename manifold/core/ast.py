@@ -26,6 +26,7 @@ from manifold.operators.from_table    import FromTable
 from manifold.operators.selection     import Selection
 from manifold.operators.projection    import Projection
 from manifold.operators.left_join     import LeftJoin
+from manifold.operators.symmetric_hash_join import SymmetricHashJoin
 from manifold.operators.rename        import Rename
 from manifold.operators.union         import Union
 from manifold.operators.subquery      import SubQuery
@@ -186,7 +187,12 @@ class AST(object):
         #    left_query.fields |= right_query.fields
         #    return self
 
-        self.root = LeftJoin(self.get_root(), right_child.get_root(), predicate)
+        # If the right operand cannot take advantage of the keys of the left
+        # records, both operands are queried simultaneously.
+        if SymmetricHashJoin.benefits_from_injection(right_child.get_root()):
+            self.root = LeftJoin(self.get_root(), right_child.get_root(), predicate)
+        else:
+            self.root = SymmetricHashJoin(self.get_root(), right_child.get_root(), predicate)
         return self
 
     #@returns(AST)
@@ -349,6 +355,7 @@ class AST(object):
             query: The Query issued by the user.
         """
         self.optimize_selection(query.get_where())
+        self.optimize_limit(query.get_order_by(), query.get_limit(), query.get_offset())
         self.optimize_projection(query.get_select())
 
     def optimize_selection(self, filter):
@@ -365,6 +372,21 @@ class AST(object):
         self.root = self.root.optimize_selection(filter)
         self.set_callback(old_cb)
 
+    def optimize_limit(self, order_by, limit, offset):
+        """
+        Apply ORDER BY, LIMIT and OFFSET clauses to an AST and push them
+        down to the From Nodes whose platform supports them. A TopK Node
+        is added wherever they cannot be pushed down.
+        Args:
+            order_by: A list of (field name, ORDER_ASC|ORDER_DESC) tuples.
+            limit: The maximum number of records to return (None if unbounded).
+            offset: The number of records to skip.
+        """
+        if not order_by and limit is None and not offset: return
+        old_cb = self.get_callback()
+        self.root = self.root.optimize_limit(order_by, limit, offset)
+        self.set_callback(old_cb)
+
     def optimize_projection(self, fields):
         """
         Apply a SELECT operation to an AST and spread this operation
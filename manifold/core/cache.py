@@ -1,8 +1,166 @@
+import time
+from collections                        import OrderedDict
+from twisted.internet.task              import LoopingCall
 from manifold.util.singleton            import Singleton
-from manifold.util.lattice              import Lattice
 from manifold.core.cache_entry          import Entry
 from manifold.core.query_plan           import QueryPlan
 from manifold.util.log                  import Log
+from manifold.util.options              import Options
+from manifold.util.predicate            import eq, included
+from manifold.util.reactor_thread       import ReactorThread
+
+# Number of seconds records remain in cache once received
+CACHE_LIFETIME = 1800
+# Memory (in bytes) that all the caches may hold
+CACHE_MEMORY   = 256 * 1024 * 1024
+# Once the memory budget is exceeded, evict entries until this ratio of the budget is reached
+CACHE_EVICTION_RATIO = 0.9
+# Number of seconds between two removals of the expired entries
+CACHE_COLLECT_PERIOD = 60
+
+class CachePartition(object):
+    """
+    The Queries stored in a Cache sharing the same (object, action,
+    timestamp). Rather than walking a Lattice, a CachePartition indexes its
+    Queries so that an exact match is found by hashing, and that the
+    candidates of a subsumption test are pruned using bitsets of their
+    field names and filter keys before Query.__le__ is invoked.
+    """
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+        # {exact key : [(query, entry)]}
+        self._exact   = dict()
+        # {id(entry) : (query, entry, field mask, filter key mask)}
+        self._entries = dict()
+        # {field name or filter key : bit}
+        self._bits    = dict()
+
+    @staticmethod
+    def get_exact_key(query):
+        """
+        Returns:
+            A hashable key made of the fields and filters of a Query, or
+            None if a predicate value is not hashable.
+        """
+        try:
+            filters = frozenset(query.get_where())
+            hash(filters)
+        except TypeError:
+            return None
+        return (filters, query.get_select())
+
+    def get_mask(self, names, create = False):
+        """
+        Args:
+            names: A set of field names or filter keys, or None (*).
+            create: Pass True to allocate a bit for unknown names.
+        Returns:
+            The corresponding bitset, None if names is None, or -1 if a name
+            is not known by this CachePartition.
+        """
+        if names is None:
+            return None
+        mask = 0
+        for name in names:
+            bit = self._bits.get(name)
+            if bit is None:
+                if not create:
+                    return -1
+                bit = self._bits[name] = len(self._bits)
+            mask |= 1 << bit
+        return mask
+
+    @staticmethod
+    def get_filter_keys(query):
+        return set([predicate.get_key() for predicate in query.get_where()])
+
+    def add(self, query, entry):
+        key = self.get_exact_key(query)
+        if key is not None:
+            for other, _ in self._exact.get(key, []):
+                if other == query:
+                    raise Exception, "Element already in cache"
+        if key is not None:
+            self._exact.setdefault(key, list()).append((query, entry))
+        field_mask = self.get_mask(query.get_select(), True)
+        key_mask   = self.get_mask(self.get_filter_keys(query), True)
+        self._entries[id(entry)] = (query, entry, field_mask, key_mask)
+
+    def remove(self, query, entry):
+        if self._entries.pop(id(entry), None) is None:
+            return
+        key = self.get_exact_key(query)
+        if key is not None:
+            query_entries = self._exact.get(key, [])
+            query_entries = [query_entry for query_entry in query_entries if query_entry[1] is not entry]
+            if query_entries:
+                self._exact[key] = query_entries
+            else:
+                del self._exact[key]
+
+    def get_data(self, query):
+        """
+        Returns:
+            The Entry stored for a Query, None if not found.
+        """
+        key = self.get_exact_key(query)
+        if key is None:
+            for other, entry in self.get_entries():
+                if other == query:
+                    return entry
+            return None
+        for other, entry in self._exact.get(key, []):
+            if other == query:
+                return entry
+        return None
+
+    def get_best(self, query):
+        """
+        Returns:
+            A (Query, Entry) tuple whose Query is the smallest one greater
+            or equal to the input Query, or None if not found.
+        """
+        key = self.get_exact_key(query)
+        if key is not None:
+            for other, entry in self._exact.get(key, []):
+                if other == query:
+                    return (other, entry)
+
+        field_mask = self.get_mask(query.get_select())
+        key_mask   = self.get_mask(self.get_filter_keys(query))
+        if field_mask == -1 or key_mask == -1:
+            # A field or a filter key has never been seen in this partition
+            return None
+
+        best, best_weight = None, None
+        for other, entry, other_field_mask, other_key_mask in self._entries.values():
+            if key_mask & ~other_key_mask:
+                continue
+            if field_mask is not None and other_field_mask is not None and field_mask & ~other_field_mask:
+                continue
+            if not query <= other:
+                continue
+            # The fewer fields and filters, the closer to the input Query
+            weight = bin(other_key_mask).count('1') + bin(other_field_mask or 0).count('1')
+            if best is None or weight < best_weight:
+                best, best_weight = (other, entry), weight
+        return best
+
+    def get_entries(self):
+        """
+        Returns:
+            A list of (Query, Entry) tuples stored in this CachePartition.
+        """
+        return [(query, entry) for query, entry, _, _ in self._entries.values()]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def dump(self):
+        return "\n".join(["%s" % query for query, _ in self.get_entries()])
 
 class Cache(object):
 
@@ -12,20 +170,190 @@ class Cache(object):
 
     # Cache = query -> entry
 
-    def __init__(self):
-        self._lattice = Lattice()
+    def __init__(self, manager = None):
+        """
+        Constructor.
+        Args:
+            manager: The CacheManager in charge of this Cache, or None.
+        """
+        self._manager = manager
+        # {(object, action, timestamp) : CachePartition}
+        self._partitions = dict()
+        # {id(entry) : (query, entry)}, allows to enumerate entries
+        self._entries = dict()
+        # {table name : {id(entry) : (query, entry)}}, entries related to each
+        # table (whatever the namespace, see get_table_name)
+        self._objects = dict()
+
+    @staticmethod
+    def get_partition_key(query):
+        return (query.get_from(), query.get_action(), query.get_timestamp())
+
+    def get_partition(self, query, create = False):
+        """
+        Args:
+            query: A Query instance.
+            create: Pass True to create the partition if not found.
+        Returns:
+            The CachePartition storing the Queries comparable to this one
+            (or None if not found).
+        """
+        key = self.get_partition_key(query)
+        partition = self._partitions.get(key)
+        if partition is None and create:
+            partition = self._partitions[key] = CachePartition()
+        return partition
 
     def get_entry(self, query):
-        return self._lattice.get_data(query)
+        partition = self.get_partition(query)
+        return partition.get_data(query) if partition else None
     
     def invalidate_entry(self, query):
-        return self._lattice.invalidate(query, recursive=True)
+        partition = self.get_partition(query)
+        if not partition:
+            return
+        # Remove this Query and the Queries it is comparable with
+        for other, entry in partition.get_entries():
+            if other <= query or query <= other:
+                self.remove_entry(other, entry)
+
+    @staticmethod
+    def get_table_name(object_name):
+        """
+        Args:
+            object_name: A table name, possibly prefixed by a namespace
+                (eg. "ple:slice").
+        Returns:
+            The table name without its namespace (eg. "slice").
+        """
+        return object_name.rsplit(":", 1)[-1]
+
+    def add_objects(self, query, objects):
+        """
+        Record the tables queried to fetch the records of an Entry, so
+        that the Entry is invalidated whenever one of them is modified.
+        Args:
+            query: The Query related to this Entry.
+            objects: A set of table names (typically those involved in the
+                From Nodes of the corresponding QueryPlan).
+        """
+        entry = self.get_entry(query)
+        if entry:
+            self._add_objects(query, entry, objects)
+
+    def _add_objects(self, query, entry, objects):
+        objects = set([self.get_table_name(object_name) for object_name in objects])
+        for table_name in objects - entry.get_objects():
+            entry.get_objects().add(table_name)
+            self._objects.setdefault(table_name, dict())[id(entry)] = (query, entry)
+
+    @staticmethod
+    def get_values(filter):
+        """
+        Returns:
+            A {key : set of values} dictionary storing, for each key
+            compared to values by a == or INCLUDED Predicate of a Filter,
+            the values this key may take.
+        """
+        values = dict()
+        for predicate in filter:
+            key, op, value = predicate.get_tuple()
+            if op == eq:
+                value = set([value])
+            elif op == included:
+                value = set(value)
+            else:
+                continue
+            values[key] = values[key] & value if key in values else value
+        return values
+
+    @staticmethod
+    def are_disjoint(filter1, filter2):
+        """
+        Returns:
+            True iif no record can satisfy both Filters (eg. "slice_hrn == 'a'"
+            and "slice_hrn == 'b'").
+        """
+        try:
+            values1 = Cache.get_values(filter1)
+            values2 = Cache.get_values(filter2)
+        except TypeError:
+            # Unhashable values
+            return False
+        for key, values in values1.items():
+            if key in values2 and not values & values2[key]:
+                return True
+        return False
+
+    @staticmethod
+    def may_alter(query, other):
+        """
+        Args:
+            query: A create, update or delete Query.
+            other: A get Query querying the same table.
+        Returns:
+            False iif the records modified by query are neither selected
+            by other before nor after the modification (eg. an update of
+            "slice_hrn == 'a'" and a get of "slice_hrn == 'b'", provided
+            that the update does not set slice_hrn).
+        """
+        if set(query.get_params().keys()) & other.get_where().get_field_names():
+            # The modified records may enter the Filter of other
+            return True
+        return not Cache.are_disjoint(query.get_where(), other.get_where())
+
+    def invalidate(self, query):
+        """
+        Remove the entries possibly altered by a Query modifying a table,
+        ie. those having queried this table (in any namespace), except the
+        ones querying it directly and which cannot select the modified
+        records (see may_alter).
+        Args:
+            query: A create, update or delete Query.
+        """
+        table_name = query.get_from()
+        for other, entry in self._objects.get(self.get_table_name(table_name), dict()).values():
+            if other.get_from() == table_name and not self.may_alter(query, other):
+                continue
+            self.remove_entry(other, entry)
 
     def new_entry(self, query):
         self.add_entry(query, Entry())
     
     def add_entry(self, query, entry):
-        self._lattice.add(query, entry)
+        self.get_partition(query, True).add(query, entry)
+        self._entries[id(entry)] = (query, entry)
+        self._add_objects(query, entry, [query.get_from()])
+        if self._manager:
+            self._manager.add_entry(self, query, entry)
+
+    def remove_entry(self, query, entry):
+        """
+        Remove an Entry from this Cache.
+        Args:
+            query: The Query related to this Entry.
+            entry: The Entry instance.
+        """
+        if self._entries.pop(id(entry), None) is None:
+            return
+        partition = self.get_partition(query)
+        partition.remove(query, entry)
+        if not len(partition):
+            del self._partitions[self.get_partition_key(query)]
+        for table_name in entry.get_objects():
+            entries = self._objects[table_name]
+            del entries[id(entry)]
+            if not entries:
+                del self._objects[table_name]
+        if self._manager:
+            self._manager.remove_entry(entry)
+
+    def get_entries(self):
+        """
+        Returns:
+            A list of (Query, Entry) tuples stored in this Cache.
+        """
+        return self._entries.values()
 
     def last_record(self, query):
         entry = self.get_entry(query)
@@ -67,24 +395,254 @@ class Cache(object):
         #import pdb
         #pdb.set_trace()
 
-        best_query_entry_tuple = self._lattice.get_best(query)
+        partition = self.get_partition(query)
+        best_query_entry_tuple = partition.get_best(query) if partition else None
         if not best_query_entry_tuple:
+            if self._manager: self._manager.miss()
             return None
 
         # We found a best entry. In all cases, we plug a query plan on top of the cache entry
         best_query, best_entry = best_query_entry_tuple
 
+        # Expired entries are removed, a new entry will be created
+        if self._manager and self._manager.is_expired(best_entry):
+            self.remove_entry(best_query, best_entry)
+            return self.get_best_query_plan(query, allow_processing)
+
         query_plan = QueryPlan()
         query_plan.ast.from_cache(query, best_entry)
         if best_query != query:
             if not allow_processing:
+                if self._manager: self._manager.miss()
                 return None
             # We need to add processing
             query_plan.ast.selection(query.get_where()).projection(query.get_select())
             # XXX Shall we create a new entry for this query ? and all
             # intermediate steps ? see operator graph
 
+        if self._manager: self._manager.hit()
         return query_plan
 
     def dump(self):
-        return self._lattice.dump()
+        return "\n".join([partition.dump() for partition in self._partitions.values()])
+
+class CacheManager(object):
+    """
+    A CacheManager maintains one Cache per user, and bounds the memory they
+    hold altogether. Entries expire CACHE_LIFETIME seconds after their last
+    update, and the least recently used entries (across every user) are
+    evicted once the memory budget is exceeded.
+    """
+
+    def __init__(self, lifetime = None, memory = None):
+        """
+        Constructor.
+        Args:
+            lifetime: The number of seconds an Entry remains valid.
+                None means this value is read from Options.
+            memory: The maximum number of bytes held by all the caches.
+                None means this value is read from Options.
+        """
+        if lifetime is None:
+            lifetime = int(Options().cache_lifetime or CACHE_LIFETIME)
+        if memory is None:
+            memory = int(Options().cache_memory or CACHE_MEMORY)
+        self._lifetime = lifetime
+        self._memory   = memory
+
+        # {user_id : Cache}, user_id is None for the global cache
+        self._caches = dict()
+
+        # {id(entry) : (cache, query, entry)} from the least to the most
+        # recently used entry (across every Cache)
+        self._lru = OrderedDict()
+
+        # True if the last eviction could not free enough memory because of
+        # queries in progress: do not retry before one of them completes
+        self._stalled = False
+
+        # Periodic removal of the expired entries (see start)
+        self._loop = None
+
+        # Counters
+        self._hits      = 0
+        self._misses    = 0
+        self._evictions = 0
+        self._bytes     = 0
+
+    @staticmethod
+    def init_options():
+        """
+        Prepare options supported by the CacheManager.
+        """
+        opt = Options()
+        opt.add_argument(
+            "--cache-lifetime", type = int, dest = "cache_lifetime",
+            help = "Number of seconds records remain in cache.",
+            default = CACHE_LIFETIME
+        )
+        opt.add_argument(
+            "--cache-memory", type = int, dest = "cache_memory",
+            help = "Maximum number of bytes held by the query caches.",
+            default = CACHE_MEMORY
+        )
+
+    def start(self):
+        """
+        Remove the expired entries every CACHE_COLLECT_PERIOD seconds.
+        """
+        if self._loop:
+            return
+        self._loop = LoopingCall(self.collect)
+        self._loop.clock = ReactorThread().reactor
+        ReactorThread().callInReactor(self._loop.start, CACHE_COLLECT_PERIOD, False)
+
+    def stop(self):
+        """
+        Stop the periodic removal of the expired entries.
+        """
+        if self._loop and self._loop.running:
+            ReactorThread().callInReactor(self._loop.stop)
+        self._loop = None
+
+    def get_cache(self, user_id = None):
+        """
+        Args:
+            user_id: The identifier of a user, or None for the global cache.
+        Returns:
+            The Cache related to this user (created if needed).
+        """
+        if user_id not in self._caches:
+            self._caches[user_id] = Cache(self)
+        return self._caches[user_id]
+
+    def invalidate(self, query):
+        """
+        Remove from every Cache the entries possibly altered by a Query.
+        Args:
+            query: A create, update or delete Query.
+        """
+        for cache in self._caches.values():
+            cache.invalidate(query)
+
+    def delete_cache(self, user_id = None):
+        """
+        Delete the Cache related to a user.
+        Args:
+            user_id: The identifier of a user, or None for the global cache.
+        """
+        cache = self._caches.pop(user_id, None)
+        if not cache:
+            return
+        for query, entry in cache.get_entries():
+            cache.remove_entry(query, entry)
+
+    def add_entry(self, cache, query, entry):
+        """
+        Account for a new Entry.
+        Args:
+            cache: The Cache storing this Entry.
+            query: The Query related to this Entry.
+            entry: An Entry instance.
+        """
+        self._lru[id(entry)] = (cache, query, entry)
+        entry.set_manager(self)
+
+    def remove_entry(self, entry):
+        """
+        Release the memory held by an Entry removed from its Cache.
+        Args:
+            entry: An Entry instance.
+        """
+        if self._lru.pop(id(entry), None) is None:
+            return
+        entry._manager = None
+        self.add_bytes(-entry.get_size())
+
+    def touch(self, entry):
+        """
+        Mark an Entry as the most recently used one. Called whenever its
+        records are read or completed.
+        Args:
+            entry: An Entry instance.
+        """
+        item = self._lru.pop(id(entry), None)
+        if item is None:
+            return
+        self._lru[id(entry)] = item
+        if not entry.has_query_in_progress():
+            # This Entry may now be evicted
+            self._stalled = False
+
+    def is_expired(self, entry, now = None):
+        """
+        Returns:
+            True iif the records stored in this Entry are outdated.
+        """
+        return entry.is_expired(self._lifetime, now)
+
+    def hit(self):
+        self._hits += 1
+
+    def miss(self):
+        self._misses += 1
+
+    def add_bytes(self, delta):
+        """
+        Account for the memory held by cache entries, and evict entries
+        if the memory budget is exceeded.
+        Args:
+            delta: The number of bytes allocated (or released if negative).
+        """
+        self._bytes += delta
+        if self._bytes > self._memory and not self._stalled:
+            self.evict(int(self._memory * CACHE_EVICTION_RATIO))
+
+    def evict(self, memory):
+        """
+        Remove the least recently used entries until the caches hold less
+        than a given amount of memory. Entries whose query is in progress
+        are never evicted.
+        Args:
+            memory: The number of bytes we are allowed to keep.
+        """
+        victims = list()
+        freed = 0
+        for cache, query, entry in self._lru.itervalues():
+            if self._bytes - freed <= memory:
+                break
+            if entry.has_query_in_progress():
+                continue
+            victims.append((cache, query, entry))
+            freed += entry.get_size()
+
+        for cache, query, entry in victims:
+            cache.remove_entry(query, entry)
+            self._evictions += 1
+
+        self._stalled = self._bytes > memory
+        Log.info("CacheManager: %(evictions)d evictions, %(bytes)d bytes held" % self.get_stats())
+
+    def collect(self):
+        """
+        Remove every expired entry.
+        """
+        now = time.time()
+        expired = [item for item in self._lru.itervalues() if self.is_expired(item[2], now)]
+        for cache, query, entry in expired:
+            cache.remove_entry(query, entry)
+            self._evictions += 1
+
+    def get_stats(self):
+        """
+        Returns:
+            A dictionary containing the cache counters.
+        """
+        return {
+            "hits"      : self._hits,
+            "misses"    : self._misses,
+            "evictions" : self._evictions,
+            "bytes"     : self._bytes,
+            "caches"    : len(self._caches),
+            "entries"   : len(self._lru)
+        }
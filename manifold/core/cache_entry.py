@@ -1,7 +1,31 @@
-import time
+import sys, time
 from manifold.core.record import LastRecord
 from manifold.util.log    import Log
 
+def get_record_size(record):
+    """
+    Estimate the memory held by a record. Nested values are not walked:
+    they are accounted for by their own (shallow) size only.
+    Args:
+        record: A Record or a dictionary.
+    Returns:
+        An approximate size in bytes.
+    """
+    size = sys.getsizeof(record)
+    for value in record.itervalues():
+        size += sys.getsizeof(value)
+    return size
+
+def get_size(records):
+    """
+    Estimate the memory held by a list of records.
+    Args:
+        records: A list of Records.
+    Returns:
+        An approximate size in bytes.
+    """
+    return sys.getsizeof(records) + sum(get_record_size(record) for record in records)
+
 class Entry(object):
     """
     Cache entry.
@@ -44,14 +68,73 @@ class Entry(object):
         self._pending_records = list() # Empty list means a query has been started
         #self._query_started = True
         self._operators = list() # A list of operators interested in our records
+        self._size      = get_size(self._records) # Approximate memory held by the records
+        self._pending_size = 0   # Approximate memory held by the pending records
+        self._manager   = None   # The CacheManager accounting the memory held by this Entry
+        self._objects   = set()  # The tables queried to compute our records
+
+    def get_objects(self):
+        """
+        Returns:
+            The set of table names queried to compute the records of this Entry.
+        """
+        return self._objects
+
+    def set_manager(self, manager):
+        """
+        Attach this Entry to the CacheManager accounting for its memory.
+        """
+        self._manager = manager
+        manager.add_bytes(self._size)
+
+    def get_size(self):
+        """
+        Returns:
+            The approximate memory (in bytes) held by the records of this Entry.
+        """
+        return self._size
+
+    def _resize(self, delta):
+        self._size += delta
+        if self._manager:
+            self._manager.add_bytes(delta)
+
+    def _touch(self):
+        if self._manager:
+            self._manager.touch(self)
+
+    def get_last_access(self):
+        """
+        Returns:
+            The timestamp of the last access to this Entry.
+        """
+        return self._accessed if self._accessed else self._created
+
+    def is_expired(self, lifetime, now = None):
+        """
+        Args:
+            lifetime: The number of seconds records remain valid once received.
+            now: The current timestamp (default: time.time()).
+        Returns:
+            True iif this Entry is complete and has been updated more than
+            lifetime seconds ago.
+        """
+        if self.has_query_in_progress():
+            return False
+        if now is None:
+            now = time.time()
+        return self._updated + lifetime < now
 
     # This is equivalent to the child_callback
     def set_records(self, records):
         if not isinstance(records, list):
             records = [records]
         self._pending_records = list()
+        self._pending_size = 0
         self._records = records
         self._updated = time.time()
+        self._resize(get_size(records) - self._size)
+        self._touch()
         for operator in self._operators:
             for record in records:
                 operator.child_callback(record)
@@ -68,16 +151,22 @@ class Entry(object):
         if record.is_last():
             # Move all pending records to records...
             self._records = self._pending_records
+            self._resize(sys.getsizeof(self._records) + self._pending_size - self._size)
+            self._pending_size = 0
 
             #self._pending_records = list()
             #self._query_started = False # False means no query started
 
             self._pending_records = None
+            self._touch()
             # ... and inform interested operators
         else:
             try:
                 # Add the records in the pending list...
                 self._pending_records.append(record)
+                size = get_record_size(record)
+                self._pending_size += size
+                self._resize(size)
                 # ... and inform interested operators
             except Exception, e:
                 # XXX TO BE FIXED
@@ -96,6 +185,7 @@ class Entry(object):
 
     def get_records(self):
         self._accessed = time.time()
+        self._touch()
         return self._records
 
     def add_operator(self, operator):
@@ -9,9 +9,10 @@
 #   Jordan Augé       <jordan.auge@lip6.fr>
 #   Marc-Olivier Buob <marc-olivier.buob@lip6.fr>
 
-import json
+import copy, json, time
 from twisted.internet           import defer
 
+from manifold.auth              import AuthCache
 from manifold.gateways          import Gateway
 from manifold.core.key          import Keys
 from manifold.core.query        import Query
@@ -24,6 +25,9 @@ from manifold.util.type         import accepts, returns
 from manifold.util.log          import Log
 from manifold.gateways          import register_gateways
 
+# Number of seconds a resolved user configuration (see get_user_config) is kept in memory
+USER_CONFIG_LIFETIME = 60
+
 class Interface(object):
     """
     A Manifold standard Interface.
@@ -46,6 +50,11 @@ class Interface(object):
         Log.info("Registering gateways")
         register_gateways()
 
+        # {(user_id, platform_id) : (expiration timestamp, user_config)}
+        self._user_configs = dict()
+        # Timestamp of the next removal of the expired user configurations
+        self._user_configs_purge = 0
+
         # self.platforms is list(dict) where each dict describes a platform.
         # See platform table in the Storage.
         self.platforms = Storage.execute(Query().get("platform").filter_by("disabled", "=", False)) #, format = "object")
@@ -93,6 +102,20 @@ class Interface(object):
 
         self.policy.load()
 
+    @property
+    def platforms(self):
+        """
+        Returns:
+            The list of dictionnaries describing each enabled platform.
+        """
+        return self._platforms
+
+    @platforms.setter
+    def platforms(self, platforms):
+        self._platforms = platforms
+        # {platform name : platform}
+        self._platforms_by_name = dict([(platform['platform'], platform) for platform in platforms]) if platforms else dict()
+
     @returns(Record)
     def get_platform(self, platform_name):
         """
@@ -103,10 +126,7 @@ class Interface(object):
         Returns:
             The corresponding platform if found, None otherwise.
         """
-        for platform in self.platforms:
-            if platform['platform'] == platform_name:
-                return platform
-        return None 
+        return self._platforms_by_name.get(platform_name)
 
     def execute_local_query(self, query, error_message=None):
         ret = self.forward(query)
@@ -139,46 +159,140 @@ class Interface(object):
             if not user:
                 raise Exception, "Cannot use auth_type user when no user is configured"
 
-            user_id = user['user_id'] if user else None
-            
-            # User account information
-            query_accounts = Query.get('local:account').filter_by('user_id', '==', user_id).filter_by('platform_id', '==', platform_id)
-            accounts = self.execute_local_query(query_accounts)
-
-            if accounts:
-                account = accounts[0]
-                user_config = account.get('config', None)
-                if user_config:
-                    user_config = json.loads(user_config)
-
-                # XXX This should disappear with the merge with router-v2
-                if account['auth_type'] == 'reference':
-                    ref_platform_name = user_config['reference_platform']
-
-                    query_ref_platform = Query.get('local:platform').filter_by('platform', '==', ref_platform_name)
-                    ref_platforms = self.execute_local_query(query_ref_platform)
-                    if not ref_platforms:
-                        raise Exception, 'Cannot find reference platform %s for platform %s' % (platform_name, ref_platform_name)
-                    ref_platform = ref_platforms[0]
-
-                    query_ref_account = Query.get('local:account').filter_by('user_id', '==', user_id).filter_by('platform_id', '==', ref_platform['platform_id'])
-                    ref_accounts = self.execute_local_query(query_ref_account)
-                    if not ref_accounts:
-                        raise Exception, 'Cannot find account information for reference platform %s' % ref_platform_name
-                    ref_account = ref_accounts[0]
-
-                    user_config = ref_account.get('config', None)
-                    if user_config:
-                        user_config = json.loads(user_config)
-
-            else:
-                user_config = {}
+            user_config = self.get_user_configs(user, [platform])[platform_id]
 
         else:
             raise ValueError("This 'auth_type' not supported: %s" % auth_type)
 
         return user_config
 
+    def get_user_configs(self, user, platforms):
+        """
+        Retrieve the account configurations of a user for several platforms
+        whose auth_type is 'user'. Configurations which are not in memory
+        are resolved altogether (see resolve_user_configs) and kept
+        USER_CONFIG_LIFETIME seconds. Expired configurations are removed
+        at most once per USER_CONFIG_LIFETIME (see clean_user_configs).
+        Args:
+            user: A User instance.
+            platforms: A list of dictionnaries describing platforms.
+        Returns:
+            A {platform_id : user_config} dictionnary. Each user_config
+            is a copy which can be freely modified by the caller.
+        """
+        user_id = user['user_id']
+        now = time.time()
+        if now >= self._user_configs_purge:
+            self.clean_user_configs(now)
+        user_configs = dict()
+        missing_platforms = list()
+
+        for platform in platforms:
+            platform_id = platform['platform_id']
+            expiration_user_config = self._user_configs.get((user_id, platform_id))
+            if expiration_user_config and expiration_user_config[0] > now:
+                user_configs[platform_id] = expiration_user_config[1]
+            else:
+                missing_platforms.append(platform)
+
+        if missing_platforms:
+            resolved_user_configs = self.resolve_user_configs(user_id, missing_platforms)
+            for platform in missing_platforms:
+                platform_id = platform['platform_id']
+                user_config = resolved_user_configs.get(platform_id, {})
+                self._user_configs[(user_id, platform_id)] = (now + USER_CONFIG_LIFETIME, user_config)
+                user_configs[platform_id] = user_config
+
+        return dict([(platform_id, copy.deepcopy(user_config)) for platform_id, user_config in user_configs.items()])
+
+    def resolve_user_configs(self, user_id, platforms):
+        """
+        Fetch from the Storage the account configurations of a user for
+        several platforms. This requires at most three local queries
+        whatever the number of platforms: the accounts, then the reference
+        platforms and the reference accounts (if any).
+        Args:
+            user_id: The identifier of the user.
+            platforms: A list of dictionnaries describing platforms.
+        Raises:
+            Exception: if a reference platform or account cannot be found.
+        Returns:
+            A {platform_id : user_config} dictionnary.
+        """
+        platform_ids = [platform['platform_id'] for platform in platforms]
+
+        # User account information
+        query_accounts = Query.get('local:account').filter_by('user_id', '==', user_id).filter_by('platform_id', 'INCLUDED', platform_ids)
+        accounts = dict()
+        for account in self.execute_local_query(query_accounts):
+            accounts.setdefault(account['platform_id'], account)
+
+        user_configs = dict()
+        ref_platform_names = dict() # {platform_id : reference platform name}
+        for platform_id, account in accounts.items():
+            user_config = account.get('config', None)
+            if user_config:
+                user_config = json.loads(user_config)
+            user_configs[platform_id] = user_config
+
+            # XXX This should disappear with the merge with router-v2
+            if account['auth_type'] == 'reference':
+                ref_platform_names[platform_id] = user_config['reference_platform']
+
+        if not ref_platform_names:
+            return user_configs
+
+        # Reference platforms
+        query_ref_platforms = Query.get('local:platform').filter_by('platform', 'INCLUDED', list(set(ref_platform_names.values())))
+        ref_platform_ids = dict([(ref_platform['platform'], ref_platform['platform_id']) for ref_platform in self.execute_local_query(query_ref_platforms)])
+
+        # Reference accounts
+        query_ref_accounts = Query.get('local:account').filter_by('user_id', '==', user_id).filter_by('platform_id', 'INCLUDED', list(set(ref_platform_ids.values())))
+        ref_accounts = dict()
+        for ref_account in self.execute_local_query(query_ref_accounts):
+            ref_accounts.setdefault(ref_account['platform_id'], ref_account)
+
+        platform_names = dict([(platform['platform_id'], platform['platform']) for platform in platforms])
+        for platform_id, ref_platform_name in ref_platform_names.items():
+            if not ref_platform_name in ref_platform_ids:
+                raise Exception, 'Cannot find reference platform %s for platform %s' % (platform_names[platform_id], ref_platform_name)
+            ref_account = ref_accounts.get(ref_platform_ids[ref_platform_name])
+            if not ref_account:
+                raise Exception, 'Cannot find account information for reference platform %s' % ref_platform_name
+
+            user_config = ref_account.get('config', None)
+            if user_config:
+                user_config = json.loads(user_config)
+            user_configs[platform_id] = user_config
+
+        return user_configs
+
+    def clean_user_configs(self, now):
+        """
+        Remove the expired user configurations.
+        Args:
+            now: The current timestamp.
+        """
+        for key, (expires, _) in self._user_configs.items():
+            if expires <= now:
+                del self._user_configs[key]
+        self._user_configs_purge = now + USER_CONFIG_LIFETIME
+
+    def invalidate_user_configs(self, user_id = None, platform_id = None):
+        """
+        Forget the user configurations kept in memory (this is required
+        once an account or a platform has been modified).
+        Args:
+            user_id: The identifier of a user, or None.
+            platform_id: The identifier of a platform, or None.
+                If both are set, only the configuration of this account is
+                forgotten, otherwise every configuration is.
+        """
+        if user_id is not None and platform_id is not None:
+            self._user_configs.pop((user_id, platform_id), None)
+        else:
+            self._user_configs.clear()
+
     #@returns(Gateway)
     def make_gateway(self, platform_name, user):
         """
@@ -216,6 +330,17 @@ class Interface(object):
         # XXX Platforms only serve for metadata
         # in fact we should initialize filters from the instance, then rely on
         # Storage including those filters...
+
+        # Resolve in a row the user configurations needed by the Gateways
+        if user:
+            platforms = dict()
+            for from_node in query_plan.froms:
+                platform = self.get_platform(from_node.get_platform())
+                if platform and platform.get('auth_type', None) == 'user':
+                    platforms[platform['platform_id']] = platform
+            if platforms:
+                self.get_user_configs(user, platforms.values())
+
         for from_node in query_plan.froms:
             platform_name = from_node.get_platform()
             gateway = self.make_gateway(platform_name, user)
@@ -326,6 +451,12 @@ class Interface(object):
                 q = query.copy()
                 q.object = table_name
                 records = Storage.execute(q, user = user)
+                # User configurations depend on accounts and platforms
+                if query.get_action() != 'get' and table_name in ['account', 'platform']:
+                    self.invalidate_user_configs()
+                # Cached authentications depend on users and sessions
+                if query.get_action() in ['update', 'delete'] and table_name in ['user', 'session']:
+                    AuthCache().invalidate(table_name, query.get_where())
                 return self.send(query, records, annotations, is_deferred)
 
         elif namespace:
@@ -30,6 +30,9 @@ ACTION_UPDATE  = 'update'
 ACTION_DELETE  = 'delete'
 ACTION_EXECUTE = 'execute'
 
+ORDER_ASC      = 'asc'
+ORDER_DESC     = 'desc'
+
 def uniqid (): 
     return uuid.uuid4().hex
 
@@ -126,6 +129,12 @@ class Query(object):
             else:
                 self.timestamp = "now" 
 
+            # ORDER BY, LIMIT, OFFSET
+            for key in ["order_by", "limit", "offset"]:
+                if key in kwargs:
+                    setattr(self, key, kwargs[key])
+                    del kwargs[key]
+
             if kwargs:
                 raise ParameterError("Invalid parameter(s) : %r" % kwargs.keys())
         #else:
@@ -151,6 +160,11 @@ class Query(object):
         if isinstance(self.fields, list):
             self.fields = set(self.fields)
 
+        self.order_by = Query.make_order_by(self.order_by)
+        if self.limit is not None:
+            self.limit = int(self.limit)
+        self.offset = int(self.offset or 0)
+
         for field in self.fields:
             if not isinstance(field, StringTypes):
                 raise TypeError("Invalid field name %s (string expected, got %s)" % (field, type(field)))
@@ -170,6 +184,33 @@ class Query(object):
         self.params  = {}
         self.fields  = set()
         self.timestamp  = 'now' # ignored for now
+        self.order_by = list()
+        self.limit    = None
+        self.offset   = 0
+
+    @staticmethod
+    def make_order_by(order_by):
+        """
+        Normalize an ORDER BY clause.
+        Args:
+            order_by: None, or a list whose elements are either a field name
+                (sorted in ascending order) or a (field name, ORDER_ASC|ORDER_DESC) pair.
+        Raises:
+            ValueError: if order_by is not valid.
+        Returns:
+            The corresponding list of (field name, ORDER_ASC|ORDER_DESC) tuples.
+        """
+        ret = list()
+        for elt in order_by or list():
+            if isinstance(elt, StringTypes):
+                field, direction = elt, ORDER_ASC
+            else:
+                field, direction = elt
+                direction = direction.lower()
+            if direction not in [ORDER_ASC, ORDER_DESC]:
+                raise ValueError("Invalid ORDER BY direction %r for field %s" % (direction, field))
+            ret.append((field, direction))
+        return ret
 
     def to_sql(self, platform='', multiline=False):
         get_params_str = lambda : ', '.join(['%s = %r' % (k, v) for k, v in self.get_params().items()])
@@ -180,11 +221,15 @@ class Query(object):
         where  = 'WHERE %s'  % self.get_where()     if self.get_where()     else ''
         at     = 'AT %s'     % self.get_timestamp() if self.get_timestamp() else ''
         params = 'SET %s'    % get_params_str()     if self.get_params()    else ''
+        order_by = 'ORDER BY %s' % ', '.join(['%s %s' % (f, d.upper()) for f, d in self.get_order_by()]) if self.get_order_by() else ''
+        limit  = 'LIMIT %d'  % self.get_limit()     if self.get_limit() is not None else ''
+        offset = 'OFFSET %d' % self.get_offset()    if self.get_offset()    else ''
 
         sep = ' ' if not multiline else '\n  '
+        tail = ''.join(['%s%s' % (clause, sep) for clause in [order_by, limit, offset] if clause])
         if platform: platform = "%s:" % platform
         strmap = {
-            'get'   : '%(select)s%(sep)s%(at)s%(sep)sFROM %(platform)s%(table)s%(sep)s%(where)s%(sep)s',                                           
+            'get'   : '%(select)s%(sep)s%(at)s%(sep)sFROM %(platform)s%(table)s%(sep)s%(where)s%(sep)s%(tail)s',                                           
             'update': 'UPDATE %(platform)s%(table)s%(sep)s%(params)s%(sep)s%(where)s%(sep)s%(select)s',       
             'create': 'INSERT INTO %(platform)s%(table)s%(sep)s%(params)s',
             'delete': 'DELETE FROM %(platform)s%(table)s%(sep)s%(where)s'
@@ -201,7 +246,7 @@ class Query(object):
         return self.to_sql()
 
     def __key(self):
-        return (self.action, self.object, self.filters, frozendict(self.params), frozenset(self.fields))
+        return (self.action, self.object, self.filters, frozendict(self.params), frozenset(self.fields), tuple(self.order_by), self.limit, self.offset)
 
     def __hash__(self):
         return hash(self.__key())
@@ -217,7 +262,10 @@ class Query(object):
             'timestamp': self.timestamp,
             'filters': self.filters.to_list(),
             'params': self.params,
-            'fields': list(self.fields)
+            'fields': list(self.fields),
+            'order_by': [list(elt) for elt in self.order_by],
+            'limit': self.limit,
+            'offset': self.offset
         }
 
     def to_json (self, analyzed_query=None):
@@ -228,6 +276,9 @@ class Query(object):
         f=json.dumps (self.filters.to_list())
         p=json.dumps (self.params)
         c=json.dumps (list(self.fields))
+        ob=json.dumps ([list(elt) for elt in self.order_by])
+        l=json.dumps (self.limit)
+        of=json.dumps (self.offset)
         # xxx unique can be removed, but for now we pad the js structure
         unique=0
 
@@ -237,7 +288,7 @@ class Query(object):
             aq = analyzed_query.to_json()
         sq="{}"
         
-        result= """ new ManifoldQuery('%(a)s', '%(o)s', '%(t)s', %(f)s, %(p)s, %(c)s, %(unique)s, '%(query_uuid)s', %(aq)s, %(sq)s)"""%locals()
+        result= """ new ManifoldQuery('%(a)s', '%(o)s', '%(t)s', %(f)s, %(p)s, %(c)s, %(unique)s, '%(query_uuid)s', %(aq)s, %(sq)s, %(ob)s, %(l)s, %(of)s)"""%locals()
         if debug: print('ManifoldQuery.to_json:', result)
         return result
     
@@ -288,6 +339,38 @@ class Query(object):
     def get_timestamp(self):
         return self.timestamp
 
+    @returns(list)
+    def get_order_by(self):
+        """
+        Returns:
+            The list of (field name, ORDER_ASC|ORDER_DESC) tuples of the
+            ORDER BY clause (empty if the records are not sorted).
+        """
+        return self.order_by
+
+    def get_limit(self):
+        """
+        Returns:
+            The maximum number of records to return, None if unlimited.
+        """
+        return self.limit
+
+    def get_offset(self):
+        """
+        Returns:
+            The number of records to skip (0 by default).
+        """
+        return self.offset
+
+    @returns(bool)
+    def has_limit(self):
+        """
+        Returns:
+            True iif this Query carries a LIMIT or an OFFSET clause, i.e.
+            if its records depend on the records that are skipped.
+        """
+        return self.limit is not None or self.offset > 0
+
 #DEPRECATED#
 #DEPRECATED#    def make_filters(self, filters):
 #DEPRECATED#        return Filter(filters)
@@ -443,6 +526,42 @@ class Query(object):
         self.params.update(params)
         return self
 
+    def sort(self, *order_by):
+        """
+        Set the ORDER BY clause carried by the query
+        Args:
+            order_by: field names (ascending order) or (field name,
+                ORDER_ASC|ORDER_DESC) tuples. Pass None to reset this clause.
+        Returns:
+            The self Query instance
+        """
+        if len(order_by) == 1 and (order_by[0] is None or isinstance(order_by[0], list)):
+            order_by = order_by[0]
+        self.order_by = Query.make_order_by(order_by)
+        return self
+
+    def take(self, limit):
+        """
+        Set the LIMIT clause carried by the query
+        Args:
+            limit: The maximum number of records to return, None if unlimited.
+        Returns:
+            The self Query instance
+        """
+        self.limit = int(limit) if limit is not None else None
+        return self
+
+    def skip(self, offset):
+        """
+        Set the OFFSET clause carried by the query
+        Args:
+            offset: The number of records to skip.
+        Returns:
+            The self Query instance
+        """
+        self.offset = int(offset or 0)
+        return self
+
     def __or__(self, query):
         print("Query:__or__")
         assert self.action == query.action
@@ -481,10 +600,17 @@ class Query(object):
                 self.timestamp == other.timestamp and \
                 self.filters == other.filters and \
                 self.params == other.params and \
-                self.fields == other.fields
+                self.fields == other.fields and \
+                self.order_by == other.order_by and \
+                self.limit == other.limit and \
+                self.offset == other.offset
 
     def __le__(self, other):
+        # The records of a limited Query cannot be deduced from another Query
+        if self.has_limit() or other.has_limit():
+            return self == other
         return other.action in self.action and \
+                self.order_by == other.order_by and \
                 self.object == other.object and \
                 self.timestamp == other.timestamp and \
                 self.filters <= other.filters and \
@@ -621,6 +747,9 @@ class AnalyzedQuery(Query):
         self.filter_by(query.filters)
         self.set(query.params)
         self.select(query.fields)
+        self.order_by = list(query.order_by)
+        self.limit    = query.limit
+        self.offset   = query.offset
 
     def to_json (self):
         query_uuid=self.query_uuid
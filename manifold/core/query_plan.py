@@ -28,6 +28,7 @@ from manifold.core.filter           import Filter
 from manifold.core.query            import ACTION_CREATE, ACTION_DELETE, ACTION_UPDATE
 from manifold.core.result_value     import ResultValue
 from manifold.core.table            import Table 
+from manifold.operators             import Node
 from manifold.operators.From        import From
 from manifold.util.callback         import Callback
 from manifold.util.log              import Log
@@ -45,6 +46,7 @@ class QueryPlan(object):
         # TODO metadata, user should be a property of the query plan
         self.ast   = AST()
         self.froms = list() 
+        self.tracer = None
 
         self.foreign_key_fields = dict()
 
@@ -56,6 +58,33 @@ class QueryPlan(object):
         if isinstance(from_node, From):
             self.froms.append(from_node)
 
+    def set_tracer(self, tracer):
+        """
+        Trace the records sent by the Nodes of this QueryPlan and by its
+        Gateways. This must be done once the Gateways are instanciated.
+        Nodes created afterwards (except copies of traced Nodes) are not
+        traced.
+        Args:
+            tracer: A Tracer instance (see manifold.util.trace).
+        """
+        self.tracer = tracer
+        seen = set()
+        stack = [self.ast.get_root()]
+        while stack:
+            node = stack.pop()
+            if not isinstance(node, Node) or id(node) in seen:
+                continue
+            seen.add(id(node))
+            tracer.install(node)
+            # Unary (child), LeftJoin (left, right), SubQuery (parent, children), Union (children)
+            for attribute in ["child", "left", "right", "parent"]:
+                stack.append(getattr(node, attribute, None))
+            stack.extend(getattr(node, "children", None) or [])
+
+        for from_node in self.froms:
+            if from_node.gateway:
+                tracer.install(from_node.gateway)
+
     def get_result_value_array(self):
         # Iterate over gateways to get their result values
         # XXX We might need tasks
@@ -169,6 +198,7 @@ class QueryPlan(object):
         missing_fields |= query.get_select()
         missing_fields |= query.get_where().get_field_names()
         missing_fields |= set(query.get_params().keys())
+        missing_fields |= set([field for field, _ in query.get_order_by()])
 
         while missing_fields:
             task = stack.pop()
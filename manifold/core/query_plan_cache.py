@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# A QueryPlanCache stores QueryPlan templates keyed on the shape of a
+# Query (queried object, fields, filter keys and operators, ...). A
+# Query matching a known shape reuses a clone of the corresponding
+# QueryPlan in which the new predicate values are bound, so that the
+# DBGraph exploration and the AST optimization are skipped.
+
+import copy, random
+from collections                    import OrderedDict
+from types                          import StringTypes
+
+from manifold.core.filter           import Filter
+from manifold.core.query            import ACTION_GET
+from manifold.operators             import Node
+from manifold.util.predicate        import Predicate
+from manifold.util.log              import Log
+
+# Maximum number of QueryPlan templates kept in memory
+MAX_TEMPLATES = 1000
+
+# Attribute storing, in the Predicates of a QueryPlan, the position of the
+# Predicate of the Query they derive from (see QueryPlanCache.mark)
+POSITION = "_query_plan_cache_position"
+
+class QueryPlanCache(object):
+    """
+    LRU cache of QueryPlan templates.
+    """
+
+    def __init__(self, max_templates = MAX_TEMPLATES):
+        """
+        Constructor.
+        Args:
+            max_templates: The maximum number of templates kept in the cache.
+        """
+        self._max_templates = max_templates
+        # {key : QueryPlan}
+        self._templates = OrderedDict()
+        # Describes what the templates depend on (see validate)
+        self._stamp = None
+
+    def validate(self, stamp):
+        """
+        Drop every template if the inputs of the QueryPlans have changed.
+        Args:
+            stamp: A value describing the inputs of the QueryPlans (3nf
+                graph, platforms and their configuration...). It is
+                compared (==) with the stamp passed by the previous call.
+        """
+        if stamp != self._stamp:
+            if self._templates:
+                Log.info("QueryPlanCache: metadata changed, dropping %d templates" % len(self._templates))
+            self._templates.clear()
+            self._stamp = stamp
+
+    @staticmethod
+    def get_key(query, allowed_platforms, allowed_capabilities):
+        """
+        Compute the shape of a Query.
+        Args:
+            query: The Query issued by the user.
+            allowed_platforms: A list of platform names.
+            allowed_capabilities: A Capabilities instance or None.
+        Returns:
+            A hashable key, or None if the QueryPlan related to this Query
+            depends on the values it carries and thus cannot be shared.
+        """
+        # Create, update and delete QueryPlans embed the query params.
+        if query.get_action() != ACTION_GET:
+            return None
+
+        filter_shape = set()
+        for predicate in query.get_where():
+            key = predicate.get_key()
+            if not isinstance(key, StringTypes) or '.' in key:
+                return None
+            # Empty key values lead to a value-dependent QueryPlan (see From.optimize_selection)
+            if predicate.has_empty_value():
+                return None
+            shape = (key, predicate.get_op())
+            if shape in filter_shape:
+                return None
+            filter_shape.add(shape)
+
+        return (
+            query.get_from(),
+            query.get_select(),
+            frozenset(filter_shape),
+            query.get_action(),
+            query.get_timestamp(),
+            tuple(query.get_order_by()),
+            query.get_limit(),
+            query.get_offset(),
+            frozenset(allowed_platforms),
+            str(allowed_capabilities)
+        )
+
+    @staticmethod
+    def get_predicates(query):
+        """
+        Returns:
+            The Predicates involved in the WHERE clause of a Query, sorted
+            by (field name, operator). Queries having the same shape thus
+            have their Predicates at the same positions.
+        """
+        return sorted(query.get_where(), key = lambda p: (p.get_key(), p.get_str_op()))
+
+    @staticmethod
+    def mark(query):
+        """
+        Record in each Predicate of a Query its position (see get_predicates).
+        It must be called before the QueryPlan of this Query is built, so that
+        the Predicates (and their copies) made from the Query can be found back
+        in the QueryPlan.
+        Args:
+            query: The Query issued by the user.
+        """
+        for position, predicate in enumerate(QueryPlanCache.get_predicates(query)):
+            setattr(predicate, POSITION, position)
+
+    def get(self, query, allowed_platforms, allowed_capabilities, user = None):
+        """
+        Retrieve a QueryPlan for a given Query.
+        Args:
+            query: The Query issued by the user.
+            allowed_platforms: A list of platform names.
+            allowed_capabilities: A Capabilities instance or None.
+            user: A User instance or None.
+        Returns:
+            A QueryPlan instance ready to be instanciated, None if the
+            corresponding shape is not in cache.
+        """
+        key = self.get_key(query, allowed_platforms, allowed_capabilities)
+        if key is None or key not in self._templates:
+            return None
+
+        template = self._templates[key] = self._templates.pop(key)
+
+        memo = dict()
+        query_plan = copy.deepcopy(template, memo)
+        query_plan.ast.user = user
+        objects = memo.values()
+        self.bind(objects, [p.get_value() for p in self.get_predicates(query)])
+        # Each Node of the clone gets its own identifier
+        for obj in objects:
+            if isinstance(obj, Node):
+                obj.identifier = random.randint(0, 9999)
+        return query_plan
+
+    def add(self, query, allowed_platforms, allowed_capabilities, query_plan):
+        """
+        Store a freshly built QueryPlan as a template for the shape of a Query.
+        It must be called before the QueryPlan is instanciated and executed,
+        and the Query must have been marked before building the QueryPlan.
+        Args:
+            query: The Query issued by the user.
+            allowed_platforms: A list of platform names.
+            allowed_capabilities: A Capabilities instance or None.
+            query_plan: The QueryPlan built for this Query.
+        """
+        key = self.get_key(query, allowed_platforms, allowed_capabilities)
+        if key is None:
+            return
+
+        memo = dict()
+        template = copy.deepcopy(query_plan, memo)
+        template.ast.user = None
+
+        # Ensure each predicate of the Query can be found back in the
+        # template, otherwise we could not bind new values.
+        bound = set()
+        for predicate in memo.values():
+            if isinstance(predicate, Predicate):
+                position = getattr(predicate, POSITION, None)
+                if position is not None:
+                    bound.add(position)
+        if bound != set(range(len(query.get_where()))):
+            Log.debug("QueryPlanCache: cannot make a template for %s" % query)
+            return
+
+        self._templates[key] = template
+        while len(self._templates) > self._max_templates:
+            self._templates.popitem(last = False)
+
+    @staticmethod
+    def bind(objects, values):
+        """
+        Replace in a cloned QueryPlan the values of the Predicates inherited
+        from the template Query by the values of the current Query. Other
+        Predicates (e.g. introduced by the QueryPlan) are left unchanged,
+        even if they carry the same value.
+        Args:
+            objects: The objects making the cloned QueryPlan.
+            values: The values of the Predicates of the Query (see get_predicates).
+        """
+        filters = list()
+        for obj in objects:
+            if isinstance(obj, Predicate):
+                position = getattr(obj, POSITION, None)
+                if position is not None:
+                    obj.set_value(values[position])
+            elif isinstance(obj, Filter):
+                filters.append(obj)
+
+        # Predicates are hashed according to their value
+        for filter in filters:
+            predicates = list(filter)
+            filter.clear()
+            filter.update(predicates)
+
+    def invalidate(self):
+        """
+        Drop every template (e.g. when the 3nf graph or the set of
+        enabled platforms changes).
+        """
+        self._templates.clear()
+
+    def __len__(self):
+        return len(self._templates)
@@ -14,55 +14,267 @@
 #   Jordan Augé       <jordan.auge@lip6.fr> 
 #   Marc-Olivier Buob <marc-olivier.buob@lip6.fr>
 
-# TODO:
-# Currently, records are dictionary, but we will need a special class for typed
-# operations, and faster processing. Hence, consider the current code as a
-# transition towards this new class.
+# Records behave like dictionaries, but store their field names in a
+# RecordSchema shared by similar Records, and their values in a list.
 
-import collections
+from itertools                     import izip
 from types                         import StringTypes
 from manifold.util.log             import Log
 from manifold.util.type            import returns, accepts
 
 FIELD_SEPARATOR = '.'
 
-class Record(collections.MutableMapping):
+# Maximum number of RecordSchema instances shared through RecordSchema.get
+MAX_SCHEMAS = 10000
+
+# Maximum number of extensions remembered by a RecordSchema (see extend)
+MAX_EXTENSIONS = 64
+
+class RecordSchema(object):
+    """
+    An ordered tuple of field names shared by the Records carrying the
+    same fields (typically the Records produced for a given Query).
+    """
+    __slots__ = ('fields', 'index', '_extensions')
+
+    _schemas = dict()
+
+    def __init__(self, fields):
+        """
+        Constructor. Use RecordSchema.get to share RecordSchema instances.
+        Args:
+            fields: A tuple of field names.
+        """
+        self.fields      = fields
+        self.index       = dict((field, i) for i, field in enumerate(fields))
+        self._extensions = dict()
+
+    @classmethod
+    def get(cls, fields):
+        """
+        Args:
+            fields: An iterable of field names.
+        Returns:
+            The RecordSchema related to these fields (in this order).
+        """
+        fields = tuple(fields)
+        schema = cls._schemas.get(fields)
+        if schema is None:
+            schema = RecordSchema(fields)
+            if len(cls._schemas) < MAX_SCHEMAS:
+                cls._schemas[fields] = schema
+        return schema
+
+    def extend(self, field):
+        """
+        Returns:
+            The RecordSchema made of this one plus an additional field.
+        """
+        schema = self._extensions.get(field)
+        if schema is None:
+            schema = RecordSchema.get(self.fields + (field,))
+            if len(self._extensions) < MAX_EXTENSIONS:
+                self._extensions[field] = schema
+        return schema
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __deepcopy__(self, memo):
+        # RecordSchema instances are immutable and shared
+        return self
+
+    def __repr__(self):
+        return "<RecordSchema %r>" % (self.fields,)
+
+class Record(object):
+    """
+    A Record maps field names to values. The field names are stored in a
+    RecordSchema shared by similar Records, and the values in a list
+    ordered according to this RecordSchema.
+    """
+    __slots__ = ('_schema', '_values', '_annotations')
+
+    # Records are mutable
+    __hash__ = None
+
     def __init__(self, *args, **kwargs):
-        self.store = dict()
-        self.update(dict(*args, **kwargs))  # use the free update to set keys
-        self._annotations = dict()
+        if len(args) == 1 and not kwargs and isinstance(args[0], Record):
+            record = args[0]
+            self._schema = record._schema
+            self._values = list(record._values)
+        else:
+            dic = dict(*args, **kwargs)
+            self._schema = RecordSchema.get(dic.iterkeys())
+            self._values = dic.values()
+        self._annotations = None
+
+    @classmethod
+    def from_values(cls, schema, values):
+        """
+        Build a Record without checking its content (fast path).
+        Args:
+            schema: A RecordSchema instance.
+            values: A list of values ordered according to schema.
+        Returns:
+            The corresponding Record.
+        """
+        record = cls.__new__(cls)
+        record._schema = schema
+        record._values = values
+        record._annotations = None
+        return record
+
+    @classmethod
+    def from_dict(cls, dic, schema = None):
+        """
+        Build a Record from a dictionary.
+        Args:
+            dic: A dictionary.
+            schema: A RecordSchema likely to match dic (for instance the
+                one of the previous Record of a same batch), or None.
+        Returns:
+            The corresponding Record.
+        """
+        fields = tuple(dic.iterkeys())
+        if schema is None or schema.fields != fields:
+            schema = RecordSchema.get(fields)
+        return cls.from_values(schema, dic.values())
+
+    def get_schema(self):
+        return self._schema
+
+    # Records have no __dict__, pickle their fields, values and annotations
+    def __getstate__(self):
+        return (self._schema.fields, self._values, self._annotations)
+
+    def __setstate__(self, state):
+        fields, self._values, self._annotations = state
+        self._schema = RecordSchema.get(fields)
 
     def set_annotation(self, key, value):
-        self._annotations[key] = value
+        self.get_annotations()[key] = value
 
     def set_annotations(self, annotations):
         self._annotations = annotations
 
     def get_annotation(self, key):
-        return self._annotations.get(key)
+        return self._annotations.get(key) if self._annotations else None
 
     def get_annotations(self):
+        if self._annotations is None:
+            self._annotations = dict()
         return self._annotations
 
+    #---------------------------------------------------------------------------
+    # Mapping API
+    #---------------------------------------------------------------------------
+
     def __iter__(self):
-        return iter(self.store)
+        return iter(self._schema.fields)
 
     def __len__(self):
-        return len(self.store)
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._schema.index
 
     def __getitem__(self, key):
-        return self.store[key]
+        return self._values[self._schema.index[key]]
 
     def __setitem__(self, key, value):
-        self.store[key] = value
+        i = self._schema.index.get(key)
+        if i is None:
+            self._schema = self._schema.extend(key)
+            self._values.append(value)
+        else:
+            self._values[i] = value
 
     def __delitem__(self, key):
-        del self.store[key]
+        i = self._schema.index[key]
+        fields = self._schema.fields
+        self._schema = RecordSchema.get(fields[:i] + fields[i + 1:])
+        self._values = self._values[:i] + self._values[i + 1:]
+
+    def get(self, key, default = None):
+        i = self._schema.index.get(key)
+        return default if i is None else self._values[i]
+
+    def keys(self):
+        return list(self._schema.fields)
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return zip(self._schema.fields, self._values)
+
+    def iterkeys(self):
+        return iter(self._schema.fields)
+
+    def itervalues(self):
+        return iter(self._values)
+
+    def iteritems(self):
+        return izip(self._schema.fields, self._values)
+
+    def has_key(self, key):
+        return key in self._schema.index
+
+    _MISSING = object()
+
+    def pop(self, key, default = _MISSING):
+        if key not in self._schema.index:
+            if default is Record._MISSING:
+                raise KeyError(key)
+            return default
+        value = self[key]
+        del self[key]
+        return value
+
+    def setdefault(self, key, default = None):
+        if key not in self._schema.index:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        if len(args) == 1 and isinstance(args[0], Record):
+            items = args[0].iteritems()
+        else:
+            items = dict(*args).iteritems()
+        for key, value in items:
+            self[key] = value
+        for key, value in kwargs.iteritems():
+            self[key] = value
+
+    def clear(self):
+        self._schema = RecordSchema.get(())
+        self._values = list()
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            if self._schema is other._schema:
+                return self._values == other._values
+            return self.get_dict() == other.get_dict()
+        if isinstance(other, dict):
+            return self.get_dict() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def get_dict(self):
+        """
+        Returns:
+            A (flat) dictionary storing the content of this Record.
+        """
+        return dict(izip(self._schema.fields, self._values))
 
     def __repr__(self):
-        return self.store.__repr__()
+        return self.get_dict().__repr__()
     def __str__(self):
-        return self.store.__str__()
+        return self.get_dict().__str__()
 
 #old#     @classmethod
 #old#     def get_value(self, record, key):
@@ -192,7 +404,50 @@ class Record(collections.MutableMapping):
     def is_last(self):
         return False
 
+class SharedRecord(Record):
+    """
+    A view on a Record shared by several consumers (typically a Record
+    stored in cache). The values of the underlying Record are not copied
+    until this view is modified (copy on write), while the annotations
+    of this view are its own.
+    Note that nested values (lists, Records...) are shared, so they
+    must be replaced and not modified in place.
+    """
+    __slots__ = ('_shared',)
+
+    def __init__(self, record, annotations = None):
+        """
+        Constructor.
+        Args:
+            record: The shared Record instance (left unmodified).
+            annotations: A dictionary or None.
+        """
+        self._schema = record._schema
+        self._values = record._values
+        self._shared = True
+        self._annotations = dict(annotations) if annotations else None
+
+    def __setstate__(self, state):
+        # An unpickled view owns its values
+        Record.__setstate__(self, state)
+        self._shared = False
+
+    def _unshare(self):
+        if self._shared:
+            self._values = list(self._values)
+            self._shared = False
+
+    def __setitem__(self, key, value):
+        self._unshare()
+        Record.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._unshare()
+        Record.__delitem__(self, key)
+
 class LastRecord(Record):
+    __slots__ = ()
+
     def is_last(self):
         return True
 
@@ -202,7 +457,17 @@ class Records(list):
     """
 
     def __init__(self, itr): 
-        list.__init__(self, [Record(x) for x in itr])
+        records = list()
+        schema = None
+        for x in itr:
+            if isinstance(x, dict):
+                # Records of a same batch generally share their fields
+                record = Record.from_dict(x, schema)
+            else:
+                record = Record(x)
+            schema = record.get_schema()
+            records.append(record)
+        list.__init__(self, records)
 
     def to_list(self):
         return [record.to_dict() for record in self]
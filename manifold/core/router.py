@@ -13,13 +13,16 @@
 import os, sys, json, copy, time, traceback #, threading
 from twisted.internet                   import defer
 
-from manifold.core.cache                import Cache
+from manifold.core.cache                import CacheManager
 from manifold.core.dbnorm               import to_3nf 
 from manifold.core.interface            import Interface
 from manifold.core.query_plan           import QueryPlan
+from manifold.core.query_plan_cache     import QueryPlanCache
 from manifold.core.record               import LastRecord
 from manifold.core.result_value         import ResultValue
+from manifold.operators.subquery        import SubQuery
 from manifold.util.log                  import Log
+from manifold.util.trace                import Tracer
 from manifold.util.type                 import returns, accepts
 from manifold.util.reactor_thread       import ReactorThread
 from manifold.policy                    import Policy
@@ -27,8 +30,6 @@ from manifold.policy                    import Policy
 # XXX cannot use the thread with xmlrpc -n
 #from manifold.util.reactor_wrapper  import ReactorWrapper as ReactorThread
 
-CACHE_LIFETIME     = 1800
-
 #------------------------------------------------------------------
 # Class Router
 # Router configured only with static/local routes, and which
@@ -43,6 +44,15 @@ class Router(Interface):
     Specialized to handle Announces/Routes, ...
     """
 
+    @staticmethod
+    def init_options():
+        """
+        Prepare options supported by the Router and its operators.
+        """
+        SubQuery.init_options()
+        CacheManager.init_options()
+        Tracer.init_options()
+
     def boot(self):
         """
         Boot the Interface (prepare metadata, etc.).
@@ -58,10 +68,13 @@ class Router(Interface):
         super(Router, self).boot()
         self.g_3nf = to_3nf(self.metadata)
 
+        # QueryPlan templates depend on the 3nf graph
+        self.query_plan_cache = QueryPlanCache()
+
         # TODO: ROUTERV2
-        # Cache per user
-        self._cache = Cache()
-        self._cache_user = dict()
+        # Cache per user (bounded in time and memory)
+        self._cache_manager = CacheManager()
+        self._cache_manager.start()
 
     def __enter__(self):
         """
@@ -89,12 +102,10 @@ class Router(Interface):
         if not user_id:
             # Use global cache
             Log.warning("Use of global cache for query, annotations=%r" % (annotations,))
-            return self._cache    
+            return self._cache_manager.get_cache()
 
         # Use per-user cache
-        if user_id not in self._cache_user:
-            self._cache_user[user_id] = Cache()
-        return self._cache_user[user_id]
+        return self._cache_manager.get_cache(user_id)
 
     # TODO: ROUTERV2 
     # Invalidate Cache per user
@@ -107,12 +118,31 @@ class Router(Interface):
             Log.tmp(annotations)
             if annotations is not None:
                 user_id = annotations['user']['user_id']
-                if user_id in self._cache_user:
-                    del self._cache_user[user_id]
+                self._cache_manager.delete_cache(user_id)
          except:
             import traceback
             traceback.print_exc()
 
+    def get_query_plan_stamp(self):
+        """
+        Returns:
+            A value which changes whenever the QueryPlans built by this
+            Router may change (3nf graph, enabled platforms and their
+            configuration), see QueryPlanCache.validate.
+        """
+        return (
+            self.g_3nf,
+            tuple((p['platform'], p.get('gateway_type'), p.get('config')) for p in self.platforms)
+        )
+
+    def invalidate_cache(self, query):
+        """
+        Invalidate the cache entries (of every user) possibly altered by a Query.
+        Args:
+            query: A create, update or delete Query.
+        """
+        self._cache_manager.invalidate(query)
+
     # This function is directly called for a Router
     # Decoupling occurs before for queries received through sockets
 #    @returns(ResultValue)
@@ -134,9 +164,12 @@ class Router(Interface):
         #import pdb
         #pdb.set_trace()
         
-        # INVALIDATE CACHE - should be per object?
+        # INVALIDATE CACHE
         if query.get_action() != 'get':
-            self.delete_cache(annotations)
+            self.invalidate_cache(query)
+            # Enabling or disabling a platform changes the QueryPlans
+            if query.get_from() == "%s:platform" % self.LOCAL_NAMESPACE:
+                self.query_plan_cache.invalidate()
 
         user = annotations['user'] if annotations and 'user' in annotations else None
         if annotations is None:
@@ -281,6 +314,9 @@ class Router(Interface):
                 else:
                     raise Exception, "Unknown RECORD decision from policy engine: %s" % Policy.map_decision[decision]
 
+        if query_plan.tracer:
+            Log.info(query_plan.tracer.dump())
+
         description = query_plan.get_result_value_array()
 
         return ResultValue.get_result_value(records, description)
@@ -306,12 +342,32 @@ class Router(Interface):
         else:
             allowed_platforms = [p['platform'] for p in self.platforms]
 
-        qp = QueryPlan()
-        qp.build(query, self.g_3nf, allowed_platforms, self.allowed_capabilities, user)
-        Log.tmp("QUERY PLAN")
-        qp.dump()
+        self.query_plan_cache.validate(self.get_query_plan_stamp())
+        qp = self.query_plan_cache.get(query, allowed_platforms, self.allowed_capabilities, user)
+        if not qp:
+            self.query_plan_cache.mark(query)
+            qp = QueryPlan()
+            qp.build(query, self.g_3nf, allowed_platforms, self.allowed_capabilities, user)
+            self.query_plan_cache.add(query, allowed_platforms, self.allowed_capabilities, qp)
+
+        # The cache entry related to this query depends on the tables queried
+        # by the QueryPlan. Like in process_qp_results, the entry of a query
+        # prefixed by a namespace is stored under the prefixed table name.
+        if annotations:
+            objects = [from_node.get_query().get_from() for from_node in qp.froms]
+            if namespace is not None:
+                table_name = query.object
+                query.object = namespace + ':' + table_name
+                self.get_cache(annotations).add_objects(query, objects)
+                query.object = table_name
+            else:
+                self.get_cache(annotations).add_objects(query, objects)
 
         self.instanciate_gateways(qp, user)
         Log.info("QUERY PLAN:\n%s" % (qp.dump()))
 
+        tracer = Tracer.get(annotations)
+        if tracer:
+            qp.set_tracer(tracer)
+
         return self.execute_query_plan(namespace, query, annotations, qp, is_deferred)
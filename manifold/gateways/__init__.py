@@ -15,7 +15,7 @@
 #
 # Copyright (C) 2013 UPMC 
 
-import os, sys, json, traceback
+import os, sys, json, copy, traceback
 from types                        import StringTypes
 from manifold.core.result_value   import ResultValue
 from manifold.core.announce       import Announces
@@ -63,6 +63,35 @@ class Gateway(object):
         self.identifier     = 0 # The gateway will receive the identifier from the ast FROM node
         self.callback       = None
         self.result_value   = []
+        # Set when the records are no longer needed (see stop)
+        self.stopped        = False
+
+    def __deepcopy__(self, memo):
+        """
+        A Gateway may hold connections, proxies, etc. that cannot be copied,
+        so the copy of a Gateway shares them (as well as the interface and
+        the configuration) while its query, callback and results are its
+        own. This allows to duplicate a branch of an AST after the Gateways
+        have been instanciated. Subclasses holding per-query state must
+        override this method.
+        """
+        gateway = self.__class__.__new__(self.__class__)
+        memo[id(self)] = gateway
+        gateway.__dict__.update(self.__dict__)
+        gateway.query        = copy.deepcopy(self.query, memo)
+        gateway.callback     = copy.deepcopy(self.callback, memo)
+        gateway.result_value = []
+        gateway.stopped      = False
+        return gateway
+
+    def stop(self):
+        """
+        Notify this Gateway that the records it sends are no longer needed
+        (for instance, the LIMIT of the query is reached). Gateways which
+        can interrupt a query check self.stopped, the other ones keep on
+        sending their records, which are then ignored.
+        """
+        self.stopped = True
 
     def get_variables(self):
         variables = {}
@@ -181,9 +210,8 @@ class Gateway(object):
     def send(self, record):
         """
         \brief calls the parent callback with the record passed in parameter
+        (see manifold.util.trace to trace the records sent by a Gateway)
         """
-        if self.identifier:
-            Log.record("[#%04d] [ %r ]" % (self.identifier, record))
         self.callback(record)
 
     def set_identifier(self, identifier):
@@ -1,12 +1,13 @@
 # To avoid naming conflicts when importing 
 from __future__ import absolute_import
 
-import csv, os.path
-from itertools               import izip
+import csv, os, os.path, cPickle, traceback
+from types                   import StringTypes
 from datetime                import datetime
 from manifold.gateways       import Gateway
 from manifold.core.capabilities import Capabilities
-from manifold.core.record    import Record, LastRecord
+from manifold.core.record    import LastRecord
+from manifold.core.result_value import ResultValue
 from manifold.core.table     import Table
 from manifold.core.announce  import Announce
 from manifold.core.field     import Field 
@@ -15,6 +16,12 @@ from manifold.types.inet     import inet
 from manifold.types.hostname import hostname
 from manifold.types          import type_get_name, type_by_name, int, string, inet, date
 from manifold.util.log       import Log
+from manifold.util.predicate import eq, included
+from manifold.gateways.csv.scanner import CSVScanner
+
+# Suffix of on-disk key indexes (see CSVGateway.get_index_filename)
+INDEX_SUFFIX = ".idx"
+
 # Heuristics for type guessing
 
 heuristics = (
@@ -28,6 +35,14 @@ heuristics = (
 class CSVGateway(Gateway):
     __gateway_name__ = 'csv'
 
+    # Sniffed file information, shared by every CSVGateway instance:
+    # {filename : ((mtime, size), (dialect, has_header, header, first_row))}
+    file_infos = dict()
+
+    # Key indexes, shared by every CSVGateway instance:
+    # {(filename, key position) : ((mtime, size), {key value : [byte offset, ...]})}
+    indexes = dict()
+
     def __init__(self, router, platform, query, config, user_config, user):
         super(CSVGateway, self).__init__(router, platform, query, config, user_config, user)
 
@@ -40,45 +55,83 @@ class CSVGateway(Gateway):
         #    ...
         self.has_headers = {}
 
-    def convert(self, row, field_names, field_types):
-        #return dict([ (name, type_by_name(type)(value)) for value, name, type in izip(row, field_names, field_types)])
-        for value, name, type in izip(row, field_names, field_types):
-            return Record([ (name, type_by_name(type)(value)) for value, name, type in izip(row, field_names, field_types)])
-
     def start(self):
         assert self.query, "Query should have been associated before start"
 
         table = self.query.object
-
-        dialect, field_names, field_types = self.get_dialect_and_field_info(table)
-        key = self.get_key(table)
-
         filename = self.config[table]['filename']
 
-        with open(filename , 'rb') as csvfile:
-            reader  = csv.reader(csvfile, dialect=dialect)
-            try:
-                if self.has_headers[table]:
-                    values = reader.next()
-                for row in reader:
-                    row = self.convert(row, field_names, field_types)
-                    if not row: continue
-                    self.send(row)
-                self.send(LastRecord())
-            except csv.Error as e:
-                sys.exit('file %s, line %d: %s' % (filename, reader.line_num, e))
+        try:
+            dialect, field_names, field_types = self.get_dialect_and_field_info(table)
+            key = self.get_key(table)
+
+            # Byte offsets of the matching rows, None if the whole file must be read
+            offsets = self.get_offsets(table, dialect, field_names, key)
+
+            scanner = CSVScanner(filename, dialect, self.has_headers[table], field_names, field_types, self.get_batch_size(table))
+            for record in scanner.scan(self.query.get_where(), self.query.get_select(), offsets):
+                if self.stopped:
+                    break
+                self.send(record)
+            self.send(LastRecord())
+        except csv.Error as e:
+            Log.error("CSVGateway: cannot read %s: %s" % (filename, e))
+            self.result_value.append(ResultValue(
+                origin      = (ResultValue.GATEWAY, self.__class__.__name__, self.platform, str(self.query)),
+                type        = ResultValue.ERROR,
+                code        = ResultValue.ERROR,
+                description = 'file %s: %s' % (filename, e),
+                traceback   = traceback.format_exc()
+            ))
+            self.send(LastRecord())
 
     def get_base(self, filename):
         return os.path.splitext(os.path.basename(filename))[0]
 
-    def get_dialect_and_field_info(self, table):
-        t = self.config[table]
-        filename = t['filename']
+    @staticmethod
+    def get_stamp(filename):
+        """
+        Args:
+            filename: The path of a file.
+        Returns:
+            A (mtime, size) tuple which changes whenever the file is modified.
+        """
+        stat = os.stat(filename)
+        return (stat.st_mtime, stat.st_size)
+
+    def get_file_info(self, filename):
+        """
+        Sniff the dialect, the header and the first row of a CSV file.
+        The result is cached until the file is modified.
+        Args:
+            filename: The path of the CSV file.
+        Returns:
+            A (dialect, has_header, header, first_row) tuple, where header
+            (resp. first_row) is None if the file has no header (resp. no row).
+        """
+        stamp = self.get_stamp(filename)
+        cached = CSVGateway.file_infos.get(filename)
+        if cached and cached[0] == stamp:
+            return cached[1]
 
         with open(filename, 'rb') as f:
             sample = f.read(1024)
             dialect = csv.Sniffer().sniff(sample)
-            self.has_headers[table] = csv.Sniffer().has_header(sample)
+            has_header = csv.Sniffer().has_header(sample)
+            f.seek(0)
+            reader = csv.reader(f, dialect=dialect)
+            header = next(reader, None) if has_header else None
+            first_row = next(reader, None)
+
+        info = (dialect, has_header, header, first_row)
+        CSVGateway.file_infos[filename] = (stamp, info)
+        return info
+
+    def get_dialect_and_field_info(self, table):
+        t = self.config[table]
+        filename = t['filename']
+
+        dialect, self.has_headers[table], header, first_row = self.get_file_info(filename)
 
         HAS_FIELDS_OK, HAS_FIELDS_KO, HAS_FIELDS_ERR = range(1,4)
         HAS_TYPES_OK,  HAS_TYPES_KO,  HAS_TYPES_ERR  = range(1,4)
@@ -105,25 +158,190 @@ class CSVGateway(Gateway):
         if has_fields in [HAS_FIELDS_KO, HAS_FIELDS_ERR]:
             if not self.has_headers[table]:
                 raise Exception, "Missing field description"
-            with open(filename, 'rb') as csvfile:
-                reader = csv.reader(csvfile, dialect=dialect)
-                # Note: we do not use DictReader since we need a list of fields in order
-                field_names = reader.next()
+            # Note: we do not use DictReader since we need a list of fields in order
+            field_names = header
 
         if has_types in [HAS_TYPES_KO, HAS_TYPES_ERR]:
             # We try to guess file types
-            with open(t['filename'], 'rb') as csvfile:
-                reader = csv.reader(csvfile, dialect=dialect)
-                if self.has_headers[table]:
-                    values = reader.next()
-                values = reader.next() # a list of string
-                field_types = []
-                for value in values:
-                    field_types.append(self.guess_type(value))
-                    
-            
+            if first_row is None:
+                raise Exception, "Cannot guess field types of empty file %s" % filename
+            field_types = []
+            for value in first_row:
+                field_types.append(self.guess_type(value))
+
         return (dialect, field_names, field_types)
 
+    def get_index_filename(self, table, position):
+        """
+        The key index of a table is enabled by the 'index' parameter of its
+        configuration: either true (the index is stored next to the CSV
+        file) or the path of the index file.
+        Args:
+            table: The name of a table.
+            position: The position of the key field in each row.
+        Returns:
+            The path of the key index of this table, None if it is not indexed.
+        """
+        t = self.config[table]
+        index = t.get('index') if isinstance(t, dict) else None
+        if not index:
+            return None
+        if isinstance(index, StringTypes) and index.lower() not in ['1', 'true', 'yes']:
+            return index
+        # Tables over the same file may have distinct keys
+        return "%s.%d%s" % (t['filename'], position, INDEX_SUFFIX)
+
+    @staticmethod
+    def to_index_value(value):
+        """
+        Args:
+            value: A key value (as found in a Predicate).
+        Returns:
+            The String stored in the CSV file for this value.
+        """
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        return str(value)
+
+    def build_index(self, filename, dialect, has_header, position):
+        """
+        Read a whole CSV file and map each key value to the byte offsets
+        of the rows carrying it.
+        Args:
+            filename: The path of the CSV file.
+            dialect: The dialect of the CSV file.
+            has_header: True iif the first row of the file is a header.
+            position: The position of the key field in each row.
+        Returns:
+            A {key value : [byte offset, ...]} dictionary.
+        """
+        offsets = dict()
+        end = [0]
+
+        def lines(f):
+            # The csv module consumes lines on demand: the offset of a row is
+            # the end of the last line consumed before parsing it.
+            for line in f:
+                end[0] += len(line)
+                yield line
+
+        with open(filename, 'rb') as f:
+            reader = csv.reader(lines(f), dialect=dialect)
+            if has_header:
+                reader.next()
+            while True:
+                offset = end[0]
+                row = next(reader, None)
+                if row is None:
+                    break
+                if len(row) > position:
+                    offsets.setdefault(row[position], list()).append(offset)
+        return offsets
+
+    def get_index(self, table, dialect, position):
+        """
+        Retrieve the key index of a table. The index is loaded from disk, or
+        (re)built and saved if the CSV file has been modified since.
+        Args:
+            table: The name of the table.
+            dialect: The dialect of the CSV file.
+            position: The position of the key field in each row.
+        Returns:
+            A {key value : [byte offset, ...]} dictionary, None if the
+            table is not indexed.
+        """
+        index_filename = self.get_index_filename(table, position)
+        if not index_filename:
+            return None
+
+        filename = self.config[table]['filename']
+        stamp = self.get_stamp(filename)
+        cached = CSVGateway.indexes.get((filename, position))
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        offsets = None
+        try:
+            with open(index_filename, 'rb') as f:
+                data = cPickle.load(f)
+            if data['stamp'] == stamp and data['position'] == position:
+                offsets = data['offsets']
+        except (IOError, EOFError, KeyError, cPickle.UnpicklingError), e:
+            pass
+
+        if offsets is None:
+            Log.info("Building key index %s for %s" % (index_filename, filename))
+            offsets = self.build_index(filename, dialect, self.has_headers[table], position)
+            data = {"stamp" : stamp, "position" : position, "offsets" : offsets}
+            try:
+                # Write then rename so that concurrent readers never see a partial index
+                tmp_filename = "%s.%d" % (index_filename, os.getpid())
+                with open(tmp_filename, 'wb') as f:
+                    cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+                os.rename(tmp_filename, index_filename)
+            except (IOError, OSError), e:
+                Log.warning("Cannot save key index %s: %s" % (index_filename, e))
+
+        CSVGateway.indexes[(filename, position)] = (stamp, offsets)
+        return offsets
+
+    def get_key_values(self, key):
+        """
+        Args:
+            key: The list of key field names of the queried table.
+        Returns:
+            The list of key values selected by the WHERE clause of the
+            Query (equality or included on the key), None if the WHERE
+            clause does not constrain the key.
+        """
+        # NOTE only a single key field is supported
+        if len(key) != 1:
+            return None
+        for predicate in self.query.get_where():
+            if predicate.get_key() != key[0]:
+                continue
+            value = predicate.get_value()
+            if predicate.get_op() == included or (predicate.get_op() == eq and isinstance(value, (list, tuple, set, frozenset))):
+                return list(value)
+            if predicate.get_op() == eq:
+                return [value]
+        return None
+
+    def get_offsets(self, table, dialect, field_names, key):
+        """
+        Args:
+            table: The name of the queried table.
+            dialect: The dialect of the CSV file.
+            field_names: The list of field names, in the order of the CSV file.
+            key: The list of key field names of this table.
+        Returns:
+            The sorted list of byte offsets of the rows whose key is selected
+            by the Query, None if the whole file must be read.
+        """
+        key_values = self.get_key_values(key)
+        if key_values is None or key[0] not in field_names:
+            return None
+        index = self.get_index(table, dialect, field_names.index(key[0]))
+        if index is None:
+            return None
+
+        offsets = set()
+        for value in key_values:
+            offsets.update(index.get(self.to_index_value(value), list()))
+        return sorted(offsets)
+
+    def get_batch_size(self, table):
+        """
+        Args:
+            table: The name of a table.
+        Returns:
+            The number of rows scanned at once (see the 'batch_size' parameter
+            of the table configuration), None for the default value.
+        """
+        t = self.config[table]
+        batch_size = t.get('batch_size') if isinstance(t, dict) else None
+        return int(batch_size) if batch_size else None
+
     def guess_type(self, value):
         for type in heuristics:
             try:
@@ -150,6 +368,9 @@ class CSVGateway(Gateway):
         else:
             capabilities.retrieve   = True
             capabilities.join       = True
+            # Filters and fields are applied while scanning (see CSVScanner)
+            capabilities.selection  = True
+            capabilities.projection = True
         return capabilities
 
     def get_metadata(self):
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# CSVScanner reads a memory-mapped CSV file by batches of rows. The
+# predicates of the WHERE clause are evaluated column by column on each
+# batch before any Record is built, and the values are only converted
+# for the fields which are filtered or returned.
+
+# To avoid naming conflicts when importing
+from __future__ import absolute_import
+
+import csv, mmap, os
+from operator                   import eq, ne, lt, le, gt, ge
+from types                      import StringTypes
+
+from manifold.core.record       import Record, RecordSchema
+from manifold.types             import type_by_name
+from manifold.util.predicate    import included
+
+# Default number of rows parsed and filtered at once
+DEFAULT_BATCH_SIZE = 1000
+
+# Operators evaluated by CSVScanner.filter_column without calling Predicate.match
+COMPARISON_OPERATORS = [lt, le, gt, ge]
+
+class CSVScanner(object):
+    """
+    Scan a CSV file and produce the Records matching a Query.
+    """
+
+    def __init__(self, filename, dialect, has_header, field_names, field_types, batch_size = None):
+        """
+        Constructor.
+        Args:
+            filename: The path of the CSV file.
+            dialect: The dialect of the CSV file.
+            has_header: True iif the first row of the file is a header.
+            field_names: The list of field names, in the order of the CSV file.
+            field_types: The list of the corresponding type names.
+            batch_size: The number of rows processed at once (None for default).
+        """
+        self.filename    = filename
+        self.dialect     = dialect
+        self.has_header  = has_header
+        self.field_names = field_names
+        self.field_types = field_types
+        self.batch_size  = batch_size or DEFAULT_BATCH_SIZE
+        self.positions   = dict((name, i) for i, name in enumerate(field_names))
+        self.converters  = [type_by_name(type) for type in field_types]
+
+    def iter_rows(self, mm, offsets = None):
+        """
+        Args:
+            mm: The memory-mapped CSV file.
+            offsets: The byte offsets of the rows to read, None to read
+                every row of the file.
+        Returns:
+            A generator of rows (lists of String).
+        """
+        if offsets is None:
+            reader = csv.reader(iter(mm.readline, ''), dialect = self.dialect)
+            if self.has_header:
+                next(reader, None)
+            for row in reader:
+                yield row
+        else:
+            for offset in offsets:
+                mm.seek(offset)
+                row = next(csv.reader(iter(mm.readline, ''), dialect = self.dialect), None)
+                if row is not None:
+                    yield row
+
+    def iter_batches(self, mm, offsets = None):
+        """
+        Args:
+            mm: The memory-mapped CSV file.
+            offsets: See iter_rows.
+        Returns:
+            A generator of lists of (at most batch_size) rows. Empty rows are
+            skipped and short rows are padded with None.
+        """
+        num_fields = len(self.field_names)
+        batch = list()
+        for row in self.iter_rows(mm, offsets):
+            if not row:
+                continue
+            if len(row) < num_fields:
+                row = row + [None] * (num_fields - len(row))
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = list()
+        if batch:
+            yield batch
+
+    def get_column(self, batch, columns, field_name, raw_strings = False):
+        """
+        Extract and convert the values of a field from a batch.
+        Args:
+            batch: A list of rows.
+            columns: A {field name : column} dictionary caching the
+                columns already extracted from this batch.
+            field_name: The name of the field.
+            raw_strings: Pass True to keep the values of 'string' fields
+                as read from the file.
+        Returns:
+            The list of values of this field.
+        """
+        position = self.positions[field_name]
+        if raw_strings and self.field_types[position] == 'string':
+            key = (field_name, True)
+            if key not in columns:
+                columns[key] = [row[position] for row in batch]
+            return columns[key]
+
+        if field_name not in columns:
+            convert = self.converters[position]
+            columns[field_name] = [convert(row[position]) if row[position] is not None else None for row in batch]
+        return columns[field_name]
+
+    def filter_column(self, predicate, batch, columns, selected):
+        """
+        Evaluate a Predicate on a batch.
+        Args:
+            predicate: A Predicate instance involving fields of the CSV file.
+            batch: A list of rows.
+            columns: See get_column.
+            selected: The list of positions in the batch of the rows
+                matching the Predicates evaluated so far.
+        Returns:
+            The list of positions in the batch of the selected rows
+            matching this Predicate.
+        """
+        key, op, value = predicate.get_tuple()
+
+        if not isinstance(key, tuple):
+            column = self.get_column(batch, columns, key, raw_strings = True)
+            if (op in [eq, ne] and isinstance(value, list)) or (op == included and isinstance(value, (list, tuple, set, frozenset))):
+                try:
+                    value = frozenset(value)
+                except TypeError:
+                    pass
+                if op == ne:
+                    return [i for i in selected if column[i] not in value]
+                return [i for i in selected if column[i] in value]
+            elif op == eq:
+                return [i for i in selected if column[i] == value]
+            elif op == ne:
+                return [i for i in selected if column[i] != value]
+            elif op in COMPARISON_OPERATORS and not isinstance(value, StringTypes):
+                return [i for i in selected if op(column[i], value)]
+
+        # Other Predicates (prefix matches, tuples, ...)
+        field_columns = [(field_name, self.get_column(batch, columns, field_name)) for field_name in predicate.get_field_names()]
+        return [i for i in selected if predicate.match(dict((field_name, column[i]) for field_name, column in field_columns))]
+
+    def scan(self, filters, fields, offsets = None):
+        """
+        Args:
+            filters: The Filter of the Query. Predicates involving fields
+                which are not in the CSV file are ignored (see Filter.match).
+            fields: The queried field names, None or an empty set for all fields.
+            offsets: See iter_rows.
+        Returns:
+            A generator of the Records matching the Query.
+        """
+        if fields:
+            field_names = [field_name for field_name in self.field_names if field_name in fields]
+        else:
+            field_names = self.field_names
+        schema = RecordSchema.get(field_names)
+        predicates = [p for p in filters if p.get_field_names() <= set(self.positions)] if filters else list()
+
+        with open(self.filename, 'rb') as f:
+            # Empty files cannot be mapped
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                for batch in self.iter_batches(mm, offsets):
+                    columns  = dict()
+                    selected = range(len(batch))
+                    for predicate in predicates:
+                        selected = self.filter_column(predicate, batch, columns, selected)
+                        if not selected:
+                            break
+                    if not selected:
+                        continue
+
+                    if len(selected) < len(batch):
+                        batch, columns = [batch[i] for i in selected], dict()
+                    values = [self.get_column(batch, columns, field_name) for field_name in field_names]
+                    if not values:
+                        for row in batch:
+                            yield Record.from_values(schema, list())
+                        continue
+                    for row_values in zip(*values):
+                        yield Record.from_values(schema, list(row_values))
+            finally:
+                mm.close()
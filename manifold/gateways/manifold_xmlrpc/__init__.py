@@ -3,6 +3,7 @@
 from manifold.core.record           import Record, LastRecord
 from manifold.gateways              import Gateway
 from manifold.util.reactor_thread   import ReactorThread
+from manifold.util.single_flight    import SingleFlight
 #from twisted.internet import reactor
 
 # DEBUG
@@ -11,6 +12,9 @@ import sys
 class ManifoldGateway(Gateway):
     __gateway_name__ = 'manifold'
 
+    # Identical 'get' queries in flight, shared by all the ManifoldGateway instances
+    coalescer = SingleFlight("ManifoldGateway")
+
     def __str__(self):
         return "<ManifoldGateway %s %s>" % (self.config['url'], self.query)
 
@@ -98,10 +102,13 @@ class ManifoldGateway(Gateway):
 
                 print "query dict", query.to_dict()
 
-                proxy.callRemote(
+                args = (query.to_dict(), {'authentication': auth})
+                key = SingleFlight.get_key(self.config['url'], 'forward', args) if query.action == 'get' else None
+                ManifoldGateway.coalescer.call(
+                    key,
+                    proxy.callRemote,
                     'forward',
-                    query.to_dict(),
-                    {'authentication': auth}
+                    *args
                 ).addCallbacks(source.success_cb, source.exception_cb)
                 print "done call"
 
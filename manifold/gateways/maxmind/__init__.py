@@ -1,5 +1,37 @@
-from manifold.gateways import Gateway
-import GeoIP
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# MaxMindGateway is an ONJOIN platform geolocating IP addresses and
+# hostnames using a MaxMind GeoIP (legacy) city database.
+#
+# Platform configuration:
+#  - database   : path of the database (default DEFAULT_DATABASE)
+#  - cache_size : number of lookups memoized (default DEFAULT_CACHE_SIZE)
+#
+# A CSV file can be used as a stand-in database (see CSVDatabase).
+
+# To avoid naming conflicts when importing
+from __future__ import absolute_import
+
+import csv, socket, threading, traceback
+from collections                import OrderedDict
+from twisted.internet.threads   import deferToThreadPool
+
+from manifold.core.filter       import Filter
+from manifold.core.record       import Record, LastRecord
+from manifold.core.result_value import ResultValue
+from manifold.gateways          import Gateway
+from manifold.util.log          import Log
+from manifold.util.predicate    import eq, included
+from manifold.util.reactor_thread import ReactorThread
+
+try:
+    import GeoIP
+except ImportError:
+    GeoIP = None
+
+DEFAULT_DATABASE   = "/usr/local/share/GeoIP/GeoLiteCity.dat"
+DEFAULT_CACHE_SIZE = 100000
 
 geo_fields = {
     'city': 'city',
@@ -15,70 +47,297 @@ geo_fields = {
 allowed_fields = ['ip', 'hostname']
 allowed_fields.extend(geo_fields.keys())
 
+class CSVDatabase(object):
+    """
+    Stand-in for a GeoIP database (for tests, private address plans...).
+    It is a CSV file whose header contains 'ip' and 'hostname', and the
+    GeoIP record fields (see geo_fields values) to return. The hostnames
+    are resolved by the file itself (see gethostbyname).
+    """
+
+    def __init__(self, filename):
+        """
+        Constructor.
+        Args:
+            filename: The path of the CSV file.
+        """
+        self.by_addr = dict()
+        self.by_name = dict()
+        self.addrs   = dict()
+        with open(filename, 'rb') as f:
+            for row in csv.DictReader(f):
+                record = dict()
+                for key, value in row.items():
+                    if key in ['ip', 'hostname'] or not value:
+                        continue
+                    record[key] = float(value) if key in ['latitude', 'longitude'] else value.decode('utf-8')
+                if row.get('ip'):
+                    self.by_addr[row['ip']] = record
+                if row.get('hostname'):
+                    self.by_name[row['hostname']] = record
+                    if row.get('ip'):
+                        self.addrs[row['hostname']] = row['ip']
+
+    def record_by_addr(self, addr):
+        return self.by_addr.get(addr)
+
+    def record_by_name(self, name):
+        return self.by_name.get(name)
+
+    def gethostbyname(self, name):
+        try:
+            return self.addrs[name]
+        except KeyError:
+            raise socket.gaierror, "%s is not in this database" % name
 
 class MaxMindGateway(Gateway):
     __gateway_name__ = 'maxmind'
 
+    # Databases opened by this process: {filename : database}
+    databases = dict()
+
+    # Memoized lookups shared by every MaxMindGateway instance (LRU):
+    # {(filename, field name, value) : (IP address, geo fields dictionary or None)}
+    lookups = OrderedDict()
+    lookups_lock = threading.Lock()
+
     def __str__(self):
         return "<MaxMindGateway %s>" % self.query
 
+    def get_database(self):
+        """
+        Open the database of this platform. Each database is opened (and
+        memory-mapped) once per process.
+        Returns:
+            A (filename, database) tuple.
+        """
+        filename = (self.config or dict()).get('database') or DEFAULT_DATABASE
+        database = MaxMindGateway.databases.get(filename)
+        if database is None:
+            if filename.endswith('.csv'):
+                database = CSVDatabase(filename)
+            elif GeoIP:
+                database = GeoIP.open(filename, GeoIP.GEOIP_MMAP_CACHE)
+            else:
+                raise Exception, "python-GeoIP is required to read %s" % filename
+            MaxMindGateway.databases[filename] = database
+        return (filename, database)
+
+    def get_cache_size(self):
+        """
+        Returns:
+            The maximum number of memoized lookups.
+        """
+        return int((self.config or dict()).get('cache_size') or DEFAULT_CACHE_SIZE)
+
+    def get_values(self, field_name):
+        """
+        Args:
+            field_name: 'ip' or 'hostname'.
+        Returns:
+            The list of distinct values that the WHERE clause of the Query
+            (equality or included) requires for this field.
+        """
+        values = list()
+        for predicate in self.query.get_where():
+            if predicate.get_key() != field_name or predicate.get_op() not in [eq, included]:
+                continue
+            value = predicate.get_value()
+            values.extend(value if isinstance(value, (list, tuple, set, frozenset)) else [value])
+        seen = set()
+        return [value for value in values if not (value in seen or seen.add(value))]
+
+    def get_filter(self):
+        """
+        Returns:
+            The Filter made of the predicates of the WHERE clause which are
+            not handled by the lookups (see get_values). send_geo applies
+            it to every Record.
+        """
+        filter = Filter()
+        for predicate in self.query.get_where():
+            if predicate.get_key() in ['ip', 'hostname'] and predicate.get_op() in [eq, included]:
+                continue
+            filter.add(predicate)
+        return filter
+
+    @staticmethod
+    def to_geo(record):
+        """
+        Args:
+            record: A GeoIP record (dictionary) or None.
+        Returns:
+            The corresponding geo fields dictionary or None.
+        """
+        if not record:
+            return None
+        geo = dict()
+        for field_name, key in geo_fields.items():
+            value = record.get(key)
+            # GeoIP strings are encoded in ISO-8859-1
+            if isinstance(value, str):
+                value = value.decode('iso-8859-1')
+            geo[field_name] = value
+        return geo
+
+    def get_memoized(self, filename, field_name, values):
+        """
+        Args:
+            filename: The path of the database.
+            field_name: 'ip' or 'hostname'.
+            values: A list of IP addresses or hostnames.
+        Returns:
+            A (hits, misses) tuple, where hits is the list of memoized
+            (value, lookup) tuples (see lookup) and misses the
+            list of values which must be looked up (see resolve).
+        """
+        lookups = MaxMindGateway.lookups
+        hits, misses = list(), list()
+        with MaxMindGateway.lookups_lock:
+            for value in values:
+                key = (filename, field_name, value)
+                if key in lookups:
+                    # Move this entry at the end (most recently used)
+                    lookup = lookups[key] = lookups.pop(key)
+                    hits.append((value, lookup))
+                else:
+                    misses.append(value)
+        return (hits, misses)
+
+    def resolve(self, filename, database, misses):
+        """
+        Look up and memoize IP addresses and hostnames. Resolving a hostname
+        blocks on DNS, so this method runs in a thread of the reactor
+        ThreadPool when the reactor is running (see start).
+        Args:
+            filename: The path of the database.
+            database: The database.
+            misses: A list of (field name, list of values) tuples, where
+                field name is 'ip' or 'hostname'.
+        Returns:
+            A list of (field name, value, lookup) tuples (see lookup).
+        """
+        lookups = MaxMindGateway.lookups
+        cache_size = self.get_cache_size()
+        resolved = list()
+        for field_name, values in misses:
+            for value in values:
+                lookup = self.lookup(database, field_name, value)
+                with MaxMindGateway.lookups_lock:
+                    lookups[(filename, field_name, value)] = lookup
+                    while len(lookups) > cache_size:
+                        lookups.popitem(last = False)
+                resolved.append((field_name, value, lookup))
+        return resolved
+
+    def lookup(self, database, field_name, value):
+        """
+        Geolocate an IP address, or a hostname through the IP address it
+        resolves into.
+        Args:
+            database: The database.
+            field_name: 'ip' or 'hostname'.
+            value: The IP address or the hostname.
+        Returns:
+            An (IP address, geo fields dictionary or None) tuple. The IP
+            address is None if the hostname cannot be resolved.
+        """
+        addr = str(value) if field_name == 'ip' else None
+        try:
+            if addr is None:
+                addr = getattr(database, 'gethostbyname', socket.gethostbyname)(str(value))
+            return (addr, self.to_geo(database.record_by_addr(addr)))
+        except Exception, e:
+            # For instance, a hostname which cannot be resolved
+            Log.warning("MaxMind: cannot geolocate %s: %s" % (value, e))
+            return (addr, None)
+
+    def send_geo(self, field_name, value, lookup):
+        """
+        Send the Record related to a geolocated IP address or hostname, if
+        it satisfies the WHERE clause of the Query (see get_filter).
+        Args:
+            field_name: 'ip' or 'hostname'.
+            value: The IP address or the hostname.
+            lookup: The corresponding (IP address, geo fields dictionary
+                or None) tuple (see lookup).
+        """
+        addr, geo = lookup
+        if addr is None:
+            # The Records of this table are identified by their IP address
+            return
+        record = dict()
+        for field in allowed_fields:
+            if field == 'ip':
+                record[field] = addr
+            elif field == 'hostname':
+                record[field] = value if field_name == 'hostname' else None
+            else:
+                record[field] = geo[field] if geo else None
+        if not self.filter.match(record):
+            return
+        fields = self.query.get_select()
+        if fields:
+            record = dict((field, record[field]) for field in allowed_fields if field in fields)
+        self.send(Record(record))
+
+    def send_resolved(self, resolved):
+        """
+        Send the Records related to the values looked up by resolve,
+        followed by a LastRecord.
+        Args:
+            resolved: The list returned by resolve.
+        """
+        for field_name, value, lookup in resolved:
+            self.send_geo(field_name, value, lookup)
+        self.send(LastRecord())
+
+    def on_error(self, description, trace):
+        """
+        Report an error and send a LastRecord.
+        Args:
+            description: A String describing the error.
+            trace: The corresponding traceback (String).
+        """
+        self.result_value.append(ResultValue(
+            origin      = (ResultValue.GATEWAY, self.__class__.__name__, self.platform, str(self.query)),
+            type        = ResultValue.ERROR,
+            code        = ResultValue.ERROR,
+            description = description,
+            traceback   = trace
+        ))
+        self.send(LastRecord())
+
     def start(self):
-        #assert timestamp == 'latest'
-        #assert set(input_filter.keys()).issubset(['ip', 'hostname'])
-        #assert set(output_fields).issubset(allowed_fields)
-        print "W: MaxMind faking data until python-geoip is installed"
-        self.started = True
-        # XXX We never stop gateways even when finished. Investigate ?
-
-        if not 'ip' in self.query.filters and not 'hostname' in self.query.filters:
-            raise Exception, "MaxMind is an ONJOIN platform only"
-        for i in self.query.filters['ip']:
-            self.callback({'ip': i, 'city': 'TEMP'})
-        for h in self.query.filters['hostname']:
-            self.callback({'hostname': h, 'city': 'TEMP'})
-        self.callback(None)
-        return 
-
-#        gi = GeoIP.open("/usr/local/share/GeoIP/GeoLiteCity.dat",GeoIP.GEOIP_STANDARD)
-#
-#        output = []
-#
-#        if 'ip' in input_filter:
-#            ips = input_filter['ip']
-#            if not isinstance(ips, list):
-#                ips = [ips]
-#            for ip in ips:
-#                gir = gi.record_by_addr(ip)
-#                d = {}
-#                for o in output_fields:
-#                    if o == 'ip':
-#                        d[o] = ip
-#                    elif o == 'hostname':
-#                        d[o] = None
-#                    else: # We restrict output fields hence it's OK.
-#                        d[o] = gir[geo_fields[o]] if gir else None
-#                output.append(d)
-#        
-#        if 'hostname' in input_filter:
-#            hns = input_filter['hostname']
-#            if not isinstance(hns, list):
-#                hns = [hns]
-#            for hn in hns:
-#                gir = gi.record_by_name(hn)
-#                d = {}
-#                for o in output_fields:
-#                    if o == 'ip':
-#                        d[o] = None
-#                    elif o == 'hostname':
-#                        d[o] = hn
-#                    else: # We restrict output fields hence it's OK.
-#                        d[o] = gir[geo_fields[o]] if gir else None
-#                output.append(d)
-#        
-#        if 'city' in output_fields:
-#            for o in output:
-#                if o['city']:
-#                    o['city'] = o['city'].decode('iso-8859-1')
-#        for record in output:
-#            self.callback(record)
-#        self.callback(None)
+        """
+        Memoized lookups are sent first. The other values are looked up
+        in the reactor ThreadPool if the reactor is running, so that
+        DNS queries do not block the reactor, in the calling thread
+        otherwise.
+        """
+        try:
+            ips       = self.get_values('ip')
+            hostnames = self.get_values('hostname')
+            if not ips and not hostnames:
+                raise Exception, "MaxMind is an ONJOIN platform only"
+
+            self.filter = self.get_filter()
+            filename, database = self.get_database()
+            misses = list()
+            for field_name, values in [('ip', ips), ('hostname', hostnames)]:
+                hits, field_misses = self.get_memoized(filename, field_name, values)
+                for value, lookup in hits:
+                    self.send_geo(field_name, value, lookup)
+                if field_misses:
+                    misses.append((field_name, field_misses))
+
+            if misses and ReactorThread().isReactorRunning():
+                reactor = ReactorThread().reactor
+                d = deferToThreadPool(reactor, reactor.getThreadPool(), self.resolve, filename, database, misses)
+                d.addCallbacks(self.send_resolved, lambda failure: self.on_error(failure.getErrorMessage(), failure.getTraceback()))
+                return
+            resolved = self.resolve(filename, database, misses)
+        except Exception, e:
+            self.on_error(str(e), traceback.format_exc())
+            return
+        self.send_resolved(resolved)
@@ -23,6 +23,7 @@ from manifold.gateways                  import Gateway
 from manifold.util.log                  import Log
 from manifold.util.predicate            import eq, included
 from manifold.util.reactor_thread       import ReactorThread
+from manifold.util.single_flight        import SingleFlight
 from manifold.util.type                 import accepts, returns
 
 API_URL = "https://www.planet-lab.eu:443/PLCAPI/"
@@ -42,6 +43,9 @@ class MyPLCGateway(Gateway):
 
     __gateway_name__ = "myplc"
 
+    # Identical Get* calls in flight, shared by all the MyPLCGateway instances
+    coalescer = SingleFlight("MyPLCGateway")
+
     #---------------------------------------------------------------------------
     # Constructor
     #---------------------------------------------------------------------------
@@ -267,10 +271,12 @@ class MyPLCGateway(Gateway):
                         filters = r['slice_tag_id']
 
         if fields:
-            d = self._proxy.callRemote(method, self._get_auth(), filters, fields)
+            args = (self._get_auth(), filters, fields)
         else:
-            d = self._proxy.callRemote(method, self._get_auth(), filters)
-            
+            args = (self._get_auth(), filters)
+
+        key = SingleFlight.get_key(API_URL, method, args) if method.startswith('Get') else None
+        d = MyPLCGateway.coalescer.call(key, self._proxy.callRemote, method, *args)
         d.addCallback(self.callback_records)
         d.addErrback(self.callback_error)
 
@@ -3,6 +3,7 @@ from manifold.core.table                import Table
 from manifold.core.key                  import Key, Keys
 from manifold.core.field                import Field 
 from manifold.core.announce             import Announce
+from manifold.core.record               import Records
 import traceback
 
 class OMLGateway(PostgreSQLGateway):
@@ -27,7 +28,7 @@ class OMLGateway(PostgreSQLGateway):
         # List databases
         db = self.get_databases()
         if not lease_id_str in db:
-            self.callback(None)
+            return list()
 
         # Connect to slice database
         self.close()
@@ -67,7 +68,7 @@ class OMLGateway(PostgreSQLGateway):
         # List measurement points from _experiment_metadata
         return [{'measurement_point': 'counter'}]
 
-    def get_measurement_table(measure, filter=None, params=None, fields=None):
+    def get_measurement_table(self, measure, filter=None, params=None, fields=None):
         # We should be connected to the right database
         #print "OMLGateway::application"#, application
         #print "OMLGateway::measure", measure
@@ -80,19 +81,18 @@ class OMLGateway(PostgreSQLGateway):
 
         # Use postgresql query to sql function
         sql = 'SELECT * FROM "%s_%s";' % (application, measure)
-        out = self.selectall(sql)
+        # Measurement tables may be large, stream them (see PostgreSQLGateway.iterselect)
+        return self.iterselect(sql)
         
 
-    def start(self):
-        try:
-            #print "QUERY", self.query.object, " -- FILTER=", self.query.filters
-            results = getattr(self, "get_%s" % self.query.object)()
-        except Exception, e:
-            # Missing function = we are querying a measure. eg. get_counter
-            results = self.get_measurement_table(self.query.object)()
-        for row in results:
-            self.callback(row)
-        self.callback(None)
+    def get_records(self):
+        # Records are sent by PostgreSQLGateway.start
+        #print "QUERY", self.query.object, " -- FILTER=", self.query.filters
+        method = getattr(self, "get_%s" % self.query.object, None)
+        if method:
+            return Records(method())
+        # Missing function = we are querying a measure. eg. get_counter
+        return self.get_measurement_table(self.query.object)
         
         # Hook queries for OML specificities
 
@@ -74,25 +74,44 @@
 import psycopg2
 import psycopg2.extensions
 import psycopg2.extras
+import psycopg2.pool
 psycopg2.extensions.register_type(psycopg2.extensions.UNICODE)
 # UNICODEARRAY not exported yet
 psycopg2.extensions.register_type(psycopg2._psycopg.UNICODEARRAY)
 
-import re, datetime, pgdb
+import re, datetime, pgdb, threading
+from hashlib                  import md5
 from itertools                import izip
 from uuid                     import uuid4
 from types                    import StringTypes, GeneratorType, NoneType, IntType, LongType, FloatType, ListType, TupleType
 from pprint                   import pformat
+from twisted.internet.threads import deferToThreadPool, blockingCallFromThread
+from twisted.python.threadpool import ThreadPool
 from manifold.gateways        import Gateway
 from manifold.core.announce   import Announce, Announces
 from manifold.core.table      import Table
 from manifold.core.field      import Field
-from manifold.core.query      import ACTION_CREATE, ACTION_GET, ACTION_UPDATE, ACTION_DELETE
-from manifold.core.record     import Record, Records, LastRecord
+from manifold.core.query      import ACTION_CREATE, ACTION_GET, ACTION_UPDATE, ACTION_DELETE, ORDER_DESC
+from manifold.core.record     import Record, RecordSchema, Records, LastRecord
+from manifold.core.result_value import ResultValue
 from manifold.util.log        import Log
+from manifold.util.reactor_thread import ReactorThread
 from manifold.util.predicate  import and_, or_, inv, add, mul, sub, mod, truediv, lt, le, ne, gt, ge, eq, neg, contains
 from manifold.util.type       import accepts, returns
 
+# Maximum number of prepared statements kept on a connection
+MAX_PREPARED_STATEMENTS = 100
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """
+    A psycopg2 connection which remembers the statements prepared on it
+    (see PostgreSQLGateway.execute_prepared).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PreparedConnection, self).__init__(*args, **kwargs)
+        self.prepared = set()
+
 class PostgreSQLGateway(Gateway):
     __gateway_name__ = 'postgresql'
 
@@ -101,6 +120,39 @@ class PostgreSQLGateway(Gateway):
     DEFAULT_DB_PORT     = 5432
     DEFAULT_DB_USER     = "postgres"
     DEFAULT_DB_PASSWORD = ""
+    # Number of rows fetched at once from a server-side cursor (see iterselect).
+    # This can be overriden by the "itersize" key of the platform configuration,
+    # 0 means that the whole result set is fetched at once (see selectall).
+    DEFAULT_ITERSIZE    = 2000
+    # Maximum number of threads (and thus of simultaneous queries) used to
+    # run the queries related to a given platform (see start). This can be
+    # overriden by the "pool_size" key of the platform configuration, 0 means
+    # that queries are run in the calling thread.
+    DEFAULT_POOL_SIZE   = 4
+    # Maximum number of connections kept open for a given platform (see
+    # get_connection). This can be overriden by the "max_connections" key
+    # of the platform configuration.
+    DEFAULT_MAX_CONNECTIONS = 8
+    # Filtered GET queries are run as prepared statements (see get_records).
+    # This can be disabled by setting the "prepare" key of the platform
+    # configuration to False.
+    DEFAULT_PREPARE     = True
+
+    # This {String : ThreadPool} dictionnary maps each platform with the
+    # ThreadPool shared by its PostgreSQLGateway instances.
+    thread_pools = dict()
+
+    # This {String : set(PostgreSQLGateway)} dictionnary maps each platform
+    # with the PostgreSQLGateway instances whose query is being run by its
+    # ThreadPool (see start).
+    inflight = dict()
+    inflight_lock = threading.Lock()
+
+    # This {tuple : ThreadedConnectionPool} dictionnary maps each psycopg2
+    # configuration with the connections shared by the PostgreSQLGateway
+    # instances using this configuration.
+    connection_pools = dict()
+    connection_pools_lock = threading.Lock()
 
     # Note: escaping %(table_name)s with double quotes is required
     # to manage "user" table. We can query "user" but not user
@@ -111,6 +163,9 @@ class PostgreSQLGateway(Gateway):
     SELECT %(fields)s
         FROM "%(table_name)s"
         %(where)s
+        %(order_by)s
+        %(limit)s
+        %(offset)s
         ;
     """
 
@@ -265,6 +320,7 @@ class PostgreSQLGateway(Gateway):
         """
         super(PostgreSQLGateway, self).__init__(router, platform, query, config, user_config, user)
         self.connection = None
+        self.connection_pool = None
         self.cursor = None
 
         # The table matching those regular expressions are ignored...
@@ -427,6 +483,129 @@ class PostgreSQLGateway(Gateway):
             "port"     : self.config.get("db_port",     self.DEFAULT_DB_PORT),
         }
 
+    @returns(int)
+    def get_itersize(self):
+        """
+        Returns:
+            The number of rows fetched at once when streaming the result
+            of a SELECT query (0 if streaming is disabled).
+        """
+        return int(self.config.get("itersize", self.DEFAULT_ITERSIZE))
+
+    @returns(int)
+    def get_pool_size(self):
+        """
+        Returns:
+            The maximum number of queries run simultaneously for this
+            platform (0 if queries are run in the calling thread).
+        """
+        return int(self.config.get("pool_size", self.DEFAULT_POOL_SIZE))
+
+    def get_thread_pool(self):
+        """
+        Returns:
+            The ThreadPool running the queries related to this platform.
+            It is created the first time it is needed and is stopped
+            when the reactor shuts down (see stop_thread_pool).
+        """
+        platform = self.get_platform()
+        thread_pool = PostgreSQLGateway.thread_pools.get(platform)
+        if not thread_pool:
+            thread_pool = ThreadPool(0, self.get_pool_size(), "pgsql:%s" % platform)
+            thread_pool.start()
+            PostgreSQLGateway.thread_pools[platform] = thread_pool
+
+            def stop():
+                return PostgreSQLGateway.stop_thread_pool(platform)
+            ReactorThread().addReactorEventTrigger("before", "shutdown", stop)
+        return thread_pool
+
+    @staticmethod
+    def stop_thread_pool(platform):
+        """
+        (Runs in the reactor thread when the reactor shuts down)
+        Stop the queries run by the ThreadPool of a platform, then the
+        ThreadPool itself. Its workers may be waiting for the reactor to
+        send a batch of records (see fetch_records), so they are joined
+        in the reactor ThreadPool while the reactor keeps running.
+        Args:
+            platform: The name of the platform.
+        Returns:
+            A Deferred fired once the ThreadPool is stopped, which delays
+            the shutdown of the reactor.
+        """
+        thread_pool = PostgreSQLGateway.thread_pools.pop(platform)
+        with PostgreSQLGateway.inflight_lock:
+            gateways = PostgreSQLGateway.inflight.pop(platform, set())
+        for gateway in gateways:
+            gateway.stop()
+        reactor = ReactorThread().reactor
+        return deferToThreadPool(reactor, reactor.getThreadPool(), thread_pool.stop)
+
+    @returns(bool)
+    def get_prepare(self):
+        """
+        Returns:
+            True iif filtered GET queries are run as prepared statements.
+        """
+        return bool(self.config.get("prepare", self.DEFAULT_PREPARE))
+
+    def get_connection_pool(self):
+        """
+        Returns:
+            The ThreadedConnectionPool shared by the PostgreSQLGateway
+            instances connecting to the same server with the same
+            credentials. It is created the first time it is needed and
+            keeps at least one connection open.
+        Raises:
+            psycopg2.OperationalError: if the connection cannot be established
+        """
+        psycopg2_cfg = self.make_psycopg2_config()
+        key = tuple(sorted(psycopg2_cfg.items()))
+        with PostgreSQLGateway.connection_pools_lock:
+            connection_pool = PostgreSQLGateway.connection_pools.get(key)
+            if not connection_pool:
+                max_connections = int(self.config.get("max_connections", self.DEFAULT_MAX_CONNECTIONS))
+                # Try a UNIX connection, then a TCP connection
+                unix_cfg = psycopg2_cfg.copy()
+                del unix_cfg["host"]
+                del unix_cfg["port"]
+                try:
+                    connection_pool = psycopg2.pool.ThreadedConnectionPool(
+                        1, max_connections, connection_factory = PreparedConnection, **unix_cfg
+                    )
+                except psycopg2.OperationalError:
+                    connection_pool = psycopg2.pool.ThreadedConnectionPool(
+                        1, max_connections, connection_factory = PreparedConnection, **psycopg2_cfg
+                    )
+                PostgreSQLGateway.connection_pools[key] = connection_pool
+        return connection_pool
+
+    def get_connection(self):
+        """
+        (Internal usage)
+        Retrieve the connection used by this PostgreSQLGateway. It is
+        taken from the connection pool of the platform if possible, and
+        is given back by close().
+        Raises:
+            RuntimeError: if the connection cannot be established
+        Returns:
+            The corresponding connection.
+        """
+        if self.connection is None:
+            connection_pool = self.get_connection_pool()
+            try:
+                self.connection = connection_pool.getconn()
+                self.connection_pool = connection_pool
+            except psycopg2.pool.PoolError:
+                # Every pooled connection is in use, open a dedicated one
+                Log.warning("No more pooled connection for %s, connecting" % self.platform)
+                if not (self.connect_unix() or self.connect_tcp()):
+                    raise RuntimeError("Cannot connect to PostgreSQL server")
+            if self.connection.encoding not in ["UTF8", "UNICODE"]:
+                self.connection.set_client_encoding("UNICODE")
+        return self.connection
+
     @returns(bool)
     def connect_unix(self):
         """
@@ -442,7 +621,7 @@ class PostgreSQLGateway(Gateway):
             psycopg2_cfg = self.make_psycopg2_config()
             del psycopg2_cfg["host"]
             del psycopg2_cfg["port"]
-            self.connection = psycopg2.connect(**psycopg2_cfg)
+            self.connection = psycopg2.connect(connection_factory = PreparedConnection, **psycopg2_cfg)
             return True
         except psycopg2.OperationalError:
             return False
@@ -459,29 +638,26 @@ class PostgreSQLGateway(Gateway):
             True iif successful.
         """
         psycopg2_cfg = self.make_psycopg2_config()
-        self.connection = psycopg2.connect(**psycopg2_cfg)
+        self.connection = psycopg2.connect(connection_factory = PreparedConnection, **psycopg2_cfg)
         self.connection.set_client_encoding("UNICODE")
         return True
 
-    def connect(self, cursor_factory = None): #psycopg2.extras.NamedTupleCursor
+    def connect(self, cursor_factory = None, cursor_name = None): #psycopg2.extras.NamedTupleCursor
         """
         (Internal usage)
-        Establish a connection with the PostgreSQL server
+        Establish a connection with the PostgreSQL server (see get_connection)
         Initialize self.connection
         Params:
             cursor_factory: see http://initd.org/psycopg/docs/extras.html
+            cursor_name: None for a client-side cursor, or a String
+                naming the server-side cursor to create.
+                See http://initd.org/psycopg/docs/usage.html#server-side-cursors
         Raises:
             RuntimeError: if the connection cannot be established
         Returns:
             The corresponding cursor
         """
-        connection_ok = (self.connection != None)
-        if not connection_ok:
-            connection_ok = self.connect_unix()
-        if not connection_ok: 
-            connection_ok = self.connect_tcp()
-        if not connection_ok: 
-            raise RuntimeError("Cannot connect to PostgreSQL server")
+        self.get_connection()
 
         # Needed to manage properly cascading execute(), maybe OBSOLETE 
         self.rowcount    = None
@@ -489,18 +665,34 @@ class PostgreSQLGateway(Gateway):
         self.lastrowid   = None
 
         if cursor_factory:
-            return self.connection.cursor(cursor_factory = cursor_factory)
+            return self.connection.cursor(name = cursor_name, cursor_factory = cursor_factory)
         else:
-            return self.connection.cursor()
+            return self.connection.cursor(name = cursor_name)
 
     def close(self):
         """
         Close connection established with the PostgreSQL server (if any)
+        Pooled connections are given back to their pool.
         """
         if self.connection is not None:
-            self.connection.close()
+            if self.connection_pool:
+                self.connection_pool.putconn(self.connection, close = bool(self.connection.closed))
+                self.connection_pool = None
+            else:
+                self.connection.close()
             self.connection = None
 
+    def release(self, records):
+        """
+        Stop fetching records and give back the connection (see close).
+        Args:
+            records: The iterable returned by get_records.
+        """
+        if isinstance(records, GeneratorType):
+            # Closes the underlying cursor before its connection is reused
+            records.close()
+        self.close()
+
 #OBSOLETE|    @staticmethod
 #OBSOLETE|    def param(self, name, value):
 #OBSOLETE|        if isinstance(value, NoneType):
@@ -552,10 +744,109 @@ class PostgreSQLGateway(Gateway):
     def start(self):
         """
         Fetch records stored in the postgresql database according to self.query
+        If the reactor is running, the query is run by the ThreadPool of this
+        platform and the records are sent from the reactor thread, so that
+        a slow query does not freeze the reactor.
         """
+        if self.get_pool_size() <= 0 or not ReactorThread().isReactorRunning():
+            records = self.get_records()
+            try:
+                self.send_records(records)
+            finally:
+                self.release(records)
+            return
+
+        reactor = ReactorThread().reactor
+        platform = self.get_platform()
+        thread_pool = self.get_thread_pool()
+        with PostgreSQLGateway.inflight_lock:
+            PostgreSQLGateway.inflight.setdefault(platform, set()).add(self)
+        d = deferToThreadPool(reactor, thread_pool, self.fetch_records, reactor)
+        d.addBoth(self.on_done, platform)
+        d.addCallbacks(lambda _: self.send(LastRecord()), self.on_error)
+
+    def on_done(self, result, platform):
+        """
+        Forget a query run by the ThreadPool once it is done (see start).
+        Args:
+            result: The result of fetch_records or a Failure.
+            platform: The name of the platform.
+        Returns:
+            result
+        """
+        with PostgreSQLGateway.inflight_lock:
+            PostgreSQLGateway.inflight.get(platform, set()).discard(self)
+        return result
+
+    def fetch_records(self, reactor):
+        """
+        (Runs in a thread of the ThreadPool, see start)
+        Fetch the records and send them by batches from the reactor thread.
+        This thread waits for each batch to be sent before fetching the next
+        one, so at most one batch per query is held in memory. Fetching
+        stops as soon as the Gateway is stopped (see Gateway.stop).
+        Args:
+            reactor: The reactor in charge of sending the records.
+        """
+        if self.stopped:
+            # For instance, the reactor is shutting down
+            return
+        batch_size = self.get_itersize() or self.DEFAULT_ITERSIZE
+        batch = list()
+        records = self.get_records()
+        try:
+            for record in records:
+                if self.stopped:
+                    # Stops fetching rows, see release
+                    break
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    blockingCallFromThread(reactor, map, self.send, batch)
+                    batch = list()
+            if batch and not self.stopped:
+                blockingCallFromThread(reactor, map, self.send, batch)
+        finally:
+            self.release(records)
+
+    def on_error(self, failure):
+        """
+        Report a query which failed in the ThreadPool (see start).
+        Args:
+            failure: A twisted.python.failure.Failure instance.
+        """
+        Log.error("PostgreSQLGateway: cannot process %s on %s: %s" % (self.query, self.platform, failure.getErrorMessage()))
+        self.result_value.append(ResultValue(
+            origin      = (ResultValue.GATEWAY, self.__class__.__name__, self.platform, str(self.query)),
+            type        = ResultValue.ERROR,
+            code        = ResultValue.ERROR,
+            description = failure.getErrorMessage(),
+            traceback   = failure.getTraceback()
+        ))
+        self.send(LastRecord())
+
+    def get_records(self):
+        """
+        Run self.query on the postgresql database (this call is blocking).
+        Returns:
+            An iterable of Records (GET queries are streamed, see iterselect).
+        """
+        if self.query.get_action() == ACTION_GET and self.get_prepare() and (self.query.get_where() or self.query.has_limit()):
+            # Filtered and paginated queries are typically small and frequent
+            # lookups: queries having the same shape share a prepared statement.
+            values = list()
+            statement = PostgreSQLGateway.to_sql(self.query, values)
+            Log.debug(statement)
+            try:
+                return self.execute_prepared(statement, values)
+            except Exception, e:
+                Log.warning("Cannot prepare %s: %s" % (statement, e))
+
         sql = PostgreSQLGateway.to_sql(self.query)
         Log.tmp(sql)
-        if self.query.get_action() in [ACTION_GET, ACTION_CREATE]:
+        if self.query.get_action() == ACTION_GET:
+            # Records are sent while the rows are fetched
+            return self.iterselect(sql)
+        elif self.query.get_action() == ACTION_CREATE:
             rows = self.selectall(sql)
         else:
             count = self.do(sql)
@@ -569,7 +860,19 @@ class PostgreSQLGateway(Gateway):
             else:
                 rows = list()
 
-        map(self.send, Records(rows))
+        return Records(rows)
+
+    def send_records(self, records):
+        """
+        Send a sequence of records followed by a LastRecord.
+        Args:
+            records: An iterable of Records (for instance the generator
+                returned by iterselect).
+        """
+        for record in records:
+            if self.stopped:
+                break
+            self.send(record)
         self.send(LastRecord())
        
     @staticmethod
@@ -670,6 +973,7 @@ class PostgreSQLGateway(Gateway):
     def get_metadata(self):
         if not self.metadata:
             self.metadata = self.make_metadata()
+            self.close()
         return self.metadata
 
     def do(self, query, params = None):
@@ -696,13 +1000,14 @@ class PostgreSQLGateway(Gateway):
 #OBSOLETE|
 #OBSOLETE|        return None
 
-    def execute(self, query, params = None, cursor_factory = None):
+    def execute(self, query, params = None, cursor_factory = None, cursor_name = None):
         """
         Execute a SQL query on PostgreSQL 
         Args:
             query: a String containing a SQL query 
             params: a dictionnary or None if unused 
             cursor_factory: see http://initd.org/psycopg/docs/extras.html
+            cursor_name: see connect()
         Returns:
             The corresponding cursor
         """
@@ -714,7 +1019,7 @@ class PostgreSQLGateway(Gateway):
 
         Log.debug(query)
 
-        cursor = self.connect(cursor_factory)
+        cursor = self.connect(cursor_factory, cursor_name)
         try:
             # psycopg2 requires %()s format for all parameters,
             # regardless of type.
@@ -728,7 +1033,7 @@ class PostgreSQLGateway(Gateway):
 
             if not params:
                 cursor.execute(query)
-            elif isinstance(params, StringValue):
+            elif isinstance(params, StringTypes):
                 cursor.execute(query, params)
             elif isinstance(params, dict):
                 cursor.execute(query, params)
@@ -784,6 +1089,93 @@ class PostgreSQLGateway(Gateway):
         else:
             return rows
 
+    def iterselect(self, query, params = None, itersize = None):
+        """
+        Execute a SELECT query through a server-side cursor and return
+        the resulting rows as Records. Rows are fetched by batches of
+        itersize rows and converted lazily, so unlike selectall the whole
+        result set is never held in memory.
+        Args:
+            query: a String containing a SQL SELECT query
+            params: a dictionnary or None if unused
+            itersize: The number of rows fetched at once. None means
+                that this value is read from the platform configuration.
+        Returns:
+            A generator of Record instances.
+        """
+        if itersize is None:
+            itersize = self.get_itersize()
+        if itersize <= 0:
+            return (Record(row) for row in self.selectall(query, params))
+
+        cursor = self.execute(query, params, cursor_name = "manifold_%s" % uuid4().hex)
+        return self.iter_records(cursor, itersize)
+
+    def execute_prepared(self, statement, values):
+        """
+        Execute a SELECT query as a prepared statement. A statement is
+        prepared once per connection (connections are shared, see
+        get_connection) and is named according to its text, so that
+        queries having the same shape are only planned once.
+        Note that PostgreSQL cannot DECLARE a cursor for an EXECUTE
+        statement, so the rows are fetched through a client-side cursor:
+        unlike iterselect, the whole result set is received at once. This
+        is why only filtered and paginated queries are prepared (see
+        get_records).
+        Args:
+            statement: a String containing a SQL SELECT query whose
+                parameters are denoted $1, $2, ... (see to_sql)
+            values: The list of values bound to these parameters.
+        Returns:
+            A generator of Record instances.
+        """
+        connection = self.get_connection()
+        if isinstance(statement, unicode):
+            statement = statement.encode("utf-8")
+        name = "manifold_%s" % md5(statement).hexdigest()
+        if name not in connection.prepared:
+            if len(connection.prepared) >= MAX_PREPARED_STATEMENTS:
+                self.do("DEALLOCATE ALL")
+                connection.prepared.clear()
+            self.do("PREPARE %s AS %s" % (name, statement))
+            connection.prepared.add(name)
+
+        if values:
+            params = dict(("p%d" % i, value) for i, value in enumerate(values))
+            sql = "EXECUTE %s (%s)" % (name, ", ".join(["%%(p%d)s" % i for i in range(len(values))]))
+        else:
+            params = None
+            sql = "EXECUTE %s" % name
+        cursor = self.execute(sql, params)
+        return self.iter_records(cursor, self.get_itersize() or self.DEFAULT_ITERSIZE)
+
+    def iter_records(self, cursor, itersize):
+        """
+        (Internal usage)
+        Convert lazily the rows fetched by a cursor into Records. The
+        cursor is closed once every row has been fetched.
+        Args:
+            cursor: A cursor on which a SELECT query has been executed.
+            itersize: The number of rows fetched at once.
+        Returns:
+            A generator of Record instances.
+        """
+        try:
+            schema = None
+            while True:
+                rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                if not schema:
+                    # The description of a server-side cursor is only
+                    # available once rows have been fetched
+                    schema = RecordSchema.get(column[0] for column in cursor.description)
+                for row in rows:
+                    yield Record.from_values(schema, list(row))
+        finally:
+            cursor.close()
+            self.commit()
+
 #OBSOLETE|    def fields(self, table, notnull = None, hasdef = None):
 #OBSOLETE|        """
 #OBSOLETE|        Return the names of the fields of the specified table.
@@ -869,12 +1261,17 @@ class PostgreSQLGateway(Gateway):
     @staticmethod
     #@accepts(Predicate)
     @returns(StringTypes)
-    def _to_sql_where_elt(predicate):
+    def _to_sql_where_elt(predicate, params = None):
         """
         (Internal usage)
         Translate a Predicate in the corresponding SQL clause
         Args:
             predicate: A Predicate instance
+            params: None if the values must be inlined in the SQL clause.
+                Otherwise, a list to which the bound values are appended.
+                Those values are replaced by $1, $2... in the SQL clause.
+                A list of values is bound as a single array, so that the
+                clause does not depend on the number of values.
         Returns:
             The String containing the corresponding SQL clause
         """
@@ -884,6 +1281,10 @@ class PostgreSQLGateway(Gateway):
         field, op_, value = predicate.get_tuple()
         op = None
 
+        def bind(x):
+            params.append(x)
+            return "$%d" % len(params)
+
         if isinstance(value, (list, tuple, set, frozenset)):
             # handling filters like '~slice_id':[]
             # this should return true, as it's the opposite of 'slice_id':[] which is false
@@ -907,6 +1308,9 @@ class PostgreSQLGateway(Gateway):
                     field = ""
                     op    = ""
                     value = " OR ".join(and_clauses)
+                elif params is not None and op_ not in [and_, or_]:
+                    op = "="
+                    value = "ANY(%s)" % bind(list(value))
                 else:
                     value = map(PostgreSQLGateway.quote, value)
                     if op_ == and_:
@@ -945,9 +1349,13 @@ class PostgreSQLGateway(Gateway):
                 else:
                     Log.error("_to_sql_where_elt: invalid operator: op_ = %s" % op_)
 
-                if isinstance(value, StringTypes) and value[-2:] != "()":
-                    # This is a string value and we're not calling a pgsql function
-                    # having no parameter (for instance NOW())
+                if isinstance(value, StringTypes) and value[-2:] == "()":
+                    # We're calling a pgsql function having no parameter (for instance NOW())
+                    pass
+                elif params is not None:
+                    value = bind(value)
+                elif isinstance(value, StringTypes):
+                    # This is a string value
                     value = str(PostgreSQLGateway.quote(value))
                 elif isinstance(value, datetime.datetime):
                     value = str(PostgreSQLGateway.quote(str(value)))
@@ -965,17 +1373,36 @@ class PostgreSQLGateway(Gateway):
 
     @staticmethod
     @returns(StringTypes)
-    def to_sql_where(predicates):
+    def to_sql_where(predicates, params = None):
         """
         Translate a set of Predicate instances in the corresponding SQL string
         Args:
             predicates: A set of Predicate instances (list, set, frozenset, generator, ...)
+            params: See _to_sql_where_elt.
         Returns:
             A String containing the corresponding SQL WHERE clause.
             This String is equal to "" if filters is empty
         """
         # NOTE : How to handle complex clauses
-        return " AND ".join([PostgreSQLGateway._to_sql_where_elt(predicate) for predicate in predicates])
+        return " AND ".join([PostgreSQLGateway._to_sql_where_elt(predicate, params) for predicate in predicates])
+
+    @staticmethod
+    @returns(StringTypes)
+    def to_sql_order_by(order_by):
+        """
+        Translate an ORDER BY clause in the corresponding SQL string
+        Args:
+            order_by: A list of (field name, ORDER_ASC|ORDER_DESC) tuples.
+        Returns:
+            A String containing the corresponding SQL ORDER BY clause.
+            This String is equal to "" if order_by is empty
+        """
+        if not order_by:
+            return ""
+        return "ORDER BY %s" % ", ".join([
+            "\"%s\" %s" % (field, "DESC" if direction == ORDER_DESC else "ASC")
+            for field, direction in order_by
+        ])
 
     @staticmethod
     @returns(StringTypes)
@@ -1067,15 +1494,30 @@ class PostgreSQLGateway(Gateway):
         return ", ".join(param_list)
 
     @staticmethod
-    def to_sql(query):
+    def to_sql(query, params = None):
         """
         Translate self.query in the corresponding postgresql command
         Args:
             query: A Query instance
+            params: None if the values of the WHERE clause must be inlined.
+                Otherwise, a list to which these values are appended (they
+                are replaced by $1, $2... see execute_prepared).
         Returns:
             A String containing a postgresql command 
         """
-        where = PostgreSQLGateway.to_sql_where(query.get_where())
+        where = PostgreSQLGateway.to_sql_where(query.get_where(), params)
+
+        # LIMIT and OFFSET values are bound like WHERE values so that
+        # successive pages share the same prepared statement
+        limit, offset = query.get_limit(), query.get_offset()
+        if params is not None:
+            if limit is not None:
+                params.append(limit)
+                limit = "$%d" % len(params)
+            if offset:
+                params.append(offset)
+                offset = "$%d" % len(params)
+
         action = query.get_action()
         params = query.get_params()
         fields = query.get_select()
@@ -1090,6 +1532,10 @@ class PostgreSQLGateway(Gateway):
             "param_values"    : param_values,
             # SELECT, DELETE, UPDATE
             "where"     : "WHERE %s" % where if where else "",
+            # SELECT
+            "order_by"  : PostgreSQLGateway.to_sql_order_by(query.get_order_by()),
+            "limit"     : "LIMIT %s" % limit if limit is not None else "",
+            "offset"    : "OFFSET %s" % offset if offset else "",
             # UPDATE
             "params"    : PostgreSQLGateway.to_sql_params(params),
             "returning" : "RETURNING %s" % ", ".join(fields) if fields else "",
@@ -1249,6 +1695,9 @@ class PostgreSQLGateway(Gateway):
         table.capabilities.join       = True
         table.capabilities.selection  = True
         table.capabilities.projection = True
+        table.capabilities.sort       = True
+        table.capabilities.limit      = True
+        table.capabilities.offset     = True
         Log.debug("Adding table: %s" % table)
         return table
 
@@ -1,8 +1,7 @@
-import sys, os, os.path, re, tempfile, itertools
+import sys, os, os.path, re, tempfile, itertools, copy
 import zlib, hashlib, BeautifulSoup, urllib
 import json, signal, traceback, time
-from collections                        import deque
-from datetime                           import datetime
+from datetime                           import datetime, timedelta
 from lxml                               import etree
 from StringIO                           import StringIO
 from types                              import StringTypes, ListType, InstanceType
@@ -20,13 +19,16 @@ from manifold.operators.rename          import Rename, do_rename
 from manifold.gateways                  import Gateway
 #from manifold.gateways.sfa.rspecs.SFAv1 import SFAv1Parser # as Parser
 from manifold.gateways.sfa.proxy        import SFAProxy
+from manifold.gateways.sfa.credential_cache import CredentialCache, CREDENTIAL_REFRESH_MARGIN
+from manifold.gateways.sfa.rspec_cache import RSpecCache, DEFAULT_RSPEC_CACHE_TTL, DEFAULT_RSPEC_CACHE_STALE
+from manifold.gateways.sfa.parser_pool import RSpecParserPool
 #from manifold.gateways.sfa.rspecs       import RSpecParser
 from manifold.util.callback             import Callback
+from manifold.util.keyed_lock           import KeyedLock
 from manifold.util.predicate            import contains, eq, lt, le, included
 from manifold.util.log                  import Log
 from manifold.util.misc                 import make_list
 from manifold.util.predicate            import Predicate
-from manifold.util.singleton            import Singleton
 from manifold.models                    import db
 from manifold.models.platform           import Platform 
 from manifold.models.user               import User
@@ -63,6 +65,12 @@ DEFAULT_TIMEOUT_GETVERSION = 5
 AM_SLICE_FIELDS = set(['resource', 'lease', 'flowspace', 'vms', 'username', 'sliver'])
 SLICE_KEY = 'slice_urn'
 
+# Credentials stored in the account configuration and renewed by manage()
+MANAGED_CREDENTIALS = [
+    'user_credential', 'authority_credentials', 'slice_credentials',
+    'delegated_user_credential', 'delegated_authority_credentials', 'delegated_slice_credentials'
+]
+
 class TimeOutException(Exception):
     pass
 
@@ -174,6 +182,9 @@ def unique_call_id(): return uuid.uuid4().urn
 class SFAGateway(Gateway):
     __gateway_name__ = 'sfa'
 
+    # Serializes (and coalesces) the account management per (user, platform)
+    manage_locks = KeyedLock("SFA account management")
+
 ################################################################################
 # TESTBED DEPENDENT CODE                                                       #
 ################################################################################
@@ -220,6 +231,19 @@ class SFAGateway(Gateway):
 
         defer.returnValue(parser)
 
+    def parse_rspec(self, parser, method, rspec, *args):
+        """
+        Parse an RSpec out of the reactor thread (see RSpecParserPool).
+        Args:
+            parser: The parser class returned by get_parser.
+            method: 'parse' or 'parse_manifest'.
+            rspec: A String containing the RSpec.
+            args: The other parameters passed to the parser.
+        Returns:
+            A Deferred fired with the parsed RSpec.
+        """
+        return RSpecParserPool().parse(parser, method, rspec, *args, min_size = self.config.get('rspec_parse_min_size'))
+
 ################################################################################
 # Information about the current instance of the SFA Gateway, does the platform has AM or Registry?    
     def has_am(self):
@@ -351,6 +375,26 @@ class SFAGateway(Gateway):
             raise Exception, "reference account does not exist"
         return accounts[0]
 
+    def _set_user_config(self, user_email, platform_name, config):
+        """
+        Store the configuration of an account.
+        Args:
+            user_email: The email of the user.
+            platform_name: The name of the platform.
+            config: The new configuration (dictionary).
+        Returns:
+            The updated Account.
+        """
+        account = self._get_user_account(user_email, platform_name)
+        account.config = json.dumps(config)
+        try:
+            db.add(account)
+            db.commit()
+        except:
+            db.rollback()
+            raise
+        return account
+
     def _get_user_config(self, user_email, platform_name):
         account = self._get_user_account(user_email, platform_name)
         return json.loads(account.config) if account.config else {}
@@ -392,7 +436,7 @@ class SFAGateway(Gateway):
                 try:
                     # call manage function for this managed user account to update it
                     # if the managed user account has only a private key, the credential will be retrieved
-                    user_config = yield self.manage(user_email, ref_platform_name) #, json.loads(ref_account.config))
+                    user_config = yield self.coalesce_manage(user_email, ref_platform_name) #, json.loads(ref_account.config))
                 except Exception, e:
                     traceback.print_exc()
             else:
@@ -402,7 +446,7 @@ class SFAGateway(Gateway):
             try:
                 # call manage function for a managed user account to update it
                 # if the managed user account has only a private key, the credential will be retrieved
-                user_config = yield self.manage(user_email, platform_name)
+                user_config = yield self.coalesce_manage(user_email, platform_name)
             except Exception, e:
                 traceback.print_exc()
         else:
@@ -410,6 +454,38 @@ class SFAGateway(Gateway):
 
         defer.returnValue((account.auth_type, user_config))
 
+    def coalesce_user_config(self, user_email, platform_name):
+        """
+        Same as get_user_config, but concurrent calls for a same
+        (user_email, platform_name) account are coalesced, while distinct
+        accounts are processed in parallel.
+        Returns:
+            A Deferred fired with the (auth_type, user_config) tuple.
+        """
+        return SFAGateway.manage_locks.coalesce((user_email, platform_name), self.get_user_config, user_email, platform_name)
+
+    def coalesce_manage(self, user_email, platform_name, margin = 0):
+        """
+        Same as manage, but concurrent calls for a same account (for instance
+        an account referenced by several platforms) are coalesced.
+        Returns:
+            A Deferred fired with the updated user configuration.
+        """
+        return SFAGateway.manage_locks.coalesce(("manage", user_email, platform_name), self.manage, user_email, platform_name, margin)
+
+    def watch_credentials(self, user_email, platform_name, config):
+        """
+        Schedule the background refresh of the credentials of a managed
+        account before they expire (see CredentialCache).
+        """
+        expiration = CredentialCache().get_earliest_expiration(config, MANAGED_CREDENTIALS)
+        # The refresh does not depend on the query: use a copy of this
+        # (bootstrapped) gateway which does not hold the query
+        gateway = copy.copy(self)
+        gateway.query, gateway.callback, gateway.result_value = None, None, []
+        refresh = lambda: gateway.coalesce_manage(user_email, platform_name, CREDENTIAL_REFRESH_MARGIN)
+        CredentialCache().watch((user_email, platform_name), expiration, refresh)
+
     def make_user_proxy(self, interface_url, user_config, cert_type='gid', timeout=DEFAULT_TIMEOUT):
         """
         interface (string): 'registry', 'sm' or URL
@@ -429,16 +505,12 @@ class SFAGateway(Gateway):
     # init self-signed cert, user credentials and gid
     @defer.inlineCallbacks
     def bootstrap (self):
-        try:
-            yield SFAManageToken().get_token()
-            # Cache admin config
-            _, self.admin_config = yield self.get_user_config(ADMIN_USER, self.platform)
-            assert self.admin_config, "Could not retrieve admin config"
+        # Cache admin config
+        _, self.admin_config = yield self.coalesce_user_config(ADMIN_USER, self.platform)
+        assert self.admin_config, "Could not retrieve admin config"
 
-            # Overwrite user config (reference & managed acccounts)
-            new_auth_type, new_user_config = yield self.get_user_config(self.user['email'], self.platform)
-        finally:
-            SFAManageToken().put_token()
+        # Overwrite user config (reference & managed acccounts)
+        new_auth_type, new_user_config = yield self.coalesce_user_config(self.user['email'], self.platform)
 
         try:
             if new_user_config:
@@ -768,7 +840,7 @@ class SFAGateway(Gateway):
                     # target = ple.inria / user is a PLE Admin and has creds = [ple.upmc , ple]
                     # if ple.inria starts with ple then let's use the ple credential
                     for my_auth in creds:
-                        if target.startswith(my_auth):
+                        if target.startswith(my_auth) and not SFAGateway.credential_expired(creds[my_auth]):
                             cred = creds[my_auth]
                     if not cred:
                         # XXX This should not interrupt everything, shall it ?
@@ -778,7 +850,7 @@ class SFAGateway(Gateway):
                     # No Credential for a Slice but a PI can use an Authority Credential to update a slice under its authority
                     auth_creds = self.user_config['%s%s_credentials' % (delegated, 'authority')]
                     for my_auth in auth_creds:
-                        if target.startswith(my_auth):
+                        if target.startswith(my_auth) and not SFAGateway.credential_expired(auth_creds[my_auth]):
                             cred = auth_creds[my_auth]
                     if not cred:
                         # XXX This should not interrupt everything, shall it ?
@@ -789,6 +861,9 @@ class SFAGateway(Gateway):
                     Log.warning("No cred found")
                     raise Exception , "no cred found of type %s towards %s " % (object_type, target)
 
+            # Parsed credentials are cached, this check is cheap
+            if SFAGateway.credential_expired(cred):
+                Log.warning("Credential of type %s towards %s has expired" % (object_type, target))
             return cred
         else:
             raise Exception, "Invalid credential object_type: %s" % object_type
@@ -1323,8 +1398,6 @@ class SFAGateway(Gateway):
             Log.warning('self.am_version not set, ignoring call to get_resource_lease')
             defer.returnValue({})
 
-        rspec_string = None
-
         # Do we have a way to find slices, for now we only support explicit slice names
         # Note that we will have to inject the slice name into the resource object if not done by the parsing.
         # slice - resource is a NxN relationship, not well managed so far
@@ -1386,53 +1459,13 @@ class SFAGateway(Gateway):
 #            Log.tmp("Hardcoded RSpec for IOTLAB")
 #            rspec_string = open("/var/myslice/iotlab.rspec").read()
 
-        if list_resources:
-            if list_leases:
-                api_options['list_leases'] = 'all' 
-            else:
-                api_options['list_leases'] = 'resources'
-        else:
-            if list_leases:
-                api_options['list_leases'] = 'leases'
-            else:
-                raise Exception, "Neither resources nor leases requested in ListResources"
-
-        # XXX Just because we hardcoded before
-        if not rspec_string:
-            if self.am_version['geni_api'] == 2:
-                # AM API v2 
-                result = yield self.sliceapi.ListResources([cred], api_options)
-            else:
-                # AM API v3
-                api_options['list_leases'] = 'all'
-                if slice_hrn:
-                    # XX XXXX XXX
-                    result = yield self.sliceapi.Describe([slice_urn], [cred], api_options)
-
-                    # XXX Weird: WiLab says that we don't provide slice_cred, but we are !
-                    #     In the error message on the testbed side it says:
-                    #     Not a valid url in [GeniCertificate: urn:publicid:IDN+onelab:upmc+authority+sa]: urn:uuid:a69fe2d4-29ae-4e34-b66a-4e612104fe73
-                    #     auto_add_sa: certificate does not have a URL extension
-                    #     Should be the same error that occured in Allocate
-
-                    #result {'output': 'Slice credential not provided', 'code': {'am_type': 'protogeni', 'protogeni_error_log': 'urn:publicid:IDN+wilab2.ilabt.iminds.be+log+39cf85696c0862184eb9704bf3cf837b', 'geni_code': 7, 'am_code': 7, 'protogeni_error_url': 'https://www.wilab2.ilabt.iminds.be/spewlogfile.php3?logfile=39cf85696c0862184eb9704bf3cf837b'}, 'value': 0}
-                    try:
-                        if 'value' in result and 'geni_rspec' in result['value']:
-                            result['value'] = result['value']['geni_rspec']
-                    except Exception, e:
-                        Log.warning("Exception in result: %r" % result)
-                        defer.returnValue({})
-                else:
-                    result = yield self.sliceapi.ListResources([cred], api_options)
-                    
-            if not 'value' in result or not result['value']:
-                Log.warning("Exception in result: %r" % result)
-                defer.returnValue({})
+        if not list_resources and not list_leases:
+            raise Exception, "Neither resources nor leases requested in ListResources"
 
-            rspec_string = result['value']
-
-            #Log.warning("advertisement RSpec")
-            #Log.warning(rspec_string)
+        # Resources and leases are always listed together (AM API v3 always
+        # lists both), so that the calls issued for resources and for leases
+        # are merged (see RSpecCache and SFAProxy): callers pick what they need.
+        api_options['list_leases'] = 'all'
 
         # rspec_type and rspec_version should be set in the config of the platform,
         # we use GENIv3 as default one if not
@@ -1440,15 +1473,75 @@ class SFAGateway(Gateway):
             rspec_version = self.config['rspec_type'] + ' ' + self.config['rspec_version']
         else:
             rspec_version = 'GENI 3'
-       
+
+        # Manifests are specific to a slice (and a user): they are not cached
+        ttl = int(self.config.get('rspec_cache_ttl', DEFAULT_RSPEC_CACHE_TTL))
+        if slice_urn or not ttl:
+            rsrc_slice = yield self._fetch_resource_lease(cred, api_options, rspec_version, slice_urn)
+            defer.returnValue(rsrc_slice)
+
+        # Advertisements are shared by all the users (see RSpecCache)
+        key = (self.platform, rspec_version)
+        stale = int(self.config.get('rspec_cache_stale', DEFAULT_RSPEC_CACHE_STALE))
+        fetch = lambda: self._fetch_resource_lease(cred, dict(api_options, call_id = unique_call_id()), rspec_version)
+        rsrc_slice = yield RSpecCache().get(key, fetch, ttl, stale)
+        defer.returnValue(rsrc_slice)
+
+    @defer.inlineCallbacks
+    def _fetch_resource_lease(self, cred, api_options, rspec_version, slice_urn = None):
+        """
+        Call ListResources (or Describe) on the AM and parse the resulting RSpec.
+        Args:
+            cred: The credential passed to the AM.
+            api_options: The options passed to the AM.
+            rspec_version: The version of the RSpec (for instance 'GENI 3').
+            slice_urn: The URN of the slice (manifest RSpec) or None
+                (advertisement RSpec).
+        Returns:
+            A Deferred fired with a dictionary containing the parsed
+            resources, leases... ({} if the call failed).
+        """
+        slice_hrn, _ = urn_to_hrn(slice_urn) if slice_urn else (None, None)
+        if self.am_version['geni_api'] == 2:
+            # AM API v2 
+            result = yield self.sliceapi.ListResources([cred], api_options)
+        else:
+            # AM API v3
+            if slice_hrn:
+                # XX XXXX XXX
+                result = yield self.sliceapi.Describe([slice_urn], [cred], api_options)
+
+                # XXX Weird: WiLab says that we don't provide slice_cred, but we are !
+                #     In the error message on the testbed side it says:
+                #     Not a valid url in [GeniCertificate: urn:publicid:IDN+onelab:upmc+authority+sa]: urn:uuid:a69fe2d4-29ae-4e34-b66a-4e612104fe73
+                #     auto_add_sa: certificate does not have a URL extension
+                #     Should be the same error that occured in Allocate
+
+                #result {'output': 'Slice credential not provided', 'code': {'am_type': 'protogeni', 'protogeni_error_log': 'urn:publicid:IDN+wilab2.ilabt.iminds.be+log+39cf85696c0862184eb9704bf3cf837b', 'geni_code': 7, 'am_code': 7, 'protogeni_error_url': 'https://www.wilab2.ilabt.iminds.be/spewlogfile.php3?logfile=39cf85696c0862184eb9704bf3cf837b'}, 'value': 0}
+                try:
+                    if 'value' in result and 'geni_rspec' in result['value']:
+                        result['value'] = result['value']['geni_rspec']
+                except Exception, e:
+                    Log.warning("Exception in result: %r" % result)
+                    defer.returnValue({})
+            else:
+                result = yield self.sliceapi.ListResources([cred], api_options)
+                    
+        if not 'value' in result or not result['value']:
+            Log.warning("Exception in result: %r" % result)
+            defer.returnValue({})
+
+        rspec_string = result['value']
+
+        #Log.warning("advertisement RSpec")
+        #Log.warning(rspec_string)
+
         parser = yield self.get_parser()
 
         if slice_hrn:
             Log.warning("MANIFEST RSPEC FROM ListResources/Describe from %r : %r" % (self.platform, rspec_string))
-        if parser in [WiLabtParser, VirtualWallParser]:
-            rsrc_slice = parser.parse_manifest(rspec_string, rspec_version, slice_urn)
-        else:
-            rsrc_slice = parser.parse(rspec_string, rspec_version, slice_urn)
+        method = 'parse_manifest' if parser in [WiLabtParser, VirtualWallParser] else 'parse'
+        rsrc_slice = yield self.parse_rspec(parser, method, rspec_string, rspec_version, slice_urn)
 
         # Make records
         rsrc_slice['resource'] = Records(rsrc_slice['resource'])
@@ -1610,7 +1703,7 @@ class SFAGateway(Gateway):
                     else:
                         Log.warning("this resource %s is not for this AM %s" % (r.attrib['component_id'], interface_hrn))
                         defer.returnValue(list())
-                rspec = parser.parse(xml, rspec_version, slice_urn)
+                rspec = yield self.parse_rspec(parser, 'parse', xml, rspec_version, slice_urn)
                 Log.warning(rspec)
 
             rspec['xml'] = xml
@@ -2161,9 +2254,9 @@ class SFAGateway(Gateway):
 
         if parser in [WiLabtParser, VirtualWallParser]:
             # start_time is defined in the leases
-            rsrc_slice = parser.parse_manifest(manifest_rspec, rspec_version, slice_urn, start_time)
+            rsrc_slice = yield self.parse_rspec(parser, 'parse_manifest', manifest_rspec, rspec_version, slice_urn, start_time)
         else:
-            rsrc_slice = parser.parse(manifest_rspec, rspec_version, slice_urn)
+            rsrc_slice = yield self.parse_rspec(parser, 'parse', manifest_rspec, rspec_version, slice_urn)
 
         # Make records
         rsrc_slice['resource'] = Records(rsrc_slice['resource'])
@@ -2537,7 +2630,7 @@ class SFAGateway(Gateway):
 
     # TEST = PRESENT and NOT EXPIRED
     @staticmethod
-    def credentials_needed(cred_name, config):
+    def credentials_needed(cred_name, config, margin = 0):
         # TODO: optimize this function in the case that the user has no authority_credential and no slice_credential, it's executed each time !!!
         # Initialize
         need_credential = None
@@ -2556,39 +2649,36 @@ class SFAGateway(Gateway):
                     # check expiration of each credential
                     for cred in config[cred_name].values():
                         # if one of the credentials is expired, we need to get a new one from SFA Registry
-                        if SFAGateway.credential_expired(cred):
+                        if SFAGateway.credential_expired(cred, margin):
                             need_credential = True
                             #return True
                         else:
                             need_credential = False
                 else:
                     # check expiration of the credential
-                    need_credential = SFAGateway.credential_expired(config[cred_name])
+                    need_credential = SFAGateway.credential_expired(config[cred_name], margin)
         # TODO: check all cases instead of tweaking like that
         if need_credential is None:
             need_credential = True
         return need_credential
 
     @staticmethod
-    def credential_expired(cred):
-        # if the cred passed as argument is not an object
-        if not isinstance (cred, Credential):
-            # from a string to a credential object to check expiration
-            cred = Credential(string=cred)
-
-        # check expiration of credentials
-        return cred.get_expiration() < datetime.now()
+    def credential_expired(cred, margin = 0):
+        # check expiration of credentials (or whether they expire within
+        # margin seconds), credential strings are parsed once (see CredentialCache)
+        return CredentialCache().get_expiration(cred) < datetime.now() + timedelta(seconds = margin)
    
     ############################################################################ 
     # ACCOUNT MANAGEMENT
     ############################################################################ 
     # using defer to have an asynchronous results management in functions prefixed by yield
     @defer.inlineCallbacks
-    def manage(self, user_email, platform_name):
+    def manage(self, user_email, platform_name, margin = 0):
         """
         Parameters:
             user (str) : user email
             platform: string
+            margin (int) : credentials expiring within margin seconds are renewed
         """
         # TODO Avoid to call Manage multiple times !
 
@@ -2664,8 +2754,8 @@ class SFAGateway(Gateway):
         # 
         # The order can be found using a reverse topological sort (tsort)
         # 
-        need_delegated_slice_credentials = not is_admin and SFAGateway.credentials_needed('delegated_slice_credentials', config)
-        need_delegated_authority_credentials = not is_admin and SFAGateway.credentials_needed('delegated_authority_credentials', config)
+        need_delegated_slice_credentials = not is_admin and SFAGateway.credentials_needed('delegated_slice_credentials', config, margin)
+        need_delegated_authority_credentials = not is_admin and SFAGateway.credentials_needed('delegated_authority_credentials', config, margin)
         need_slice_credentials = need_delegated_slice_credentials
         # Why do we need slice credentials for admin user???
         #need_slice_credentials = is_admin or need_delegated_slice_credentials
@@ -2682,7 +2772,7 @@ class SFAGateway(Gateway):
         need_authority_credentials = is_admin or need_delegated_authority_credentials
         #need_authority_credentials = need_delegated_authority_credentials
         need_authority_list = need_authority_credentials
-        need_delegated_user_credential = not is_admin and SFAGateway.credentials_needed('delegated_user_credential', config)
+        need_delegated_user_credential = not is_admin and SFAGateway.credentials_needed('delegated_user_credential', config, margin)
 
         need_gid = not 'gid' in config
         need_user_credential = is_admin or need_authority_credentials or need_slice_list or need_slice_credentials or need_delegated_user_credential or need_gid
@@ -2730,7 +2820,7 @@ class SFAGateway(Gateway):
 
         # create an SFA connexion to Registry, using user config
         registry_proxy = self.make_user_proxy(platform_config['registry'], config, 'sscert', timeout=platform_config.get('timeout', DEFAULT_TIMEOUT))
-        if need_user_credential and SFAGateway.credentials_needed('user_credential', config):
+        if need_user_credential and SFAGateway.credentials_needed('user_credential', config, margin):
             Log.debug("Requesting user credential for user %s toward Registry %s" % (user_email, platform_config['registry']))
             try:
                 config['user_credential'] = yield registry_proxy.GetSelfCredential (config['sscert'], config['user_hrn'], 'user')
@@ -2817,39 +2907,17 @@ class SFAGateway(Gateway):
                 config['delegated_slice_credentials'][slice_hrn] = delegated_slice_cred
 
         if config != old_config:
-            account = self._get_user_account(user_email, platform_name)
-            account.config = json.dumps(config)
-            db.add(account)
-            db.commit()
+            account = self._set_user_config(user_email, platform_name, config)
+            # The Interface keeps the user configurations in memory
+            if self.interface:
+                self.interface.invalidate_user_configs(account.user_id, account.platform_id)
+
+        # Renew the credentials in background before they expire
+        self.watch_credentials(user_email, platform_name, config)
 
         # return using asynchronous defer
         defer.returnValue(config)
 
-class SFAManageToken(object):
-    """
-    This singleton class is meant to regulate accesses to the Manage function in SFA GW
-    """
-    __metaclass__ = Singleton
-
-    def __init__(self):
-        self.busy     = False
-        self.queue    = deque()
-
-    def get_token(self):
-        if self.busy:
-            d = defer.Deferred()
-            self.queue.append(d)
-            return d
-        else:
-            self.busy = True
-            return True
-
-    def put_token(self):
-        self.busy = False
-        if self.queue:
-            d = self.queue.popleft()
-            d.callback(True)
-
 def sfa_trust_credential_delegate(self, delegee_gidfile, caller_keyfile, caller_gidfile):
     """
     Return a delegated copy of this credential, delegated to the 
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Parsing a SFA credential (XML and signature) is expensive. The
+# CredentialCache memoizes the expiration and the target of each
+# credential, keyed by the digest of its string. It also maintains an
+# expiry index of the managed accounts, so that their credentials are
+# refreshed in background (see CREDENTIAL_REFRESH_MARGIN) instead of
+# on the request path.
+
+import hashlib, heapq
+from collections                    import OrderedDict
+from datetime                       import datetime, timedelta
+from twisted.internet               import defer
+from twisted.internet.task          import LoopingCall
+
+from manifold.util.log              import Log
+from manifold.util.reactor_thread   import ReactorThread
+from manifold.util.singleton        import Singleton
+
+from sfa.trust.credential           import Credential
+
+# Maximum number of parsed credentials kept in memory
+CREDENTIAL_CACHE_SIZE     = 10000
+# Period (in seconds) between two background refresh rounds
+CREDENTIAL_REFRESH_PERIOD = 300
+# Credentials are refreshed this number of seconds before they expire
+CREDENTIAL_REFRESH_MARGIN = 3600
+
+class CredentialCache(object):
+    """
+    Process-wide cache of parsed credentials and expiry index of the
+    managed accounts.
+    """
+    __metaclass__ = Singleton
+
+    def __init__(self):
+        # {digest : (expiration, target hrn)} (LRU)
+        self.credentials = OrderedDict()
+        # {account key : (expiration, refresh function)}
+        self.accounts    = dict()
+        # Heap of (expiration, account key), possibly containing outdated entries
+        self.expirations = list()
+        # {account key : expiration} of the accounts being refreshed
+        self.refreshing  = dict()
+        self.loop        = None
+
+    @staticmethod
+    def get_digest(credential):
+        """
+        Args:
+            credential: A String containing a credential.
+        Returns:
+            The digest identifying this credential in the cache.
+        """
+        if isinstance(credential, unicode):
+            credential = credential.encode('utf-8')
+        return hashlib.sha1(credential).hexdigest()
+
+    def get(self, credential):
+        """
+        Args:
+            credential: A String or a Credential instance.
+        Returns:
+            The (expiration, target hrn) tuple related to this credential.
+            The target hrn is None if it cannot be retrieved.
+        """
+        if isinstance(credential, Credential):
+            return self.parse(credential)
+
+        digest = self.get_digest(credential)
+        info = self.credentials.pop(digest, None)
+        if info is None:
+            info = self.parse(Credential(string = credential))
+            while len(self.credentials) >= CREDENTIAL_CACHE_SIZE:
+                self.credentials.popitem(last = False)
+        self.credentials[digest] = info
+        return info
+
+    @staticmethod
+    def parse(credential):
+        """
+        Args:
+            credential: A Credential instance.
+        Returns:
+            The (expiration, target hrn) tuple related to this credential.
+        """
+        try:
+            target = credential.get_gid_object().get_hrn()
+        except Exception:
+            target = None
+        return (credential.get_expiration(), target)
+
+    def get_expiration(self, credential):
+        """
+        Args:
+            credential: A String or a Credential instance.
+        Returns:
+            The expiration date of this credential.
+        """
+        return self.get(credential)[0]
+
+    def get_earliest_expiration(self, config, cred_names):
+        """
+        Args:
+            config: An account configuration (dictionary).
+            cred_names: The keys of config storing a credential or a
+                dictionary of credentials.
+        Returns:
+            The earliest expiration date of these credentials, None if
+            there is no such credential.
+        """
+        expirations = list()
+        for cred_name in cred_names:
+            creds = config.get(cred_name)
+            if not creds:
+                continue
+            for cred in (creds.values() if isinstance(creds, dict) else [creds]):
+                try:
+                    expirations.append(self.get_expiration(cred))
+                except Exception, e:
+                    Log.warning("Cannot parse %s: %s" % (cred_name, e))
+        return min(expirations) if expirations else None
+
+    def watch(self, key, expiration, refresh):
+        """
+        Register (or update) an account whose credentials must be refreshed
+        before they expire.
+        Args:
+            key: A hashable identifying the account, e.g. (user_email, platform).
+            expiration: The earliest expiration date of its credentials,
+                None to unregister this account.
+            refresh: A function (possibly returning a Deferred) refreshing
+                the credentials of this account.
+        """
+        if expiration is None:
+            self.accounts.pop(key, None)
+            return
+        previous = self.refreshing.pop(key, None)
+        if previous is not None and expiration <= previous:
+            # The refresh did not renew the credentials: do not retry them
+            # at each round, the account is managed again on the request path.
+            Log.warning("Credentials of %r were not renewed (expiration: %s)" % (key, expiration))
+            self.accounts.pop(key, None)
+            return
+        account = self.accounts.get(key)
+        self.accounts[key] = (expiration, refresh)
+        if not account or account[0] != expiration:
+            heapq.heappush(self.expirations, (expiration, key))
+        self.start()
+
+    def start(self):
+        """
+        Start the background refresh (once).
+        """
+        if self.loop:
+            return
+        self.loop = LoopingCall(self.refresh)
+        self.loop.clock = ReactorThread().reactor
+        ReactorThread().callInReactor(self.loop.start, CREDENTIAL_REFRESH_PERIOD, False)
+
+    def refresh(self):
+        """
+        Refresh the accounts whose credentials expire within the next
+        CREDENTIAL_REFRESH_MARGIN seconds. A refreshed account is expected
+        to be registered again (see watch).
+        """
+        deadline = datetime.now() + timedelta(seconds = CREDENTIAL_REFRESH_MARGIN)
+
+        due = list()
+        while self.expirations and self.expirations[0][0] < deadline:
+            expiration, key = heapq.heappop(self.expirations)
+            account = self.accounts.get(key)
+            if not account or account[0] != expiration:
+                # Outdated entry
+                continue
+            del self.accounts[key]
+            self.refreshing[key] = expiration
+            due.append((key, expiration, account[1]))
+
+        for key, expiration, refresh in due:
+            Log.info("Refreshing credentials of %r (expiration: %s)" % (key, expiration))
+            d = defer.maybeDeferred(refresh)
+            d.addErrback(self.on_refresh_error, key)
+
+    def on_refresh_error(self, failure, key):
+        """
+        Report an account whose credentials cannot be refreshed. It is no
+        longer watched, until it is managed again on the request path.
+        Args:
+            failure: A twisted.python.failure.Failure instance.
+            key: The key identifying the account.
+        """
+        self.refreshing.pop(key, None)
+        Log.warning("Cannot refresh credentials of %r: %s" % (key, failure.getErrorMessage()))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Parsing a large RSpec (several MB for PLE or IoT-LAB advertisements)
+# takes seconds of CPU. The RSpecParserPool runs the parsers in a
+# bounded pool of worker processes, so that the reactor thread is not
+# blocked meanwhile. The parser class is passed by name and the parsed
+# RSpec is sent back as plain (picklable) dictionaries, lists and tuples.
+# Small RSpecs, for which the IPC costs more than the parsing, are
+# parsed in the calling thread.
+#
+# The worker processes are forked by RSpecParserPool.start, which must
+# be called at startup, before any thread is started: a process forked
+# while other threads hold locks (logging, imports...) may deadlock.
+
+import multiprocessing
+from types                              import StringTypes
+from twisted.internet                   import defer
+from twisted.internet.threads           import deferToThreadPool
+from twisted.python.threadpool          import ThreadPool
+
+from manifold.core.record               import Record
+from manifold.util.log                  import Log
+from manifold.util.reactor_thread       import ReactorThread
+from manifold.util.singleton            import Singleton
+
+from manifold.gateways.sfa.rspecs.nitos_broker  import NITOSBrokerParser, FitNitosParis
+from manifold.gateways.sfa.rspecs.ofelia_ocf    import OfeliaOcfParser
+from manifold.gateways.sfa.rspecs.ofelia_vt     import OfeliaVTAMParser
+from manifold.gateways.sfa.rspecs.sfawrap       import SFAWrapParser, PLEParser, WiLabtParser, VirtualWallParser, IoTLABParser, LaboraParser
+from manifold.gateways.sfa.rspecs.loose         import LooseParser
+
+# Default number of worker processes, 0 disables the pool
+DEFAULT_PARSER_POOL_SIZE = max(1, multiprocessing.cpu_count() / 2)
+
+# Default size (in bytes) under which an RSpec is parsed in the calling thread
+DEFAULT_PARSER_MIN_SIZE  = 256 * 1024
+
+# The parsers which can be run by the worker processes: {name : class}
+PARSERS = dict((parser.__name__, parser) for parser in [
+    NITOSBrokerParser, FitNitosParis, OfeliaOcfParser, OfeliaVTAMParser, SFAWrapParser,
+    PLEParser, WiLabtParser, VirtualWallParser, IoTLABParser, LaboraParser, LooseParser
+])
+
+def to_plain(value):
+    """
+    Args:
+        value: A value returned by a parser.
+    Returns:
+        The same value made of builtin types only (Records, SFA elements
+        and lxml strings are converted), so that it can be pickled.
+    """
+    if isinstance(value, (dict, Record)):
+        return dict((key, to_plain(v)) for key, v in value.items())
+    elif isinstance(value, tuple):
+        return tuple(to_plain(v) for v in value)
+    elif isinstance(value, list):
+        return [to_plain(v) for v in value]
+    elif isinstance(value, StringTypes):
+        # lxml "smart strings" keep a reference to their XML tree
+        return unicode(value) if isinstance(value, unicode) else str(value)
+    return value
+
+def parse_rspec(parser_name, method, *args):
+    """
+    (Runs in a worker process, see RSpecParserPool)
+    Args:
+        parser_name: The name of the parser class (see PARSERS).
+        method: The name of the parsing classmethod ('parse' or 'parse_manifest').
+        args: The parameters passed to this classmethod.
+    Returns:
+        The parsed RSpec (see to_plain).
+    """
+    return to_plain(getattr(PARSERS[parser_name], method)(*args))
+
+class RSpecParserPool(object):
+    """
+    Process-wide pool of RSpec parsing processes.
+    """
+    __metaclass__ = Singleton
+
+    def __init__(self, pool_size = DEFAULT_PARSER_POOL_SIZE):
+        """
+        Constructor.
+        Args:
+            pool_size: The number of worker processes.
+        """
+        self.pool_size   = pool_size
+        self.pool        = None
+        # Each thread of this ThreadPool waits for a worker process
+        self.thread_pool = None
+
+    def start(self):
+        """
+        Fork the worker processes (once). This must be done before any
+        thread is started (see the header of this module). The pool is
+        stopped when the reactor shuts down.
+        """
+        if self.pool or self.pool_size <= 0:
+            return
+        self.pool = multiprocessing.Pool(self.pool_size)
+        self.thread_pool = ThreadPool(0, self.pool_size, "rspec parser")
+        self.thread_pool.start()
+
+        def stop():
+            self.thread_pool.stop()
+            self.pool.terminate()
+            self.pool, self.thread_pool = None, None
+        ReactorThread().addReactorEventTrigger("before", "shutdown", stop)
+
+    def parse(self, parser, method, rspec, *args, **kwargs):
+        """
+        Parse an RSpec.
+        Args:
+            parser: The parser class (see SFAGateway.get_parser).
+            method: The name of the parsing classmethod ('parse' or 'parse_manifest').
+            rspec: A String containing the RSpec.
+            args: The other parameters of this classmethod (rspec version...).
+            min_size: (keyword) RSpecs smaller than min_size bytes are
+                parsed in the calling thread (default DEFAULT_PARSER_MIN_SIZE).
+        Returns:
+            A Deferred fired with the parsed RSpec.
+        """
+        min_size = kwargs.pop('min_size', None)
+        if min_size is None:
+            min_size = DEFAULT_PARSER_MIN_SIZE
+        args = (rspec,) + args
+
+        # Without worker processes (see start), RSpecs are parsed in the calling thread
+        if not self.pool or len(rspec) < int(min_size) \
+        or parser.__name__ not in PARSERS or not ReactorThread().isReactorRunning():
+            return defer.maybeDeferred(getattr(parser, method), *args)
+
+        Log.debug("Parsing a %d bytes RSpec with %s in a worker process" % (len(rspec), parser.__name__))
+        return deferToThreadPool(ReactorThread().reactor, self.thread_pool, self.pool.apply, parse_rspec, (parser.__name__, method) + args)
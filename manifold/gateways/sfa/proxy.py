@@ -20,6 +20,7 @@ import os, sys, tempfile, time
 from types                        import StringTypes
 from manifold.util.reactor_thread import ReactorThread
 from manifold.util.log            import Log
+from manifold.util.single_flight  import SingleFlight
 from twisted.internet             import ssl
 from OpenSSL.crypto               import TYPE_RSA, FILETYPE_PEM
 from OpenSSL.crypto               import load_certificate, load_privatekey
@@ -30,6 +31,9 @@ DEFAULT_TIMEOUT = 20
 AGGREGATE_CALLS = ['GetVersion', 'ListResources']
 REGISTRY_CALLS = ['GetVersion', 'Resolve', 'Update', 'Delete', 'Register']
 
+# Read-only calls, identical calls in flight are coalesced (see SingleFlight)
+COALESCED_CALLS = ['GetVersion', 'ListResources', 'Describe', 'Status', 'SliverStatus', 'Resolve', 'List', 'GetSelfCredential', 'GetCredential']
+
 ARG_SNIFF_CRED  = "<?xml version=\"1.0\"?>\n<signed-credential "
 ARG_SNIFF_RSPEC = "<?xml version=\"1.0\"?>\n<rspec "
 
@@ -132,6 +136,9 @@ class SFAProxy(object):
     # Twisted HTTPS/XMLRPC inspired from
     # http://twistedmatrix.com/pipermail/twisted-python/2007-May/015357.html
 
+    # Identical calls in flight, shared by all the SFAProxy instances
+    coalescer = SingleFlight("SFAProxy")
+
 #DEPRECATED#    def makeSSLContext(self, client_pem, trusted_ca_pem_list):
 #DEPRECATED#        '''Returns an ssl Context Object
 #DEPRECATED#       @param myKey a pem formated key and certifcate with for my current host
@@ -314,7 +321,8 @@ class SFAProxy(object):
                 self.arg1 = printable_args[1:]
                 Log.debug("SFA CALL %s(%s) - interface = %s" % (printable_args[0], printable_args[1:], self.interface))
                 print("SFA CALL %s(%s) - interface = %s" % (printable_args[0], printable_args[1:], self.interface))
-                self.proxy.callRemote(*args).addCallbacks(proxy_success_cb, proxy_error_cb)
+                key = SingleFlight.get_key(self.interface, name, args[1:]) if name in COALESCED_CALLS else None
+                SFAProxy.coalescer.call(key, self.proxy.callRemote, *args).addCallbacks(proxy_success_cb, proxy_error_cb)
                 
             ReactorThread().callInReactor(wrap, self, args)
             return d
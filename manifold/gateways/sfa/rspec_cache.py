@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# The advertisement RSpec of an aggregate does not depend on the user
+# and changes slowly. The RSpecCache stores the parsed advertisements
+# (resources and leases) of each aggregate, shared by all the users:
+# - an entry younger than its TTL is returned as is;
+# - a stale entry is returned while it is refreshed in background;
+# - an entry older than TTL + max staleness is fetched again;
+# - concurrent fetches of a same entry are coalesced.
+# Manifests (Describe, ListResources on a slice) are never cached.
+
+import copy, time
+from twisted.internet               import defer
+
+from manifold.util.keyed_lock       import KeyedLock
+from manifold.util.log              import Log
+from manifold.util.reactor_thread   import ReactorThread
+from manifold.util.singleton        import Singleton
+
+# Default lifetime (in seconds) of a cached advertisement, 0 disables the cache
+DEFAULT_RSPEC_CACHE_TTL   = 300
+# Default duration (in seconds) during which an expired advertisement is
+# still returned while being refreshed
+DEFAULT_RSPEC_CACHE_STALE = 3600
+
+class RSpecCache(object):
+    """
+    Process-wide cache of parsed advertisement RSpecs.
+    """
+    __metaclass__ = Singleton
+
+    def __init__(self):
+        # {key : (timestamp, parsed advertisement)}
+        self.entries = dict()
+        self.locks   = KeyedLock("RSpec cache")
+        # Statistics
+        self.hits    = 0
+        self.stales  = 0
+        self.misses  = 0
+
+    def get(self, key, fetch, ttl = DEFAULT_RSPEC_CACHE_TTL, stale = DEFAULT_RSPEC_CACHE_STALE):
+        """
+        Args:
+            key: A hashable identifying the advertisement, typically
+                (platform, rspec version).
+            fetch: A function returning a Deferred fired with the
+                parsed advertisement.
+            ttl: The number of seconds during which a cached
+                advertisement is fresh.
+            stale: The number of seconds during which an expired
+                advertisement can still be returned.
+        Returns:
+            A Deferred fired with (a copy of) the parsed advertisement.
+        """
+        entry = self.entries.get(key)
+        if entry:
+            timestamp, value = entry
+            age = time.time() - timestamp
+            if age < ttl:
+                self.hits += 1
+                return defer.succeed(copy.deepcopy(value))
+            if age < ttl + stale:
+                self.stales += 1
+                self.revalidate(key, fetch)
+                return defer.succeed(copy.deepcopy(value))
+            del self.entries[key]
+
+        self.misses += 1
+        return self.fetch(key, fetch).addCallback(copy.deepcopy)
+
+    def fetch(self, key, fetch):
+        """
+        Fetch an advertisement and store it. Concurrent fetches are coalesced.
+        Args:
+            key: See get.
+            fetch: See get.
+        Returns:
+            A Deferred fired with the parsed advertisement.
+        """
+        def store(value):
+            # Failed calls return empty results, they are not cached
+            if value:
+                self.entries[key] = (time.time(), value)
+            return value
+        return self.locks.coalesce(key, lambda: fetch().addCallback(store))
+
+    def revalidate(self, key, fetch):
+        """
+        Refresh an advertisement in background, unless a fetch is in progress.
+        Args:
+            key: See get.
+            fetch: See get.
+        """
+        if key in self.locks.inflight:
+            return
+        def refresh():
+            d = self.fetch(key, fetch)
+            d.addErrback(lambda failure: Log.warning("Cannot refresh advertisement %r: %s" % (key, failure.getErrorMessage())))
+        ReactorThread().callInReactor(refresh)
+
+    def invalidate(self, key = None):
+        """
+        Args:
+            key: The key of the advertisement to remove, None to clear the cache.
+        """
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key, None)
+
+    def get_stats(self):
+        """
+        Returns:
+            A dictionary summarizing the use of this RSpecCache.
+        """
+        return {
+            "entries" : len(self.entries),
+            "hits"    : self.hits,
+            "stales"  : self.stales,
+            "misses"  : self.misses
+        }
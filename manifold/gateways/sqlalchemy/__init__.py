@@ -1,7 +1,4 @@
 from __future__                 import absolute_import
-from sqlalchemy                 import create_engine
-from sqlalchemy.ext.declarative import declarative_base, declared_attr
-from sqlalchemy.orm             import sessionmaker
 from sqlalchemy.exc             import SQLAlchemyError
 
 from manifold.conf              import ADMIN_USER
@@ -9,6 +6,7 @@ from manifold.gateways          import Gateway
 from manifold.util.log          import Log
 from manifold.util.predicate    import included
 from manifold.core.record       import Record, LastRecord
+from manifold.core.query        import ORDER_DESC, ParameterError
 
 from manifold.models            import db
 from manifold.models.account    import Account
@@ -73,25 +71,10 @@ class SQLAlchemyGateway(Gateway):
 
         super(SQLAlchemyGateway, self).__init__(router, platform, query, config, user_config, user)
 
-        from manifold.models.base import Base
-        Base = declarative_base(cls=Base)
-        
-        # Models
-        from manifold.models.platform   import Platform as DBPlatform 
-        from manifold.models.user       import User     as DBUser
-        from manifold.models.account    import Account  as DBAccount
-        from manifold.models.session    import Session  as DBSession
-
-        engine = create_engine(config['url'], echo=False, pool_recycle=3600)
-        
-        Base.metadata.create_all(engine)
-        
-        Session = sessionmaker(bind=engine)
-        self.db = Session()
-        
-        # Create a session
-        #Session = sessionmaker()
-        #Session.configure(bind=engine)
+        # The engine and the (thread-local) sessions are shared by every
+        # SQLAlchemyGateway, see manifold.models. The tables are created
+        # by manifold-init-db.
+        self.db = db
 
     def local_query_get(self, query):
         #
@@ -118,6 +101,18 @@ class SQLAlchemyGateway(Gateway):
             if self.user and cls.restrict_to_self and self.user['email'] != ADMIN_USER:
                 res = res.filter(cls.user_id == self.user['user_id'])
         except AttributeError: pass
+
+        # ORDER BY, LIMIT, OFFSET
+        for field, direction in query.get_order_by():
+            if field not in cls.__table__.columns:
+                raise ParameterError("Cannot sort %s by unknown field %r" % (query.object, field))
+            column = getattr(cls, field)
+            res = res.order_by(column.desc() if direction == ORDER_DESC else column.asc())
+        if query.get_offset():
+            res = res.offset(query.get_offset())
+        if query.get_limit() is not None:
+            res = res.limit(query.get_limit())
+
         try:
             tuplelist = res.all()
             return tuplelist
@@ -89,12 +89,30 @@ class TDMIGateway(PostgreSQLGateway):
         # order to support queries involving the traceroute table in a JOIN.
         self.get_metadata()
 
-    def start(self):
+    @staticmethod
+    def repack(instance, query, records):
+        """
+        Lazily repack the records related to a pseudo table.
+        Args:
+            instance: The object handling the pseudo table (see METHOD_MAP).
+            query: The Query instance handled by this TDMIGateway.
+            records: An iterable of Records.
+        Returns:
+            A generator of repacked Records.
+        """
+        for record in records:
+            # Some repack methods update the record in place and return None
+            repacked = instance.repack(query, record)
+            yield repacked if repacked is not None else record
+
+    def get_records(self):
         """
         Translate self.get_query() into the corresponding SQL command.
-        The PostgreSQL's get_sql method is overloaded in order to redirect
+        The PostgreSQL's get_records method is overloaded in order to redirect
         handle queries related to pseudo tables (traceroute, bgp, ...) and craft a
         customized query.
+        Returns:
+            An iterable of Records.
         """
         query = self.get_query()
         table_name = query.get_from()
@@ -105,20 +123,19 @@ class TDMIGateway(PostgreSQLGateway):
                 params = None
                 instance = self.METHOD_MAP[table_name](query, db = self)
                 sql = instance.get_sql()
-                rows = self.selectall(sql, params)
+                records = self.iterselect(sql, params)
 
-                # Does this object tweak the python dictionnary returned by selectall?
+                # Does this object tweak the records returned by iterselect?
                 if instance.need_repack and instance.repack:
                     if instance.need_repack(query):
-                        rows = [instance.repack(query, row) for row in rows]
+                        records = TDMIGateway.repack(instance, query, records)
             else:
                 # Dummy object, like hops (hops is declared in tdmi.h) but
                 # do not corresponds to any 
-                rows = list()
+                records = list()
 
-            map(self.send, Records(rows))
-            self.send(LastRecord())
+            return records
         else:
             # Update FROM clause according to postgresql aliases
             self.query.object = self.get_pgsql_name(table_name)
-            return super(TDMIGateway, self).start()
+            return super(TDMIGateway, self).get_records()
@@ -21,7 +21,7 @@ class SQLParser(object):
     def __init__(self):
         """
         Our simple BNF:
-        SELECT [fields[*] FROM table WHERE clause
+        SELECT [fields[*] FROM table WHERE clause [ORDER BY fields] [LIMIT n] [OFFSET n]
         """
 
         integer = pp.Combine(pp.Optional(pp.oneOf("+ -")) + pp.Word(pp.nums)).setParseAction(lambda t:int(t[0]))
@@ -39,6 +39,12 @@ class SQLParser(object):
         kw_where   = pp.CaselessKeyword('where')
         kw_at      = pp.CaselessKeyword('at')
         kw_set     = pp.CaselessKeyword('set')
+        kw_order   = pp.CaselessKeyword('order')
+        kw_by      = pp.CaselessKeyword('by')
+        kw_asc     = pp.CaselessKeyword('asc')
+        kw_desc    = pp.CaselessKeyword('desc')
+        kw_limit   = pp.CaselessKeyword('limit')
+        kw_offset  = pp.CaselessKeyword('offset')
         kw_true    = pp.CaselessKeyword('true').setParseAction(lambda t: 1)
         kw_false   = pp.CaselessKeyword('false').setParseAction(lambda t: 0)
 
@@ -130,11 +136,19 @@ class SQLParser(object):
         set_elt    = (kw_set.suppress()    + parameters.setResultsName('params'))
         at_elt     = (kw_at.suppress()     + timestamp.setResultsName('timestamp'))
 
-        # SELECT *|field_list [AT timestamp] FROM table [WHERE clause]
+        # field [ASC|DESC]    -->    (field, direction)
+        order_elt  = (field + pp.Optional(kw_asc | kw_desc, default = 'asc')).setParseAction(lambda t: [tuple(t.asList())])
+        order_list = pp.delimitedList(order_elt).setParseAction(lambda t: [t.asList()])
+        order_by_elt = (kw_order.suppress() + kw_by.suppress() + order_list.setResultsName('order_by'))
+        limit_elt  = (kw_limit.suppress()  + integer.setResultsName('limit'))
+        offset_elt = (kw_offset.suppress() + integer.setResultsName('offset'))
+
+        # SELECT *|field_list [AT timestamp] FROM table [WHERE clause] [ORDER BY field_list] [LIMIT n] [OFFSET n]
         # UPDATE table SET parameters [WHERE clause] [SELECT *|field_list]
         # INSERT INTO table SET parameters  [SELECT *|field_list]
         # DELETE FROM table [WHERE clause]
-        select     = (select_elt + pp.Optional(at_elt) + kw_from.suppress() + table + pp.Optional(where_elt)).setParseAction(lambda args: self.action(args, 'get'))
+        select     = (select_elt + pp.Optional(at_elt) + kw_from.suppress() + table + pp.Optional(where_elt) \
+                   + pp.Optional(order_by_elt) + pp.Optional(limit_elt) + pp.Optional(offset_elt)).setParseAction(lambda args: self.action(args, 'get'))
         update     = (kw_update + table + set_elt + pp.Optional(where_elt) + pp.Optional(select_elt)).setParseAction(lambda args: self.action(args, 'update'))
         insert     = (kw_insert + kw_into + table + set_elt + pp.Optional(select_elt)).setParseAction(lambda args: self.action(args, 'create'))
         delete     = (kw_delete + kw_from + table + pp.Optional(where_elt)).setParseAction(lambda args: self.action(args, 'delete'))
@@ -162,6 +176,7 @@ if __name__ == "__main__":
         'SELECT ip_id, node_id AT now FROM node WHERE node_id included [8252]',
         'SELECT hops.ip, hops.ttl AT 2012-09-09 14:30:09 FROM traceroute WHERE agent_id == 11824 && destination_id == 1417 && test_field == "test"',
         'SELECT slice_hrn FROM slice',
+        'SELECT hrn, hostname FROM resource WHERE slice_hrn == "ple.upmc.myslicedemo" ORDER BY hostname DESC, hrn LIMIT 10 OFFSET 20',
         'SELECT slice_hrn, slice_description FROM slice WHERE slice_hrn == "ple.upmc.myslicedemo"',
         'UPDATE local:platform SET disabled = True, pouet = false WHERE platform == "ple"',
         'UPDATE local:platform SET disabled = False WHERE platform == "omf"',
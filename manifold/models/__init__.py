@@ -1,5 +1,4 @@
-from sqlalchemy                 import create_engine
-from sqlalchemy.orm             import sessionmaker
+from sqlalchemy.orm             import sessionmaker, scoped_session
 from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from manifold.util.log          import Log
 
@@ -9,9 +8,8 @@ from manifold.util.log          import Log
 
 #url = 'sqlite:////var/myslice/db.sqlite?check_same_thread=False'
 from manifold.util.storage import DBStorage
-url = DBStorage.get_url()
 
-engine = create_engine(url, echo=False, pool_recycle=3600)
+engine = DBStorage.get_engine()
 
 # OLD from tophat.conf import settings
 # OLD from sqlalchemy.pool import StaticPool
@@ -22,7 +20,8 @@ from manifold.models.base       import Base
 
 Base    = declarative_base(cls = Base)
 SQLAlchemySession = sessionmaker(bind = engine)
-db = SQLAlchemySession()
+# Each thread gets its own session
+db = scoped_session(SQLAlchemySession)
 
 # Models
 from manifold.models.platform       import Platform
@@ -32,8 +31,11 @@ from manifold.models.session        import Session
 #from manifold.models.linked_account import LinkedAccount
 from manifold.models.policy         import Policy
 
-# This is required to create tables
-Base.metadata.create_all(engine)
+def init_db():
+    """
+    Create the tables of the local storage (see manifold-init-db).
+    """
+    Base.metadata.create_all(engine)
 
 #from manifold.models.field import Field
 
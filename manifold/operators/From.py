@@ -137,6 +137,13 @@ class From(Node):
             self.gateway.set_query(self.get_query())
             self.gateway.start()
 
+    def stop(self):
+        """
+        \brief Asks the gateway to stop sending records
+        """
+        if self.gateway:
+            self.gateway.stop()
+
     def set_gateway(self, gateway):
         gateway.set_callback(self.get_callback())
         self.gateway = gateway
@@ -210,3 +217,31 @@ class From(Node):
                 return Projection(self, fields)
                 #projection.query = self.query.copy().filter_by(filter) # XXX
             return self
+
+    def optimize_limit(self, order_by, limit, offset):
+        """
+        Propagate ORDER BY, LIMIT and OFFSET clauses through a FROM Node.
+        Args:
+            order_by: A list of (field name, ORDER_ASC|ORDER_DESC) tuples.
+            limit: The maximum number of records to return (None if unbounded).
+            offset: The number of records to skip.
+        Returns:
+            The root of the resulting tree.
+        """
+        sort_ok = not order_by or self.capabilities.sort
+        # Without ORDER BY, LIMIT and OFFSET are meaningless if the gateway
+        # does not return the records in a deterministic order, so we only
+        # require the corresponding capability.
+        if sort_ok and (limit is None or self.capabilities.limit):
+            if not offset or self.capabilities.offset:
+                # Push everything into the From node
+                self.query.order_by, self.query.limit, self.query.offset = order_by, limit, offset
+                return self
+            if limit is not None:
+                # Fetch offset + limit records and skip the first ones
+                self.query.order_by, self.query.limit, self.query.offset = order_by, offset + limit, 0
+                return super(From, self).optimize_limit(list(), limit, offset)
+        if sort_ok and order_by:
+            self.query.order_by = order_by
+            return super(From, self).optimize_limit(list(), limit, offset)
+        return super(From, self).optimize_limit(order_by, limit, offset)
@@ -115,10 +115,18 @@ class Node(object):
     def send(self, record):
         """
         \brief calls the parent callback with the record passed in parameter
+        (see manifold.util.trace to trace the records sent by a Node)
         """
-        Log.record("[#%04d] SEND %r [ %r ] <%r>" % (self.identifier, self.__class__.__name__, record, record.get_annotations()))
         self.callback(record)
 
+    def stop(self):
+        """
+        \brief Notifies the node that its parent does not need more records
+        (see TopK). By default the message is ignored, the node keeps on
+        sending its records, which are then dropped by its parent.
+        """
+        pass
+
     @returns(Query)
     def get_query(self):
         """
@@ -175,5 +183,22 @@ class Node(object):
         print "W: %s::optimize_projection() not implemented" % self.__class__.__name__
         return self
 
+    def optimize_limit(self, order_by, limit, offset):
+        """
+        Apply ORDER BY, LIMIT and OFFSET clauses above this Node.
+        By default, a TopK Node is added above this Node.
+        Args:
+            order_by: A list of (field name, ORDER_ASC|ORDER_DESC) tuples.
+            limit: The maximum number of records to return (None if unbounded).
+            offset: The number of records to skip.
+        Returns:
+            The root of the resulting tree.
+        """
+        from manifold.operators.top_k import TopK
+        old_self_callback = self.get_callback()
+        top_k = TopK(self, order_by, limit, offset)
+        top_k.set_callback(old_self_callback)
+        return top_k
+
     def get_identifier(self):
         return self.identifier
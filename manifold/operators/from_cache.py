@@ -1,5 +1,5 @@
 from manifold.operators     import Node
-from manifold.core.record   import LastRecord
+from manifold.core.record   import LastRecord, SharedRecord
 
 DUMPSTR_FROMCACHE  = "CACHE [%s]"
 
@@ -39,6 +39,19 @@ class FromCache(Node):
         # XXX self.set_callback() ???? XXX We will have multiple callbacks in general
         # XXX self.query = ??
 
+    def send_cached(self, record, origin):
+        """
+        Send a Record stored in the cache entry. The Record is wrapped in
+        a SharedRecord so that neither the annotations nor the downstream
+        operators alter the cached Record.
+        Args:
+            record: A Record instance stored in the cache entry.
+            origin: The value of the 'cache' annotation.
+        """
+        record = LastRecord() if record.is_last() else SharedRecord(record)
+        record.set_annotation('cache', origin)
+        self.send(record)
+
     def start(self): 
 
         # Will receive a start when executed == when the source is ready to receive records
@@ -55,8 +68,7 @@ class FromCache(Node):
                 # set_records to receive further records
                 print "pending records = ", self._cache_entry._pending_records
                 for record in self._cache_entry._pending_records:
-                    record.set_annotation('cache', 'buffered multicast')
-                    self.send(record)
+                    self.send_cached(record, 'buffered multicast')
 
             else:
                 # Query did not started, just return new incoming records
@@ -71,11 +83,8 @@ class FromCache(Node):
             # otherwise, we would have a cache entry and no query in progress,
             # and no query ever done == INCONSISTENT
             for record in self._cache_entry.get_records():
-                record.set_annotation('cache', 'cache')
-                self.send(record)
-            record = LastRecord()
-            record.set_annotation('cache', 'cache')
-            self.send(record)
+                self.send_cached(record, 'cache')
+            self.send_cached(LastRecord(), 'cache')
 
     def __repr__(self, indent = 0):
         """
@@ -86,8 +95,7 @@ class FromCache(Node):
 
     # This is equivalent to the child_callback
     def child_callback(self, record):
-        record.set_annotation('cache', 'multicast')
-        self.send(record)
+        self.send_cached(record, 'multicast')
 
     # This should not be needed
     def optimize_selection(self):
@@ -1,4 +1,4 @@
-from manifold.core.record   import Record
+from manifold.core.record   import Record, RecordSchema
 from manifold.operators     import Node
 from manifold.util.type     import returns
 from manifold.util.log      import Log
@@ -13,12 +13,6 @@ def do_projection(record, fields):
     """
     Take the necessary fields in dic
     """
-    ret = Record()
-    # Preserve annotations !
-    # Not for Last Record which is of dict type
-    if isinstance(record,Record):
-        ret.set_annotations(record.get_annotations())
-
     # 1/ split subqueries
     local = []
     subqueries = {}
@@ -31,9 +25,14 @@ def do_projection(record, fields):
         else:
             local.append(f)
     
-    # 2/ process local fields
-    for l in local:
-        ret[l] = record[l] if l in record else None
+    # 2/ process local fields (records projected on the same fields share their schema)
+    get = record.get
+    ret = Record.from_values(RecordSchema.get(local), [get(l) for l in local])
+
+    # Preserve annotations !
+    # Not for Last Record which is of dict type
+    if isinstance(record,Record):
+        ret.set_annotations(record.get_annotations())
 
     # 3/ recursively process subqueries
     for method, subfields in subqueries.items():
@@ -126,6 +125,12 @@ class Projection(Node):
         """
         self.child.start()
 
+    def stop(self):
+        """
+        \brief Propagates a STOP message through the child
+        """
+        self.child.stop()
+
     def inject_insert(self, params):
         self.child.inject_insert(params)
 
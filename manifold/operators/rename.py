@@ -181,6 +181,12 @@ class Rename(Node):
         """
         self.child.start()
 
+    def stop(self):
+        """
+        \brief Propagates a STOP message through the child
+        """
+        self.child.stop()
+
     def child_callback(self, record):
         """
         \brief Processes records received by the child node
@@ -66,6 +66,12 @@ class Selection(Node):
         """
         self.child.start()
 
+    def stop(self):
+        """
+        \brief Propagates a STOP message through the child
+        """
+        self.child.stop()
+
     def inject_insert(self, params):
         self.child.inject_insert(params)
 
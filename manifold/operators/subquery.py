@@ -1,4 +1,5 @@
-import traceback
+import copy, traceback
+from collections                   import deque
 from types                         import StringTypes
 from manifold.core.filter          import Filter
 from manifold.core.relation        import Relation
@@ -6,11 +7,18 @@ from manifold.core.record          import Record, LastRecord
 from manifold.operators            import Node, ChildStatus, ChildCallback
 from manifold.operators.selection  import Selection
 from manifold.operators.projection import Projection
+from manifold.operators.from_table import FromTable
 from manifold.util.predicate       import Predicate, eq, contains, included
 from manifold.util.log             import Log
+from manifold.util.options         import Options
 
 DUMPSTR_SUBQUERIES = "<subqueries>"
 
+# Number of parent records per chunk (0 means parent records are not chunked)
+DEFAULT_CHUNK_SIZE = 0
+# Maximum number of chunks whose child queries are running simultaneously
+DEFAULT_MAX_CHUNKS = 4
+
 #------------------------------------------------------------------
 # SUBQUERY node
 #------------------------------------------------------------------
@@ -22,15 +30,33 @@ class SubQuery(Node):
         self.children represents each subqueries involved in the SUBQUERY operation.
     """
 
-    def __init__(self, parent, children_ast_relation_list):
+    # (chunk_size, max_chunks) read from Options, see get_chunk_options
+    chunk_options = None
+
+    def __init__(self, parent, children_ast_relation_list, chunk_size = None, max_chunks = None):
         """
         Constructor
         Args:
             parent: The main query (AST instance ?)
             children_ast_relation_list: A list of (AST , Relation) tuples
+            chunk_size: The number of parent records per chunk. If set, child
+                queries are issued for each chunk of parent records, and the
+                records of a chunk are sent as soon as it is complete.
+                None means this value is read from Options, 0 disables chunks.
+            max_chunks: The maximum number of chunks processed simultaneously.
+                None means this value is read from Options.
         """
         super(SubQuery, self).__init__()
 
+        if chunk_size is None or max_chunks is None:
+            default_chunk_size, default_max_chunks = SubQuery.get_chunk_options()
+            if chunk_size is None:
+                chunk_size = default_chunk_size
+            if max_chunks is None:
+                max_chunks = default_max_chunks
+        self.chunk_size = chunk_size
+        self.max_chunks = max(max_chunks, 1)
+
         # Parameters
         self.parent = parent
 
@@ -46,6 +72,13 @@ class SubQuery(Node):
         # Member variables
         self.parent_output = []
 
+        # Chunk mode: parent records waiting to form a chunk, chunks waiting
+        # to be processed, and number of chunks being processed.
+        self.pending_chunks   = deque()
+        self.running_chunks   = 0
+        self.parent_done      = False
+        self.dispatching      = False
+
         # Set up callbacks
         old_cb = parent.get_callback()
         parent.set_callback(self.parent_callback)
@@ -71,6 +104,37 @@ class SubQuery(Node):
             self.child_results.append([])
         print "init done"
 
+    @staticmethod
+    def init_options():
+        """
+        Prepare options supported by SubQuery nodes.
+        """
+        opt = Options()
+        opt.add_argument(
+            "--subquery-chunk-size", type = int, dest = "subquery_chunk_size",
+            help = "Number of parent records per SubQuery chunk (0 to wait for every parent record).",
+            default = DEFAULT_CHUNK_SIZE
+        )
+        opt.add_argument(
+            "--subquery-max-chunks", type = int, dest = "subquery_max_chunks",
+            help = "Maximum number of SubQuery chunks processed simultaneously.",
+            default = DEFAULT_MAX_CHUNKS
+        )
+
+    @staticmethod
+    def get_chunk_options():
+        """
+        Returns:
+            The (chunk_size, max_chunks) tuple set by the options. Options
+            are read once, when the first SubQuery node is built.
+        """
+        if SubQuery.chunk_options is None:
+            SubQuery.chunk_options = (
+                int(Options().subquery_chunk_size or DEFAULT_CHUNK_SIZE),
+                int(Options().subquery_max_chunks or DEFAULT_MAX_CHUNKS)
+            )
+        return SubQuery.chunk_options
+
 
 #    @returns(Query)
 #    def get_query(self):
@@ -109,6 +173,10 @@ class SubQuery(Node):
         Args:
             record: A dictionary representing the received record
         """
+        if self.chunk_size:
+            self.chunk_parent_callback(record)
+            return
+
         if record.is_last():
             # When we have received all parent records, we can run children
             if self.parent_output:
@@ -117,6 +185,81 @@ class SubQuery(Node):
         # Store the record for later...
         self.parent_output.append(record)
 
+    #---------------------------------------------------------------------------
+    # Chunk mode
+    #---------------------------------------------------------------------------
+
+    def chunk_parent_callback(self, record):
+        """
+        Processes records received by the parent node in chunk mode.
+        Args:
+            record: A Record instance.
+        """
+        if record.is_last():
+            self.parent_done = True
+            if self.parent_output:
+                self.pending_chunks.append(self.parent_output)
+                self.parent_output = []
+            self.run_chunks()
+            return
+
+        self.parent_output.append(record)
+        if len(self.parent_output) >= self.chunk_size:
+            self.pending_chunks.append(self.parent_output)
+            self.parent_output = []
+            self.run_chunks()
+
+    def make_chunk(self, records):
+        """
+        Build a SubQuery node processing a chunk of parent records. Its
+        children are copies of the (not yet started) children of this node.
+        Args:
+            records: A list of parent records.
+        Returns:
+            The corresponding SubQuery instance.
+        """
+        # Do not copy this node (and what is above it) through the callbacks
+        memo = {id(self): self}
+        children = copy.deepcopy(zip(self.children, self.relations), memo)
+
+        parent = FromTable(self.parent.get_query(), [], None)
+        chunk = SubQuery(parent, children, chunk_size = 0, max_chunks = 1)
+        chunk.parent_output = records
+        chunk.set_callback(self.chunk_callback)
+        return chunk
+
+    def run_chunks(self):
+        """
+        Start pending chunks as long as the number of chunks being processed
+        is below self.max_chunks, and terminate once every chunk is done.
+        """
+        # Chunks may complete synchronously, avoid recursive calls
+        if self.dispatching:
+            return
+        self.dispatching = True
+        try:
+            while self.pending_chunks and self.running_chunks < self.max_chunks:
+                chunk = self.make_chunk(self.pending_chunks.popleft())
+                self.running_chunks += 1
+                chunk.run_children()
+        finally:
+            self.dispatching = False
+
+        if self.parent_done and not self.running_chunks and not self.pending_chunks:
+            self.send(LastRecord())
+
+    def chunk_callback(self, record):
+        """
+        Processes (joined) records sent by a chunk.
+        Args:
+            record: A Record instance.
+        """
+        if record.is_last():
+            self.running_chunks -= 1
+            self.run_chunks()
+            return
+        self.send(record)
+
     # This method until everything is a record... XXX set up warnings
     @staticmethod
     def get_element_key(element, key):
@@ -317,6 +460,14 @@ class SubQuery(Node):
          process results stored in the parent.
         """
         try:
+            # Index child results on the key they are joined on, so that each
+            # parent record retrieves its children without scanning them all.
+            self.child_indexes = dict()
+            for i, relation in enumerate(self.relations):
+                key, op, value = relation.get_predicate().get_tuple()
+                if op == eq:
+                    self.child_indexes[i] = self.make_index(self.child_results[i], value)
+
             for parent_record in self.parent_output:
                 # Dispatching child results
                 for i, child in enumerate(self.children):
@@ -344,29 +495,7 @@ class SubQuery(Node):
                             ids = [SubQuery.get_element_key(r, value) for r in record]
                         else:
                             ids = [SubQuery.get_element_key(record, value)]
-                        if len(ids) == 1:
-                            id, = ids
-                            filter = Filter().filter_by(Predicate(value, eq, id))
-                        else:
-                            filter = Filter().filter_by(Predicate(value, included, ids))
-                        #if isinstance(key, StringTypes):
-                        #    # simple key
-                        #    ids = [o[key]] if key in o else []
-                        #    #print "IDS=", ids
-                        #    #if ids and isinstance(ids[0], dict):
-                        #    #    ids = map(lambda x: x[value], ids)
-                        #    # XXX we might have equality instead of IN in case of a single ID
-                        #    print "VALUE", value, "INCLUDED ids=", ids
-                        #    filter = Filter().filter_by(Predicate(value, included, ids))
-                        #else:
-                        #    # Composite key, o[value] is a dictionary
-                        #    for field in value:
-                        #        filter = filter.filter_by(Predicate(field, included, o[value][field])) # o[value] might be multiple
-
-                        parent_record[relation.get_relation_name()] = []
-                        for child_record in self.child_results[i]:
-                            if filter.match(child_record):
-                                parent_record[relation.get_relation_name()].append(child_record)
+                        parent_record[relation.get_relation_name()] = self.get_child_records(i, value, ids)
 
                     elif op == contains:
                         # 1..N
@@ -408,6 +537,68 @@ class SubQuery(Node):
             print "EEE", e
             traceback.print_exc()
 
+    @staticmethod
+    def make_index(records, key):
+        """
+        Index a list of records according to a (possibly composite) key.
+        Args:
+            records: A list of Record instances.
+            key: A String (field name) or a tuple of String (field names).
+        Returns:
+            A dictionary {key value : [(position, record)]}, or None if some
+            key values cannot be hashed.
+        """
+        index = dict()
+        for position, record in enumerate(records):
+            if isinstance(key, tuple):
+                key_value = tuple([record.get(field) for field in key])
+            elif key in record:
+                key_value = record[key]
+            else:
+                # Such a record cannot match any parent record
+                continue
+            try:
+                index.setdefault(key_value, list()).append((position, record))
+            except TypeError:
+                return None
+        return index
+
+    def get_child_records(self, child_id, value, ids):
+        """
+        Retrieve the child records whose key is among a list of ids, in the
+        order they have been received.
+        Args:
+            child_id: The index of the child in self.children.
+            value: The key of the child records (String or tuple of String).
+            ids: The list of key values (id or tuple(id1, id2, ...)) we are looking for.
+        Returns:
+            The list of matching child records.
+        """
+        index = self.child_indexes.get(child_id)
+        try:
+            if index is not None:
+                if len(ids) == 1:
+                    id, = ids
+                    if isinstance(value, tuple) or isinstance(id, list):
+                        id = tuple(id)
+                    return [record for _, record in index.get(id, list())]
+
+                matches = dict()
+                for id in set([tuple(id) if isinstance(value, tuple) else id for id in ids]):
+                    for position, record in index.get(id, list()):
+                        matches[position] = record
+                return [matches[position] for position in sorted(matches.keys())]
+        except TypeError:
+            # Some ids cannot be hashed, we fall back to a linear scan
+            pass
+
+        if len(ids) == 1:
+            id, = ids
+            filter = Filter().filter_by(Predicate(value, eq, id))
+        else:
+            filter = Filter().filter_by(Predicate(value, included, ids))
+        return [record for record in self.child_results[child_id] if filter.match(record)]
+
     def child_callback(self, child_id, record):
         """
         \brief Processes records received by a child node
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# SymmetricHashJoin:
+#    A LEFT JOIN strategy which starts both children at once and
+#    builds a hash table on each side, so that joined records are
+#    sent as soon as both sides have been received. Unlike LeftJoin,
+#    the keys of the left records are not injected in the right child.
+
+from manifold.core.query            import ACTION_CREATE
+from manifold.core.record           import Record
+from manifold.operators.From        import From
+from manifold.operators.left_join   import LeftJoin
+from manifold.operators.projection  import Projection
+from manifold.operators.rename      import Rename
+from manifold.operators.selection   import Selection
+from manifold.operators.union       import Union
+from manifold.util.log              import Log
+
+#------------------------------------------------------------------
+# SYMMETRIC HASH JOIN node
+#------------------------------------------------------------------
+
+class SymmetricHashJoin(LeftJoin):
+    """
+    LEFT JOIN operator node running both children simultaneously.
+    """
+
+    def __init__(self, left_child, right_child, predicate):
+        """
+        \brief Constructor
+        \param left_child  A Node instance corresponding to left  operand of the LEFT JOIN
+        \param right_child A Node instance corresponding to right operand of the LEFT JOIN
+        \param predicate A Predicate instance invoked to determine whether two record of
+            left_child and right_child can be joined.
+        """
+        super(SymmetricHashJoin, self).__init__(left_child, right_child, predicate)
+
+        # right_map stores the first right record received for each key
+        self.right_map  = dict()
+        self.right_done = False
+        # Set to False if the right child requires the left keys (see start)
+        self.symmetric  = True
+
+    @staticmethod
+    def benefits_from_injection(node):
+        """
+        Test whether injecting the keys of the left records would reduce
+        what an AST fetches from its data sources.
+        Args:
+            node: The root Node of the right operand of a LEFT JOIN.
+        Returns:
+            False iif no From Node of this AST is able to process the
+            corresponding WHERE clause and none of them needs the keys.
+        """
+        if isinstance(node, From):
+            capabilities = node.capabilities
+            return capabilities.selection or capabilities.fullquery or capabilities.is_onjoin()
+        elif isinstance(node, (Selection, Projection, Rename)):
+            return SymmetricHashJoin.benefits_from_injection(node.child)
+        elif isinstance(node, Union):
+            for child in node.children:
+                if SymmetricHashJoin.benefits_from_injection(child):
+                    return True
+            return False
+        # Other operators might take advantage of the keys
+        return True
+
+    def start(self):
+        """
+        \brief Propagates a START message through the node
+        """
+        if self.right.get_query().action == ACTION_CREATE:
+            # The right child needs the left keys, behave like a LeftJoin
+            self.symmetric = False
+            super(SymmetricHashJoin, self).start()
+            return
+
+        self.left.start()
+        self.right.start()
+
+    def __repr__(self):
+        return "SYMMETRIC HASH JOIN %s %s %s" % self.predicate.get_str_tuple()
+
+    def join(self, left_record, right_record):
+        """
+        Merge a right record into a left record and send the result.
+        """
+        left_record.update(right_record)
+        self.send(left_record)
+
+    def left_callback(self, record):
+        """
+        \brief Process records received by the left child
+        \param record A dictionary representing the received record
+        """
+        if not self.symmetric:
+            super(SymmetricHashJoin, self).left_callback(record)
+            return
+
+        if record.is_last():
+            self.left_done = True
+            if self.right_done:
+                self._on_right_done()
+            return
+
+        # Directly send records missing information necessary to join
+        if not Record.has_fields(record, self.predicate.get_field_names()):
+            Log.warning("Missing LEFTJOIN predicate %s in left record %r : forwarding" % \
+                    (self.predicate, record))
+            self.send(record)
+            return
+
+        key = Record.get_value(record, self.predicate.key)
+        right_record = self.right_map.get(key, None)
+        if right_record is not None:
+            self.join(record, right_record)
+            return
+
+        if not key in self.left_map:
+            self.left_map[key] = []
+        self.left_map[key].append(record)
+
+    def right_callback(self, record):
+        """
+        \brief Process records received from the right child
+        \param record A dictionary representing the received record
+        """
+        if not self.symmetric:
+            super(SymmetricHashJoin, self).right_callback(record)
+            return
+
+        if record.is_last():
+            self.right_done = True
+            if self.left_done:
+                self._on_right_done()
+            return
+
+        # Skip records missing information necessary to join
+        if not set([self.predicate.get_value()]) <= set(record.keys()) \
+        or Record.is_empty_record(record, set([self.predicate.get_value()])):
+            Log.warning("Missing LEFTJOIN predicate %s in right record %r: ignored" % \
+                    (self.predicate, record))
+            return
+
+        # Like LeftJoin, only the first right record of a given key is joined
+        key = Record.get_value(record, self.predicate.value)
+        if key in self.right_map:
+            return
+        self.right_map[key] = record
+
+        left_records = self.left_map.pop(key, None)
+        if left_records:
+            for left_record in left_records:
+                self.join(left_record, record)
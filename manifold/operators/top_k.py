@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# TopK operator: ORDER BY / LIMIT / OFFSET clauses applied by the
+# router on behalf of the platforms which do not support them.
+
+from manifold.core.query            import ORDER_DESC
+from manifold.core.record           import LastRecord
+from manifold.operators             import Node
+from manifold.operators.projection  import Projection
+
+DUMPSTR_TOPK = "ORDER BY %s LIMIT %s OFFSET %s"
+
+#------------------------------------------------------------------
+# TopK node (ORDER BY, LIMIT, OFFSET)
+#------------------------------------------------------------------
+
+class TopK(Node):
+    """
+    TopK operator node (cf ORDER BY, LIMIT and OFFSET clauses in SQL)
+    Without ORDER BY clause, records are streamed and the operator stops
+    its child once the limit is reached. Otherwise, only the
+    best (offset + limit) records are buffered until the last record.
+    """
+
+    def __init__(self, child, order_by, limit, offset = 0):
+        """
+        \brief Constructor
+        \param child A Node instance (the child of this Node)
+        \param order_by A list of (field name, ORDER_ASC|ORDER_DESC) tuples
+        \param limit The maximum number of records to return (None if unbounded)
+        \param offset The number of records to skip
+        """
+        assert issubclass(type(child), Node), "Invalid child = %r (%r)"   % (child,   type(child))
+        assert isinstance(order_by, list),    "Invalid order_by = %r (%r)" % (order_by, type(order_by))
+
+        super(TopK, self).__init__()
+
+        self.child, self.order_by, self.limit, self.offset = child, order_by, limit, offset or 0
+
+        old_cb = child.get_callback()
+        child.set_callback(self.child_callback)
+        self.set_callback(old_cb)
+
+        self.query = self.child.get_query().copy()
+        self.query.order_by = order_by
+        self.query.limit    = limit
+        self.query.offset   = self.offset
+
+        # Records received so far (ORDER BY) or number of records received (no ORDER BY)
+        self.records  = list()
+        self.received = 0
+        self.done     = False
+
+    def dump(self, indent = 0):
+        """
+        \brief Dump the current child
+        \param indent The current indentation
+        """
+        return "%s\n%s" % (
+            Node.dump(self, indent),
+            self.child.dump(indent + 1),
+        )
+
+    def __repr__(self):
+        order_by = ', '.join(["%s %s" % (field, direction.upper()) for field, direction in self.order_by])
+        return DUMPSTR_TOPK % (order_by or '-', self.limit if self.limit is not None else 'ALL', self.offset)
+
+    def start(self):
+        """
+        \brief Propagates a START message through the child
+        """
+        if self.limit == 0:
+            self.done = True
+            self.send(LastRecord())
+            return
+        self.child.start()
+
+    def stop(self):
+        """
+        \brief Propagates a STOP message through the child
+        """
+        self.child.stop()
+
+    def inject_insert(self, params):
+        self.child.inject_insert(params)
+
+    #@returns(TopK)
+    def inject(self, records, key, query):
+        """
+        \brief Inject record / record keys into the child
+        \param records A list of dictionaries representing records,
+                       or list of record keys
+        \return This node
+        """
+        self.child = self.child.inject(records, key, query) # XXX
+        return self
+
+    def sort(self, records):
+        """
+        \brief Sort records according to the ORDER BY clause
+        \param records A list of Record instances
+        \return The sorted list of records
+        """
+        # Python sorts are stable: sort by the last key first
+        for field, direction in reversed(self.order_by):
+            records = sorted(records, key = lambda record: record.get(field), reverse = (direction == ORDER_DESC))
+        return records
+
+    def child_callback(self, record):
+        """
+        \brief Processes records received by the child node
+        \param record dictionary representing the received record
+        """
+        if self.done:
+            return
+
+        if record.is_last():
+            if self.order_by:
+                end = self.offset + self.limit if self.limit is not None else None
+                for r in self.sort(self.records)[self.offset:end]:
+                    self.send(r)
+                self.records = list()
+            self.done = True
+            self.send(record)
+            return
+
+        if self.order_by:
+            self.records.append(record)
+            # Prune the buffer: only the best (offset + limit) records can be returned
+            if self.limit is not None and len(self.records) >= 2 * (self.offset + self.limit):
+                self.records = self.sort(self.records)[:self.offset + self.limit]
+            return
+
+        self.received += 1
+        if self.received <= self.offset:
+            return
+        self.send(record)
+        if self.limit is not None and self.received >= self.offset + self.limit:
+            # Records received from now on are ignored
+            self.done = True
+            self.send(LastRecord())
+            self.child.stop()
+
+    def optimize_selection(self, filter):
+        # Filters must be applied before ORDER BY / LIMIT / OFFSET
+        self.child = self.child.optimize_selection(filter)
+        self.child.set_callback(self.child_callback)
+        return self
+
+    def optimize_projection(self, fields):
+        # Do we have to add fields for sorting, if so, we have to remove them after
+        order_fields = set([field for field, _ in self.order_by])
+        self.child = self.child.optimize_projection(fields | order_fields)
+        self.child.set_callback(self.child_callback)
+        self.query.fields = fields
+        if not order_fields <= fields:
+            old_self_callback = self.get_callback()
+            projection = Projection(self, fields)
+            projection.set_callback(old_self_callback)
+            return projection
+        return self
@@ -1,5 +1,6 @@
 from manifold.operators            import Node, ChildStatus, ChildCallback
 from manifold.operators.projection import Projection
+from manifold.operators.From       import From
 from manifold.core.record          import Record, LastRecord
 from manifold.util.log             import Log
 
@@ -84,6 +85,13 @@ class Union(Node):
         for i, child in enumerate(self.children):
             child.start()
 
+    def stop(self):
+        """
+        \brief Propagates a STOP message through the children
+        """
+        for child in self.children:
+            child.stop()
+
     def inject_insert(self, params):
         for i, child in enumerate(self.children):
             child.inject_insert(params)
@@ -138,9 +146,8 @@ class Union(Node):
                     prev_record[k] = v
                     continue
                 if isinstance(v, list):
-                    if not prev_record[k]:
-                        prev_record[k] = list() # with failures it can occur that this is None
-                    prev_record[k].extend(v) # DUPLICATES ?
+                    # Do not extend in place, the list might be shared (see SharedRecord)
+                    prev_record[k] = (prev_record[k] or list()) + v # DUPLICATES ?
                 #else:
                 #    if not v == previous[k]:
                 #        print "W: ignored conflictual field"
@@ -156,6 +163,17 @@ class Union(Node):
             self.children[i].set_callback(old_child_callback)
         return self
 
+    def optimize_limit(self, order_by, limit, offset):
+        # UNION: children are not limited since a record might be merged
+        # with records that they would not have returned: only the ORDER BY
+        # clause is passed to the platforms able to sort.
+        # The final ORDER BY / LIMIT / OFFSET is applied above this node.
+        if order_by:
+            for child in self.children:
+                if isinstance(child, From) and child.capabilities.sort:
+                    child.query.order_by = order_by
+        return super(Union, self).optimize_limit(order_by, limit, offset)
+
     def optimize_projection(self, fields):
         # UNION: apply projection to all children
         # XXX in case of UNION with duplicate elimination, we need the key
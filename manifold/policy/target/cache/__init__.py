@@ -18,14 +18,9 @@ class CacheTarget(Target):
         cache = self._interface.get_cache(annotations)
 
         # If Query action is not get (Create, Update, Delete)
-        # Invalidate the cache and propagate the Query        
-
-        # TODO: cache.invalidate XXX to be implemented
+        # Invalidate the related cache entries and propagate the Query        
         if query.get_action() != 'get':
-            #cache.invalidate_entry(query)
-            self._interface.delete_cache(annotations)
-            # Cache per user
-            cache = self._interface.get_cache(annotations)
+            self._interface.invalidate_cache(query)
             return (TargetValue.CONTINUE, None)
 
         #print "==== DUMPING CACHE ====="
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# A KeyedLock is a set of Twisted DeferredLocks indexed by an arbitrary
+# (hashable) key: operations related to distinct keys run concurrently
+# while those related to a same key are serialized, or coalesced (see
+# KeyedLock.coalesce). The time spent waiting for each lock is recorded.
+
+import copy, time
+from twisted.internet           import defer
+from twisted.python.failure     import Failure
+
+from manifold.util.log          import Log
+
+class KeyedLock(object):
+    """
+    A set of DeferredLocks indexed by key.
+    """
+
+    def __init__(self, name):
+        """
+        Constructor.
+        Args:
+            name: A String identifying this KeyedLock in the logs.
+        """
+        self.name     = name
+        # {key : DeferredLock}, locks are removed once released and not awaited
+        self.locks    = dict()
+        # {key : list of Deferreds waiting for the result of a coalesced call}
+        self.inflight = dict()
+        # Statistics
+        self.acquisitions = 0
+        self.contentions  = 0
+        self.total_wait   = 0.0
+        self.max_wait     = 0.0
+
+    def account_wait(self, key, start):
+        """
+        Record the time spent waiting for a key.
+        Args:
+            key: The key.
+            start: The timestamp at which the wait began.
+        """
+        wait = time.time() - start
+        self.contentions += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        Log.debug("%s: waited %.3fs for %r" % (self.name, wait, key))
+
+    def acquire(self, key):
+        """
+        Args:
+            key: The key to lock.
+        Returns:
+            A Deferred fired once the lock related to this key is acquired.
+        """
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = defer.DeferredLock()
+        self.acquisitions += 1
+
+        if not lock.locked:
+            return lock.acquire()
+
+        start = time.time()
+        def acquired(lock):
+            self.account_wait(key, start)
+            return lock
+        return lock.acquire().addCallback(acquired)
+
+    def release(self, key):
+        """
+        Args:
+            key: The key to unlock.
+        """
+        lock = self.locks[key]
+        lock.release()
+        if not lock.locked and not lock.waiting:
+            del self.locks[key]
+
+    def run(self, key, f, *args, **kwargs):
+        """
+        Run a function while holding the lock related to a key.
+        Args:
+            key: The key to lock.
+            f: A function possibly returning a Deferred.
+        Returns:
+            A Deferred fired with the result of f.
+        """
+        def locked(lock):
+            d = defer.maybeDeferred(f, *args, **kwargs)
+            def unlock(result):
+                self.release(key)
+                return result
+            return d.addBoth(unlock)
+        return self.acquire(key).addCallback(locked)
+
+    def coalesce(self, key, f, *args, **kwargs):
+        """
+        Same as run, except that a call issued for a key whose call is in
+        progress is not queued: it gets (a copy of) the result of the call
+        in progress.
+        Args:
+            key: The key to lock.
+            f: A function possibly returning a Deferred.
+        Returns:
+            A Deferred fired with the result of f.
+        """
+        waiters = self.inflight.get(key)
+        if waiters is not None:
+            self.acquisitions += 1
+            start = time.time()
+            d = defer.Deferred()
+            def awaited(result):
+                self.account_wait(key, start)
+                return result
+            waiters.append(d.addBoth(awaited))
+            return d
+
+        waiters = self.inflight[key] = list()
+        def done(result):
+            del self.inflight[key]
+            for waiter in waiters:
+                if isinstance(result, Failure):
+                    waiter.errback(result)
+                else:
+                    waiter.callback(copy.deepcopy(result))
+            return result
+        return self.run(key, f, *args, **kwargs).addBoth(done)
+
+    def get_stats(self):
+        """
+        Returns:
+            A dictionary summarizing the waits recorded by this KeyedLock.
+        """
+        return {
+            "acquisitions" : self.acquisitions,
+            "contentions"  : self.contentions,
+            "total_wait"   : self.total_wait,
+            "max_wait"     : self.max_wait,
+            "locked"       : len(self.locks)
+        }
@@ -267,10 +267,10 @@ class Lattice(object):
         # lattice, ie. both parents and children are empty
         for parent in lattice_element.parents:
             parent.children |= lattice_element.children
-            parent.children -= lattice_element
+            parent.children.discard(lattice_element)
         for child in lattice_element.children:
             child.parents   |= lattice_element.parents
-            child.parents   -= lattice_element
+            child.parents.discard(lattice_element)
 
         if recursive:
             greater = self._get_greater(lattice_element)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# A SingleFlight coalesces identical remote calls: a call issued while
+# an identical call is in flight is not sent, it gets (a copy of) the
+# result of the call in flight. Each gateway owns a SingleFlight, which
+# counts the calls it saved and logs these statistics periodically.
+
+import copy, hashlib
+from types                      import StringTypes
+from twisted.internet           import defer
+from twisted.python.failure     import Failure
+
+from manifold.util.log          import Log
+
+# Strings at least this long (credentials, RSpecs...) are replaced by
+# their digest in the keys
+DIGEST_MIN_LENGTH = 256
+
+# Parameters which differ between identical calls
+IGNORED_PARAMETERS = ['call_id']
+
+# Parameters (passwords...) which are always replaced by their digest in
+# the keys, so that they are not kept in memory in clear
+SECRET_PARAMETERS = ['AuthString']
+
+# The statistics of a SingleFlight are logged every STATS_PERIOD calls
+STATS_PERIOD = 1000
+
+class SingleFlight(object):
+    """
+    Coalesce identical calls in flight.
+    """
+
+    def __init__(self, name):
+        """
+        Constructor.
+        Args:
+            name: A String identifying this SingleFlight in the logs.
+        """
+        self.name     = name
+        # {key : list of Deferreds waiting for the result of the call in flight}
+        self.inflight = dict()
+        # Statistics
+        self.calls    = 0
+        self.saved    = 0
+
+    @staticmethod
+    def get_digest(value):
+        """
+        Args:
+            value: A parameter of a remote call.
+        Returns:
+            The digest of this parameter.
+        """
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        elif not isinstance(value, str):
+            value = repr(value)
+        return hashlib.sha1(value).hexdigest()
+
+    @staticmethod
+    def normalize(value):
+        """
+        Args:
+            value: A parameter of a remote call.
+        Returns:
+            A hashable value identifying this parameter. Long strings and
+            the SECRET_PARAMETERS of the dictionaries are replaced by their
+            digest, and the IGNORED_PARAMETERS of the dictionaries are removed.
+        """
+        if isinstance(value, dict):
+            return tuple(sorted(
+                (key, SingleFlight.get_digest(v) if key in SECRET_PARAMETERS else SingleFlight.normalize(v))
+                for key, v in value.items() if key not in IGNORED_PARAMETERS
+            ))
+        elif isinstance(value, (list, tuple)):
+            return tuple(SingleFlight.normalize(v) for v in value)
+        elif isinstance(value, (set, frozenset)):
+            return frozenset(SingleFlight.normalize(v) for v in value)
+        elif isinstance(value, StringTypes) and len(value) >= DIGEST_MIN_LENGTH:
+            return SingleFlight.get_digest(value)
+        return value
+
+    @staticmethod
+    def get_key(endpoint, method, args):
+        """
+        Args:
+            endpoint: The URL of the remote server.
+            method: The name of the remote method.
+            args: The parameters of the call.
+        Returns:
+            The key identifying this call.
+        """
+        return (endpoint, method, SingleFlight.normalize(args))
+
+    def call(self, key, f, *args, **kwargs):
+        """
+        Issue a call, unless an identical call is in flight.
+        Args:
+            key: The key identifying the call (see get_key), None if this
+                call must not be coalesced.
+            f: A function issuing the call and returning a Deferred.
+        Returns:
+            A Deferred fired with the result of the call.
+        """
+        if self.calls and self.calls % STATS_PERIOD == 0:
+            self.log_stats()
+        self.calls += 1
+        if key is None:
+            return f(*args, **kwargs)
+
+        waiters = self.inflight.get(key)
+        if waiters is not None:
+            self.saved += 1
+            Log.debug("%s: coalesced %s call to %s" % (self.name, key[1], key[0]))
+            d = defer.Deferred()
+            waiters.append(d)
+            return d
+
+        waiters = self.inflight[key] = list()
+        def done(result):
+            del self.inflight[key]
+            for waiter in waiters:
+                if isinstance(result, Failure):
+                    waiter.errback(result)
+                else:
+                    waiter.callback(copy.deepcopy(result))
+            return result
+        return defer.maybeDeferred(f, *args, **kwargs).addBoth(done)
+
+    def get_stats(self):
+        """
+        Returns:
+            A dictionary summarizing the calls coalesced by this SingleFlight.
+        """
+        return {
+            "calls"    : self.calls,
+            "saved"    : self.saved,
+            "inflight" : len(self.inflight)
+        }
+
+    def log_stats(self):
+        """
+        Log the statistics of this SingleFlight (see get_stats).
+        """
+        Log.info("%s: %%(saved)d/%%(calls)d calls saved, %%(inflight)d in flight" % self.name % self.get_stats())
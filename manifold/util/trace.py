@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# A Tracer records the records sent by the Nodes of an AST (and by the
+# Gateways feeding its From Nodes) while a QueryPlan is executed.
+# Tracing is installed per QueryPlan once it is built: untraced Nodes
+# keep the plain Node.send method and thus neither format nor store
+# anything.
+#
+# Modes:
+#  - off      : nothing is traced (default).
+#  - counters : count the records sent by each Node.
+#  - sampled  : counters + one event out of --trace-sampling is stored.
+#  - full     : counters + every event is stored.
+# Events are stored in a ring buffer (see --trace-buffer) and are only
+# formatted when the Tracer is dumped.
+#
+# Only the Nodes of the AST at the time the Tracer is installed, and
+# their copies (see SubQuery chunks), are traced: Nodes created by an
+# operator while the QueryPlan is running are not.
+
+import time, types
+from collections                import deque
+
+from manifold.util.options      import Options
+
+TRACE_OFF      = "off"
+TRACE_COUNTERS = "counters"
+TRACE_SAMPLED  = "sampled"
+TRACE_FULL     = "full"
+
+TRACE_MODES    = [TRACE_OFF, TRACE_COUNTERS, TRACE_SAMPLED, TRACE_FULL]
+
+# Default number of sends between two sampled events
+DEFAULT_TRACE_SAMPLING = 100
+# Default number of events kept in the ring buffer
+DEFAULT_TRACE_BUFFER   = 1000
+
+def traced_send(self, record):
+    """
+    Replacement of Node.send (resp. Gateway.send) for traced instances.
+    It is bound to each traced instance (see Tracer.install).
+    """
+    self.tracer.trace(self, record)
+    self.callback(record)
+
+class Tracer(object):
+    """
+    Records the activity of the Nodes of a QueryPlan.
+    """
+
+    def __init__(self, mode, sampling = None, buffer_size = None):
+        """
+        Constructor.
+        Args:
+            mode: A value among TRACE_COUNTERS, TRACE_SAMPLED, TRACE_FULL.
+            sampling: One event out of sampling is stored in TRACE_SAMPLED mode.
+                None means this value is read from Options.
+            buffer_size: The maximum number of stored events.
+                None means this value is read from Options.
+        """
+        assert mode in TRACE_MODES and mode != TRACE_OFF, "Invalid trace mode: %r" % mode
+        if sampling is None:
+            sampling = int(Options().trace_sampling or DEFAULT_TRACE_SAMPLING)
+        if buffer_size is None:
+            buffer_size = int(Options().trace_buffer or DEFAULT_TRACE_BUFFER)
+
+        self.mode     = mode
+        self.sampling = max(sampling, 1)
+        self.sends    = 0
+        # {id(instance) : [identifier, class name, number of records sent]}
+        # (Nodes identifiers are random and Gateways share the identifier
+        # of their From Node, so they cannot be used as keys)
+        self.counters = dict()
+        # (timestamp, identifier, class name, record)
+        self.events   = deque(maxlen = buffer_size)
+
+    @staticmethod
+    def init_options():
+        """
+        Prepare options supported by the Tracer.
+        """
+        opt = Options()
+        opt.add_argument(
+            "--trace", dest = "trace", choices = TRACE_MODES,
+            help = "Trace the records sent by the operators of each query plan.",
+            default = TRACE_OFF
+        )
+        opt.add_argument(
+            "--trace-sampling", type = int, dest = "trace_sampling",
+            help = "In sampled mode, store one trace event out of this number.",
+            default = DEFAULT_TRACE_SAMPLING
+        )
+        opt.add_argument(
+            "--trace-buffer", type = int, dest = "trace_buffer",
+            help = "Maximum number of trace events kept per query plan.",
+            default = DEFAULT_TRACE_BUFFER
+        )
+
+    @staticmethod
+    def get(annotations = None):
+        """
+        Args:
+            annotations: A dictionary possibly containing a 'trace' key
+                overriding the --trace option for a given Query.
+        Returns:
+            A new Tracer instance, or None if tracing is disabled.
+        """
+        mode = annotations.get('trace') if annotations else None
+        if not mode:
+            mode = Options().trace or TRACE_OFF
+        if mode == TRACE_OFF or mode not in TRACE_MODES:
+            return None
+        return Tracer(mode)
+
+    def __deepcopy__(self, memo):
+        # Copies of a traced AST (see SubQuery chunks) share its Tracer
+        return self
+
+    def install(self, instance):
+        """
+        Trace the records sent by a Node or a Gateway.
+        Args:
+            instance: A Node or a Gateway instance.
+        """
+        instance.tracer = self
+        instance.send = types.MethodType(traced_send, instance)
+
+    def trace(self, instance, record):
+        """
+        Account for a record sent by a traced instance.
+        Args:
+            instance: A Node or a Gateway instance.
+            record: The Record being sent.
+        """
+        identifier = instance.identifier
+        counter = self.counters.get(id(instance))
+        if counter:
+            counter[2] += 1
+        else:
+            self.counters[id(instance)] = [identifier, instance.__class__.__name__, 1]
+
+        if self.mode == TRACE_COUNTERS:
+            return
+        self.sends += 1
+        if self.mode == TRACE_SAMPLED and self.sends % self.sampling:
+            return
+        self.events.append((time.time(), identifier, instance.__class__.__name__, record))
+
+    def dump(self):
+        """
+        Returns:
+            A String summarizing the counters and the stored events.
+        """
+        out = ["TRACE (%s)" % self.mode]
+        for identifier, class_name, count in sorted(self.counters.values()):
+            out.append("[#%04d] %s: %d record(s)" % (identifier, class_name, count))
+        for timestamp, identifier, class_name, record in self.events:
+            out.append("%f [#%04d] SEND %s [ %r ] <%r>" % (
+                timestamp, identifier, class_name, record, record.get_annotations()
+            ))
+        return "\n".join(out)
@@ -0,0 +1,14 @@
+class ip {
+    const inet     ip;             /**< IP address */
+    const hostname hostname;       /**< Hostname */
+    const string   city;
+    const string   country_code;   /**< ISO 3166 country code */
+    const string   country;
+    const string   region_code;
+    const string   region;
+    const float    latitude;
+    const float    longitude;
+
+    KEY(ip);
+    CAPABILITY(join, selection, projection);
+};
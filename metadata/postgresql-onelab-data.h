@@ -101,7 +101,7 @@ class authority_data {
     bool enabled;
 
     KEY(authority_hrn);
-    CAPABILITY(join, selection, projection);
+    CAPABILITY(join, selection, projection, sort, limit, offset);
 };
 
 class slice_data {
@@ -110,7 +110,7 @@ class slice_data {
     string purpose;
 
     KEY(slice_urn);
-    CAPABILITY(join, selection, projection);
+    CAPABILITY(join, selection, projection, sort, limit, offset);
 };
 
 class user_data {
@@ -119,5 +119,5 @@ class user_data {
     string last_name;
 
     KEY(user_hrn);
-    CAPABILITY(join, selection, projection);
+    CAPABILITY(join, selection, projection, sort, limit, offset);
 };
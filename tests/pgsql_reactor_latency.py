@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Measure how much the PostgreSQL queries delay the Twisted reactor.
+#
+# N concurrent queries (one slow query out of four, the other ones
+# returning many rows) are run by PostgreSQLGateways while a probe,
+# scheduled every PROBE_PERIOD seconds in the reactor, measures how
+# late it is run. The benchmark is run twice:
+#  - pool_size = 0: queries are run in the reactor thread (former behaviour)
+#  - pool_size = N: queries are run by the ThreadPool of the platform
+#
+# Usage (requires a reachable PostgreSQL server):
+# ./pgsql_reactor_latency.py -n 20 -d test -U postgres
+
+import argparse, threading, time
+from twisted.internet.task          import LoopingCall
+
+from manifold.gateways.postgresql   import PostgreSQLGateway
+from manifold.util.reactor_thread   import ReactorThread
+
+PROBE_PERIOD = 0.01 # seconds
+SLOW_QUERY   = "SELECT pg_sleep(%(sleep)f), 1 AS i"
+FAST_QUERY   = "SELECT generate_series(1, %(rows)d) AS i"
+
+class BenchmarkGateway(PostgreSQLGateway):
+    """
+    A PostgreSQLGateway running a raw SQL query.
+    """
+
+    def __init__(self, platform, config, sql):
+        super(BenchmarkGateway, self).__init__(None, platform, None, config, None, None)
+        self.sql = sql
+
+    def get_records(self):
+        return self.iterselect(self.sql)
+
+class Probe(object):
+    """
+    Measures how late a periodic call is run by the reactor.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.delays = list()
+        self.last   = None
+
+    def __call__(self):
+        now = time.time()
+        if self.last is not None:
+            self.delays.append(max(now - self.last - self.period, 0))
+        self.last = now
+
+def run(num_queries, config, sleep, rows):
+    """
+    Run num_queries concurrent queries and measure the reactor latency.
+    Returns:
+        A tuple (elapsed time, average delay, maximum delay) in seconds.
+    """
+    reactor = ReactorThread().reactor
+    done    = threading.Event()
+    pending = [num_queries]
+
+    def callback(record):
+        if record.is_last():
+            pending[0] -= 1
+            if not pending[0]:
+                done.set()
+
+    probe = Probe(PROBE_PERIOD)
+    loop = LoopingCall(probe)
+    loop.clock = reactor
+    ReactorThread().callInReactor(loop.start, PROBE_PERIOD)
+
+    start = time.time()
+    for i in range(num_queries):
+        sql = SLOW_QUERY if i % 4 == 0 else FAST_QUERY
+        gateway = BenchmarkGateway(config["platform"], config, sql % {"sleep" : sleep, "rows" : rows})
+        gateway.set_callback(callback)
+        ReactorThread().callInReactor(gateway.start)
+    done.wait()
+    elapsed = time.time() - start
+
+    ReactorThread().callInReactor(loop.stop)
+    delays = probe.delays or [0]
+    return (elapsed, sum(delays) / len(delays), max(delays))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Measure the reactor latency induced by PostgreSQL queries.")
+    parser.add_argument("-n", "--num-queries", type = int, default = 20,          help = "Number of concurrent queries")
+    parser.add_argument("-d", "--db-name",                 default = "test",      help = "Database name")
+    parser.add_argument("-U", "--db-user",                 default = "postgres",  help = "Database user")
+    parser.add_argument("-P", "--db-password",             default = "",          help = "Database password")
+    parser.add_argument("-H", "--db-host",                 default = "localhost", help = "Database host")
+    parser.add_argument("-s", "--sleep", type = float,     default = 0.5,         help = "Duration of slow queries (seconds)")
+    parser.add_argument("-r", "--rows", type = int,        default = 10000,       help = "Number of rows returned by other queries")
+    args = parser.parse_args()
+
+    ReactorThread().start_reactor()
+    try:
+        for pool_size in [0, args.num_queries]:
+            config = {
+                "platform"    : "benchmark_%d" % pool_size,
+                "db_name"     : args.db_name,
+                "db_user"     : args.db_user,
+                "db_password" : args.db_password,
+                "db_host"     : args.db_host,
+                "pool_size"   : pool_size
+            }
+            elapsed, avg_delay, max_delay = run(args.num_queries, config, args.sleep, args.rows)
+            print "pool_size = %3d: %d queries in %.3fs, reactor delay avg = %.1fms max = %.1fms" % (
+                pool_size, args.num_queries, elapsed, avg_delay * 1000, max_delay * 1000
+            )
+    finally:
+        ReactorThread().stop_reactor()
+
+if __name__ == "__main__":
+    main()
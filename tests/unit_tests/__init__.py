@@ -0,0 +1,11 @@
+# Unit tests, run them with:
+#   python -m unittest discover -s tests/unit_tests -t .
+
+import sys
+from manifold.util.options import Options
+
+# Options (used by Log) parses the command line: make it ignore the
+# arguments of the test runner.
+argv, sys.argv = sys.argv, sys.argv[:1]
+Options().parse()
+sys.argv = argv
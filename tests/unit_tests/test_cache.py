@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time, unittest
+
+from manifold.core.cache        import CacheManager
+from manifold.core.cache_entry  import Entry, get_size
+from manifold.core.query        import Query
+from manifold.core.record       import Record, LastRecord
+
+def make_query(slice_hrn):
+    return Query().get("slice").filter_by("slice_hrn", "==", slice_hrn).select("slice_hrn")
+
+def make_records(slice_hrn, count = 10):
+    return [Record({"slice_hrn": slice_hrn, "i": i}) for i in range(count)]
+
+def complete(cache, query, records):
+    cache.add_entry(query, Entry())
+    for record in records:
+        cache.append_record(query, record)
+    cache.append_record(query, LastRecord())
+
+class CacheManagerTests(unittest.TestCase):
+
+    def test_memory_accounting(self):
+        manager = CacheManager(lifetime = 60, memory = 10 ** 9)
+        cache = manager.get_cache(1)
+        records = make_records("a")
+        complete(cache, make_query("a"), records)
+        self.assertEqual(manager.get_stats()["bytes"], get_size(records))
+        manager.delete_cache(1)
+        self.assertEqual(manager.get_stats()["bytes"], 0)
+        self.assertEqual(manager.get_stats()["entries"], 0)
+
+    def test_evicts_least_recently_used(self):
+        size = get_size(make_records("a"))
+        manager = CacheManager(lifetime = 60, memory = int(size * 2.5))
+        cache = manager.get_cache(1)
+        complete(cache, make_query("a"), make_records("a"))
+        complete(cache, make_query("b"), make_records("b"))
+        # "a" becomes the most recently used entry
+        cache.get_entry(make_query("a")).get_records()
+        complete(cache, make_query("c"), make_records("c"))
+
+        self.assertIsNotNone(cache.get_entry(make_query("a")))
+        self.assertIsNone(cache.get_entry(make_query("b")))
+        self.assertIsNotNone(cache.get_entry(make_query("c")))
+        self.assertEqual(manager.get_stats()["evictions"], 1)
+
+    def test_queries_in_progress_are_kept(self):
+        manager = CacheManager(lifetime = 60, memory = 1)
+        cache = manager.get_cache(1)
+        query = make_query("a")
+        evictions = list()
+        evict = manager.evict
+        manager.evict = lambda memory: evictions.append(memory) or evict(memory)
+
+        cache.add_entry(query, Entry())
+        for record in make_records("a"):
+            cache.append_record(query, record)
+        # Eviction failed once, it is not retried on every record
+        self.assertEqual(len(evictions), 1)
+        self.assertIsNotNone(cache.get_entry(query))
+
+        # Once complete, the entry can be evicted
+        cache.append_record(query, LastRecord())
+        complete(cache, make_query("b"), make_records("b"))
+        self.assertIsNone(cache.get_entry(query))
+
+    def test_collect_removes_expired_entries(self):
+        manager = CacheManager(lifetime = 60, memory = 10 ** 9)
+        cache = manager.get_cache(1)
+        complete(cache, make_query("a"), make_records("a"))
+        complete(cache, make_query("b"), make_records("b"))
+        cache.get_entry(make_query("a"))._updated = time.time() - 120
+
+        manager.collect()
+        self.assertIsNone(cache.get_entry(make_query("a")))
+        self.assertIsNotNone(cache.get_entry(make_query("b")))
+
+class CacheInvalidationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = CacheManager(lifetime = 60, memory = 10 ** 9)
+        self.cache = self.manager.get_cache(1)
+        for slice_hrn in ["a", "b"]:
+            complete(self.cache, make_query(slice_hrn), make_records(slice_hrn))
+
+    def test_disjoint_update_keeps_entries(self):
+        self.manager.invalidate(Query().update("slice").filter_by("slice_hrn", "==", "a").set({"description": "x"}))
+        self.assertIsNone(self.cache.get_entry(make_query("a")))
+        self.assertIsNotNone(self.cache.get_entry(make_query("b")))
+
+    def test_update_of_filtered_field(self):
+        # The updated record may now match slice_hrn == 'b'
+        self.manager.invalidate(Query().update("slice").filter_by("slice_hrn", "==", "a").set({"slice_hrn": "b"}))
+        self.assertIsNone(self.cache.get_entry(make_query("b")))
+
+    def test_namespaces(self):
+        query = make_query("a")
+        query.object = "ple:slice"
+        complete(self.cache, query, make_records("a"))
+        self.cache.add_objects(query, ["ple:resource"])
+
+        self.manager.invalidate(Query().update("resource").filter_by("hrn", "==", "r").set({"x": 1}))
+        self.assertIsNone(self.cache.get_entry(query))
+        self.assertIsNotNone(self.cache.get_entry(make_query("b")))
+
+        complete(self.cache, query, make_records("a"))
+        self.manager.invalidate(Query().update("ple:slice").filter_by("slice_hrn", "==", "b").set({"x": 1}))
+        # Disjoint from the update
+        self.assertIsNotNone(self.cache.get_entry(query))
+        # Might be altered through the platform
+        self.assertIsNone(self.cache.get_entry(make_query("b")))
+        self.assertIsNone(self.cache.get_entry(make_query("a")))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from manifold.core.cache        import CachePartition
+from manifold.core.cache_entry  import Entry
+from manifold.core.query        import Query
+
+def make_query(*fields):
+    return Query().get("slice").filter_by("slice_hrn", "==", "a").select(*fields)
+
+class CachePartitionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.partition = CachePartition()
+        self.small, self.large = Entry(), Entry()
+        self.partition.add(make_query("slice_hrn", "users"), self.small)
+        self.partition.add(make_query("slice_hrn", "users", "resources", "leases"), self.large)
+
+    def test_exact_match(self):
+        self.assertIs(self.partition.get_data(make_query("users", "slice_hrn")), self.small)
+        self.assertIsNone(self.partition.get_data(make_query("slice_hrn")))
+        self.assertRaises(Exception, self.partition.add, make_query("slice_hrn", "users"), Entry())
+
+    def test_best_match_is_the_closest_one(self):
+        query, entry = self.partition.get_best(make_query("slice_hrn"))
+        self.assertIs(entry, self.small)
+        query, entry = self.partition.get_best(make_query("resources"))
+        self.assertIs(entry, self.large)
+
+    def test_no_match(self):
+        # Unknown field
+        self.assertIsNone(self.partition.get_best(make_query("slice_hrn", "unknown")))
+        # Unknown filter key
+        query = make_query("slice_hrn").filter_by("authority", "==", "b")
+        self.assertIsNone(self.partition.get_best(query))
+
+    def test_remove(self):
+        self.partition.remove(make_query("slice_hrn", "users"), self.small)
+        self.assertEqual(len(self.partition), 1)
+        self.assertIsNone(self.partition.get_data(make_query("slice_hrn", "users")))
+        query, entry = self.partition.get_best(make_query("slice_hrn"))
+        self.assertIs(entry, self.large)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from datetime                       import datetime, timedelta
+
+try:
+    from manifold.gateways.sfa.credential_cache import CredentialCache, CREDENTIAL_REFRESH_MARGIN
+except ImportError:
+    # sfa is not installed
+    CredentialCache = None
+
+def make_cache():
+    cache = object.__new__(CredentialCache)
+    cache.__init__()
+    # Do not start the background refresh
+    cache.loop = True
+    return cache
+
+@unittest.skipIf(CredentialCache is None, "sfa is not installed")
+class CredentialCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = make_cache()
+        self.refreshed = list()
+        self.soon  = datetime.now() + timedelta(seconds = CREDENTIAL_REFRESH_MARGIN / 2)
+        self.later = datetime.now() + timedelta(seconds = CREDENTIAL_REFRESH_MARGIN * 2)
+
+    def refresh(self, key, expiration):
+        def refresh():
+            self.refreshed.append(key)
+            if expiration is not None:
+                self.cache.watch(key, expiration, refresh)
+        return refresh
+
+    def test_accounts_are_refreshed_before_expiration(self):
+        self.cache.watch("a", self.soon, self.refresh("a", self.later))
+        self.cache.watch("b", self.later, self.refresh("b", self.later))
+        self.cache.refresh()
+        self.assertEqual(self.refreshed, ["a"])
+        # The refreshed account is watched again
+        self.assertEqual(self.cache.accounts["a"][0], self.later)
+        self.cache.refresh()
+        self.assertEqual(self.refreshed, ["a"])
+
+    def test_credentials_which_are_not_renewed_are_not_retried(self):
+        self.cache.watch("a", self.soon, self.refresh("a", self.soon))
+        self.cache.refresh()
+        self.assertEqual(self.refreshed, ["a"])
+        self.assertFalse("a" in self.cache.accounts)
+        self.cache.refresh()
+        self.assertEqual(self.refreshed, ["a"])
+
+        # The account is watched again once managed on the request path
+        self.cache.watch("a", self.later, self.refresh("a", self.later))
+        self.assertTrue("a" in self.cache.accounts)
+
+    def test_failed_refresh(self):
+        def refresh():
+            self.refreshed.append("a")
+            raise Exception("registry unreachable")
+        self.cache.watch("a", self.soon, refresh)
+        self.cache.refresh()
+        self.cache.refresh()
+        self.assertEqual(self.refreshed, ["a"])
+        self.assertEqual(self.cache.refreshing, {})
+
+    def test_unwatch(self):
+        self.cache.watch("a", self.soon, self.refresh("a", self.later))
+        self.cache.watch("a", None, None)
+        self.cache.refresh()
+        self.assertEqual(self.refreshed, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, shutil, tempfile, unittest
+
+from manifold.core.query        import Query
+from manifold.gateways.csv      import CSVGateway, INDEX_SUFFIX
+
+ROWS = [("alpha", 1), ("bravo", 2), ("charlie", 3), ("bravo", 4), ("delta", 5)]
+
+def write_csv(filename, rows):
+    with open(filename, 'wb') as f:
+        f.write("hostname,load\n")
+        for hostname, load in rows:
+            f.write("%s,%d\n" % (hostname, load))
+
+class CSVIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        CSVGateway.file_infos.clear()
+        CSVGateway.indexes.clear()
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "node.csv")
+        self.index_filename = self.filename + ".0" + INDEX_SUFFIX
+        write_csv(self.filename, ROWS)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        CSVGateway.file_infos.clear()
+        CSVGateway.indexes.clear()
+
+    def make_gateway(self, query, index = True):
+        config = dict()
+        # Two tables over the same file, with distinct keys
+        for table, key in [("node", "hostname"), ("load", "load")]:
+            config[table] = {
+                "filename" : self.filename,
+                "key"      : key,
+                "fields"   : [["hostname", "string"], ["load", "int"]],
+                "index"    : index
+            }
+        return CSVGateway(None, "csv", query, config, None, None)
+
+    def run_query(self, hostnames, index = True, table = "node", key = "hostname"):
+        query = Query().get(table).filter_by(key, "INCLUDED", hostnames).select("hostname", "load")
+        gateway = self.make_gateway(query, index)
+        records = list()
+        gateway.set_callback(records.append)
+        gateway.start()
+        self.assertTrue(records[-1].is_last())
+        return gateway, [(record["hostname"], record["load"]) for record in records[:-1]]
+
+    def test_offsets_point_to_rows(self):
+        gateway = self.make_gateway(None)
+        dialect, _, _ = gateway.get_dialect_and_field_info("node")
+        offsets = gateway.build_index(self.filename, dialect, True, 0)
+        self.assertEqual(sorted(offsets.keys()), ["alpha", "bravo", "charlie", "delta"])
+        self.assertEqual(len(offsets["bravo"]), 2)
+        with open(self.filename, 'rb') as f:
+            for hostname, positions in offsets.items():
+                for position in positions:
+                    f.seek(position)
+                    self.assertTrue(f.readline().startswith(hostname + ","))
+
+    def test_lookup_uses_saved_index(self):
+        gateway, records = self.run_query(["bravo", "delta", "unknown"])
+        self.assertEqual(records, [("bravo", 2), ("bravo", 4), ("delta", 5)])
+        self.assertTrue(os.path.exists(self.index_filename))
+
+        # The saved index is loaded (instead of being rebuilt) by other processes
+        _, index = CSVGateway.indexes.pop((self.filename, 0))
+        gateway.build_index = None
+        dialect, _, _ = gateway.get_dialect_and_field_info("node")
+        self.assertEqual(gateway.get_index("node", dialect, 0), index)
+
+    def test_index_is_rebuilt_when_the_file_changes(self):
+        self.run_query(["echo"])
+        write_csv(self.filename, ROWS + [("echo", 6)])
+        # Make sure the (mtime, size) stamp changes
+        os.utime(self.filename, (0, 0))
+        _, records = self.run_query(["echo", "alpha"])
+        self.assertEqual(records, [("alpha", 1), ("echo", 6)])
+
+    def test_unindexed_table_is_scanned(self):
+        gateway, records = self.run_query(["charlie"], index = False)
+        self.assertEqual(records, [("charlie", 3)])
+        self.assertFalse(os.path.exists(self.index_filename))
+        self.assertEqual(CSVGateway.indexes, {})
+
+    def test_tables_with_distinct_keys(self):
+        def run_queries():
+            _, records = self.run_query(["bravo"])
+            self.assertEqual(records, [("bravo", 2), ("bravo", 4)])
+            _, records = self.run_query([4, 5], table = "load", key = "load")
+            self.assertEqual(records, [("bravo", 4), ("delta", 5)])
+            self.assertEqual(sorted(CSVGateway.indexes.keys()), [(self.filename, 0), (self.filename, 1)])
+
+        run_queries()
+        self.assertTrue(os.path.exists(self.filename + ".1" + INDEX_SUFFIX))
+        # Each saved index is loaded from its own file instead of being rebuilt
+        CSVGateway.indexes.clear()
+        build_index = CSVGateway.build_index
+        CSVGateway.build_index = None
+        try:
+            run_queries()
+        finally:
+            CSVGateway.build_index = build_index
+
+    def test_malformed_file_is_reported(self):
+        # The malformed row is either scanned, or sniffed by get_file_info
+        rows = [("node%d" % i, i) for i in range(200)]
+        for malformed in [rows + [("echo\0", 6)], [("echo\0", 6)] + rows]:
+            CSVGateway.file_infos.clear()
+            write_csv(self.filename, malformed)
+            query = Query().get("node").select("hostname", "load")
+            gateway = self.make_gateway(query, False)
+            records = list()
+            gateway.set_callback(records.append)
+            gateway.start()
+            self.assertTrue(records[-1].is_last())
+            result_value = gateway.get_result_value()
+            self.assertEqual(len(result_value), 1)
+            self.assertTrue(self.filename in result_value[0]["description"])
+
+if __name__ == '__main__':
+    unittest.main()
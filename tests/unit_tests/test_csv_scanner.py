@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv, os, shutil, tempfile, unittest
+
+from manifold.core.filter           import Filter
+from manifold.gateways.csv.scanner  import CSVScanner
+from manifold.util.predicate        import Predicate
+
+FIELD_NAMES = ["hostname", "load", "site"]
+FIELD_TYPES = ["string", "int", "string"]
+
+ROWS = [
+    ("alpha",   "1", "paris"),
+    ("bravo",   "2", "berlin"),
+    ("charlie", "3", "paris"),
+    ("delta",   "4", "rome"),
+    ("echo",    "5", "paris"),
+]
+
+def make_filter(*predicates):
+    filter = Filter()
+    for predicate in predicates:
+        filter.filter_by(Predicate(*predicate))
+    return filter
+
+class CSVScannerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "node.csv")
+        with open(self.filename, 'wb') as f:
+            f.write("hostname,load,site\n")
+            for row in ROWS:
+                f.write(",".join(row) + "\n")
+            # Empty and short rows
+            f.write("\n")
+            f.write("foxtrot,6\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def scan(self, filter = None, fields = None, batch_size = None, offsets = None):
+        scanner = CSVScanner(self.filename, csv.excel, True, FIELD_NAMES, FIELD_TYPES, batch_size)
+        return [record.get_dict() for record in scanner.scan(filter, fields, offsets)]
+
+    def test_scan_converts_values(self):
+        records = self.scan()
+        self.assertEqual(len(records), len(ROWS) + 1)
+        self.assertEqual(records[0], {"hostname": "alpha", "load": 1, "site": "paris"})
+        # Short rows are padded with None
+        self.assertEqual(records[-1], {"hostname": "foxtrot", "load": 6, "site": None})
+
+    def test_projection(self):
+        records = self.scan(fields = set(["hostname"]))
+        self.assertEqual(records[:2], [{"hostname": "alpha"}, {"hostname": "bravo"}])
+
+    def test_filters(self):
+        filters = [
+            (make_filter(("site", "==", "paris")),                       ["alpha", "charlie", "echo"]),
+            (make_filter(("site", "!=", "paris")),                       ["bravo", "delta", "foxtrot"]),
+            (make_filter(("site", "INCLUDED", ["rome", "berlin"])),      ["bravo", "delta"]),
+            (make_filter(("load", ">", 3)),                              ["delta", "echo", "foxtrot"]),
+            (make_filter(("load", "<=", 3), ("site", "==", "paris")),    ["alpha", "charlie"]),
+            # Evaluated by Predicate.match (prefix match)
+            (make_filter(("hostname", ">=", "delta.lab")),               ["delta"]),
+            # Predicates on fields which are not in the file are ignored
+            (make_filter(("site", "==", "rome"), ("country", "==", "fr")), ["delta"]),
+        ]
+        for filter, hostnames in filters:
+            for batch_size in [1, 2, None]:
+                records = self.scan(filter, set(["hostname"]), batch_size)
+                self.assertEqual([record["hostname"] for record in records], hostnames)
+
+    def test_offsets(self):
+        offsets = list()
+        with open(self.filename, 'rb') as f:
+            f.readline()
+            for hostname in ["alpha", "bravo", "charlie", "delta"]:
+                position = f.tell()
+                if hostname in ["bravo", "delta"]:
+                    offsets.append(position)
+                f.readline()
+        records = self.scan(make_filter(("load", ">", 2)), set(["hostname"]), offsets = offsets)
+        self.assertEqual(records, [{"hostname": "delta"}])
+
+    def test_empty_file(self):
+        open(self.filename, 'wb').close()
+        self.assertEqual(self.scan(), [])
+
+if __name__ == '__main__':
+    unittest.main()
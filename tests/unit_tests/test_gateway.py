@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import copy, unittest
+
+from manifold.core.query   import Query
+from manifold.gateways     import Gateway
+
+class FakeGateway(Gateway):
+    def __init__(self, *args, **kwargs):
+        super(FakeGateway, self).__init__(*args, **kwargs)
+        self.connection = object()
+
+class GatewayTests(unittest.TestCase):
+
+    def test_deepcopy_keeps_subclass_state(self):
+        gateway = FakeGateway(None, "ple", Query().get("slice").select("slice_hrn"), {"url": "x"})
+        gateway.identifier = 42
+        gateway.connection = "bootstrapped"
+        gateway.result_value.append("error")
+
+        clone = copy.deepcopy(gateway)
+        self.assertIsInstance(clone, FakeGateway)
+        self.assertEqual(clone.connection, "bootstrapped")
+        self.assertEqual(clone.identifier, 42)
+        self.assertIs(clone.config, gateway.config)
+        self.assertIsNot(clone.query, gateway.query)
+        self.assertEqual(clone.query.get_from(), "slice")
+        self.assertEqual(clone.result_value, [])
+
+if __name__ == '__main__':
+    unittest.main()
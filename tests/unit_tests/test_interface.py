@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time, unittest
+
+from manifold.auth              import AuthCache
+from manifold.core              import interface as interface_module
+from manifold.core.interface    import Interface
+from manifold.core.query        import Query
+
+PLATFORMS = [{"platform_id": 1, "platform": "ple"}, {"platform_id": 2, "platform": "omf"}]
+
+def make_interface():
+    # Bypass the constructor, which needs a Storage
+    interface = Interface.__new__(Interface)
+    interface._user_configs = dict()
+    interface._user_configs_purge = 0
+    interface.resolved = list()
+    def resolve_user_configs(user_id, platforms):
+        interface.resolved.append((user_id, [platform["platform_id"] for platform in platforms]))
+        return dict((platform["platform_id"], {"user_hrn": "%s.%s" % (platform["platform"], user_id)}) for platform in platforms)
+    interface.resolve_user_configs = resolve_user_configs
+    return interface
+
+class UserConfigTests(unittest.TestCase):
+
+    def test_user_configs_are_memoized(self):
+        interface = make_interface()
+        user_configs = interface.get_user_configs({"user_id": 7}, PLATFORMS)
+        self.assertEqual(user_configs[1], {"user_hrn": "ple.7"})
+        # Callers get copies
+        user_configs[1]["user_hrn"] = "modified"
+        self.assertEqual(interface.get_user_configs({"user_id": 7}, PLATFORMS)[1], {"user_hrn": "ple.7"})
+        self.assertEqual(interface.resolved, [(7, [1, 2])])
+
+    def test_invalidate_one_account(self):
+        interface = make_interface()
+        interface.get_user_configs({"user_id": 7}, PLATFORMS)
+        interface.get_user_configs({"user_id": 8}, PLATFORMS)
+        interface.invalidate_user_configs(7, 2)
+        interface.get_user_configs({"user_id": 7}, PLATFORMS)
+        interface.get_user_configs({"user_id": 8}, PLATFORMS)
+        self.assertEqual(interface.resolved, [(7, [1, 2]), (8, [1, 2]), (7, [2])])
+
+        interface.invalidate_user_configs()
+        interface.get_user_configs({"user_id": 8}, PLATFORMS)
+        self.assertEqual(interface.resolved[-1], (8, [1, 2]))
+
+    def test_expired_user_configs_are_purged(self):
+        interface = make_interface()
+        saved = time.time
+        now = [1000.0]
+        time.time = lambda: now[0]
+        try:
+            interface.get_user_configs({"user_id": 7}, PLATFORMS)
+            now[0] += interface_module.USER_CONFIG_LIFETIME / 2
+            interface.get_user_configs({"user_id": 8}, PLATFORMS[:1])
+            self.assertEqual(len(interface._user_configs), 3)
+            # The configurations of user 7 have expired, the one of user 8 has not
+            now[0] += interface_module.USER_CONFIG_LIFETIME * 3 / 4
+            interface.get_user_configs({"user_id": 9}, PLATFORMS[:1])
+            self.assertEqual(sorted(interface._user_configs.keys()), [(8, 1), (9, 1)])
+        finally:
+            time.time = saved
+
+class AuthCacheInvalidationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = AuthCache()
+        self.cache.clear()
+        expires = time.time() + 3600
+        for user_id, email in [(1, "a@x"), (2, "b@x")]:
+            user = {"user_id": user_id, "email": email}
+            self.cache.add(self.cache.get_password_key(email, "pw"), user, expires)
+            self.cache.add(self.cache.get_session_key("token%d" % user_id), user, expires)
+
+        # Local queries are run by a (fake) Storage
+        self.execute = interface_module.Storage.execute
+        interface_module.Storage.execute = staticmethod(lambda query, user = None: [])
+        self.interface = make_interface()
+        self.interface.send = lambda query, records, annotations, is_deferred: records
+
+    def tearDown(self):
+        interface_module.Storage.execute = self.execute
+        self.cache.clear()
+
+    def is_cached(self, user_id, email):
+        return (
+            self.cache.get(self.cache.get_password_key(email, "pw")) is not None,
+            self.cache.get(self.cache.get_session_key("token%d" % user_id)) is not None
+        )
+
+    def test_login_keeps_other_users(self):
+        # User A logs in (new session), then logs out
+        self.interface.forward(Query.create("local:session").set({"session": "token3", "user_id": 1}))
+        self.assertEqual(self.is_cached(1, "a@x"), (True, True))
+        self.interface.forward(Query.delete("local:session").filter_by("session", "==", "token1"))
+        self.assertEqual(self.is_cached(1, "a@x"), (True, False))
+        self.assertEqual(self.is_cached(2, "b@x"), (True, True))
+
+    def test_user_update(self):
+        self.interface.forward(Query.update("local:user").filter_by("user_id", "==", 1).set({"password": "new"}))
+        self.assertEqual(self.is_cached(1, "a@x"), (False, False))
+        self.assertEqual(self.is_cached(2, "b@x"), (True, True))
+
+    def test_expired_sessions_cleanup(self):
+        self.interface.forward(Query.delete("local:session").filter_by("expires", "<", int(time.time())))
+        self.assertEqual(self.is_cached(1, "a@x"), (True, True))
+        self.assertEqual(self.is_cached(2, "b@x"), (True, True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from twisted.internet               import defer
+
+from manifold.util.keyed_lock       import KeyedLock
+
+class Call(object):
+    """
+    A call whose result is given once the test fires it.
+    """
+    def __init__(self):
+        self.deferreds = list()
+
+    def __call__(self, *args):
+        d = defer.Deferred()
+        self.deferreds.append((args, d))
+        return d
+
+def collect(d, results):
+    d.addBoth(results.append)
+    return results
+
+class KeyedLockTests(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = KeyedLock("test")
+        self.call = Call()
+
+    def test_same_key_is_serialized(self):
+        first  = collect(self.lock.run("a", self.call, 1), list())
+        second = collect(self.lock.run("a", self.call, 2), list())
+        # The second call waits for the first one
+        self.assertEqual([args for args, _ in self.call.deferreds], [(1,)])
+        self.call.deferreds[0][1].callback("one")
+        self.assertEqual(first, ["one"])
+        self.assertEqual([args for args, _ in self.call.deferreds], [(1,), (2,)])
+        self.call.deferreds[1][1].callback("two")
+        self.assertEqual(second, ["two"])
+        self.assertEqual(self.lock.locks, {})
+        stats = self.lock.get_stats()
+        self.assertEqual((stats["acquisitions"], stats["contentions"], stats["locked"]), (2, 1, 0))
+
+    def test_distinct_keys_run_concurrently(self):
+        self.lock.run("a", self.call, 1)
+        self.lock.run("b", self.call, 2)
+        self.assertEqual(len(self.call.deferreds), 2)
+        self.assertEqual(self.lock.get_stats()["contentions"], 0)
+
+    def test_coalesce(self):
+        first  = collect(self.lock.coalesce("a", self.call), list())
+        second = collect(self.lock.coalesce("a", self.call), list())
+        other  = collect(self.lock.coalesce("b", self.call), list())
+        self.assertEqual(len(self.call.deferreds), 2)
+        self.call.deferreds[0][1].callback({"credential": "x"})
+        self.assertEqual(first, [{"credential": "x"}])
+        self.assertEqual(second, [{"credential": "x"}])
+        # Waiters get a copy of the result
+        self.assertIsNot(first[0], second[0])
+        self.assertEqual(other, [])
+        self.assertEqual(self.lock.inflight.keys(), ["b"])
+
+        # Once the call is done, a new call is issued
+        self.lock.coalesce("a", self.call)
+        self.assertEqual(len(self.call.deferreds), 3)
+
+    def test_coalesced_failures(self):
+        first  = collect(self.lock.coalesce("a", self.call), list())
+        second = collect(self.lock.coalesce("a", self.call), list())
+        self.call.deferreds[0][1].errback(ValueError("unreachable registry"))
+        for results in [first, second]:
+            self.assertTrue(results[0].check(ValueError))
+        self.assertEqual(self.lock.locks, {})
+
+if __name__ == '__main__':
+    unittest.main()
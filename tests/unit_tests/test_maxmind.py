@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, unittest
+from twisted.internet               import defer
+
+from manifold.core.query            import Query
+from manifold.gateways              import maxmind
+from manifold.gateways.maxmind      import CSVDatabase, MaxMindGateway
+
+DATABASE = os.path.join(os.path.dirname(__file__), "data", "geoip.csv")
+
+class CountingDatabase(object):
+    """
+    Wraps a database and records the values looked up.
+    """
+    def __init__(self, database):
+        self.database = database
+        self.lookups  = list()
+
+    def record_by_addr(self, addr):
+        self.lookups.append(addr)
+        return self.database.record_by_addr(addr)
+
+    def gethostbyname(self, name):
+        self.lookups.append(name)
+        return self.database.gethostbyname(name)
+
+class FakeReactor(object):
+    def getThreadPool(self):
+        return None
+
+class RunningReactorThread(object):
+    reactor = FakeReactor()
+
+    def isReactorRunning(self):
+        return True
+
+def make_query(ips = None, hostnames = None):
+    query = Query().get("ip").select("ip", "hostname", "city", "latitude")
+    if ips:
+        query.filter_by("ip", "INCLUDED", ips)
+    if hostnames:
+        query.filter_by("hostname", "INCLUDED", hostnames)
+    return query
+
+def run(query, **config):
+    config["database"] = DATABASE
+    gateway = MaxMindGateway(None, "maxmind", query, config, None, None)
+    records = list()
+    gateway.set_callback(records.append)
+    gateway.start()
+    return gateway, records
+
+class CSVDatabaseTests(unittest.TestCase):
+
+    def test_records(self):
+        database = CSVDatabase(DATABASE)
+        record = database.record_by_addr("132.227.62.120")
+        self.assertEqual(record["city"], u"Paris")
+        self.assertEqual(record["latitude"], 48.8667)
+        self.assertFalse("ip" in record)
+        self.assertEqual(database.record_by_name("planetlab1.upmc.fr")["region_name"], u"Ile-de-France")
+        self.assertEqual(database.gethostbyname("planetlab1.upmc.fr"), "132.227.62.121")
+        self.assertIsNone(database.record_by_addr("10.0.0.1"))
+
+class MaxMindGatewayTests(unittest.TestCase):
+
+    def setUp(self):
+        MaxMindGateway.lookups.clear()
+        MaxMindGateway.databases[DATABASE] = self.database = CountingDatabase(CSVDatabase(DATABASE))
+
+    def tearDown(self):
+        MaxMindGateway.lookups.clear()
+        MaxMindGateway.databases.pop(DATABASE, None)
+
+    def test_lookup(self):
+        _, records = run(make_query(["132.227.62.120", "10.0.0.1"], ["planetlab1.upmc.fr"]))
+        self.assertTrue(records[-1].is_last())
+        self.assertEqual([record.get_dict() for record in records[:-1]], [
+            {"ip": "132.227.62.120", "hostname": None, "city": u"Paris", "latitude": 48.8667},
+            {"ip": "10.0.0.1", "hostname": None, "city": None, "latitude": None},
+            {"ip": "132.227.62.121", "hostname": "planetlab1.upmc.fr", "city": u"Paris", "latitude": 48.8667},
+        ])
+
+    def test_unresolved_hostnames_are_not_sent(self):
+        _, records = run(make_query(hostnames = ["planetlab1.upmc.fr", "unknown.example.org"]))
+        self.assertEqual([record["ip"] for record in records[:-1]], ["132.227.62.121"])
+        # Unresolved hostnames are memoized as well
+        run(make_query(hostnames = ["unknown.example.org"]))
+        self.assertEqual(self.database.lookups.count("unknown.example.org"), 1)
+
+    def test_other_predicates_are_applied(self):
+        ips = ["132.227.62.120", "138.96.0.1", "10.0.0.1"]
+        for predicate, expected in [
+            (("city", "==", "Paris"),     ["132.227.62.120"]),
+            (("latitude", ">", 45),       ["132.227.62.120"]),
+            (("city", "!=", "Paris"),     ["138.96.0.1", "10.0.0.1"]),
+        ]:
+            # Memoized lookups are filtered as well
+            for i in range(2):
+                _, records = run(make_query(ips).filter_by(*predicate))
+                self.assertEqual([record["ip"] for record in records[:-1]], expected)
+                self.assertTrue(records[-1].is_last())
+
+    def test_predicates_on_fields_which_are_not_selected(self):
+        query = Query().get("ip").select("ip").filter_by("ip", "INCLUDED", ["132.227.62.120", "138.96.0.1"])
+        _, records = run(query.filter_by("city", "==", "Sophia Antipolis"))
+        self.assertEqual([record.get_dict() for record in records[:-1]], [{"ip": "138.96.0.1"}])
+
+    def test_lookups_are_memoized(self):
+        run(make_query(["132.227.62.120", "138.96.0.1"]))
+        _, records = run(make_query(["138.96.0.1", "10.0.0.1"]))
+        self.assertEqual(self.database.lookups, ["132.227.62.120", "138.96.0.1", "10.0.0.1"])
+        # Memoized values are sent first
+        self.assertEqual([record["ip"] for record in records[:-1]], ["138.96.0.1", "10.0.0.1"])
+        self.assertEqual(records[0]["city"], u"Sophia Antipolis")
+
+    def test_least_recently_used_lookups_are_evicted(self):
+        run(make_query(["132.227.62.120", "138.96.0.1"]), cache_size = 2)
+        run(make_query(["132.227.62.120", "10.0.0.1"]), cache_size = 2)
+        self.assertEqual([key[2] for key in MaxMindGateway.lookups], ["132.227.62.120", "10.0.0.1"])
+
+    def test_misses_are_resolved_in_a_thread(self):
+        calls = list()
+        def deferToThreadPool(reactor, thread_pool, f, *args):
+            calls.append(f)
+            return defer.maybeDeferred(f, *args)
+        saved = maxmind.deferToThreadPool, maxmind.ReactorThread
+        maxmind.deferToThreadPool, maxmind.ReactorThread = deferToThreadPool, RunningReactorThread
+        try:
+            run(make_query(["132.227.62.120"]))
+            _, records = run(make_query(["132.227.62.120"], ["planetlab1.upmc.fr"]))
+        finally:
+            maxmind.deferToThreadPool, maxmind.ReactorThread = saved
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([record["city"] for record in records[:-1]], [u"Paris", u"Paris"])
+        self.assertTrue(records[-1].is_last())
+
+    def test_onjoin_only(self):
+        gateway, records = run(Query().get("ip").select("ip", "city"))
+        self.assertEqual(len(records), 1)
+        self.assertTrue(records[0].is_last())
+        self.assertEqual(len(gateway.get_result_value()), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import cPickle, unittest
+
+from manifold.core.record           import Record
+
+try:
+    from manifold.gateways.sfa      import parser_pool
+    from manifold.gateways.sfa.parser_pool import RSpecParserPool, PARSERS, parse_rspec, to_plain
+except ImportError:
+    # sfa is not installed
+    RSpecParserPool = None
+
+class FakeParser(object):
+    """
+    Stands for an RSpec parser.
+    """
+    @classmethod
+    def parse(cls, rspec, rspec_version = None):
+        return {
+            "resource" : [Record({"urn": rspec, "location": (48.85, 2.35), "interfaces": ["eth0"]})],
+            "lease"    : list(),
+            "version"  : rspec_version
+        }
+
+def make_pool(pool_size):
+    pool = object.__new__(RSpecParserPool)
+    pool.__init__(pool_size)
+    return pool
+
+@unittest.skipIf(RSpecParserPool is None, "sfa is not installed")
+class RSpecParserPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        PARSERS[FakeParser.__name__] = FakeParser
+
+    def tearDown(self):
+        del PARSERS[FakeParser.__name__]
+
+    def test_to_plain(self):
+        parsed = to_plain(FakeParser.parse(u"urn:node1", "GENI 3"))
+        resource = parsed["resource"][0]
+        self.assertEqual(type(resource), dict)
+        # Tuples are preserved
+        self.assertEqual(resource["location"], (48.85, 2.35))
+        self.assertEqual(resource["interfaces"], ["eth0"])
+        self.assertEqual(cPickle.loads(cPickle.dumps(parsed, cPickle.HIGHEST_PROTOCOL)), parsed)
+
+    def test_worker_process_round_trip(self):
+        pool = make_pool(1)
+        pool.start()
+        try:
+            parsed = pool.pool.apply(parse_rspec, ("FakeParser", "parse", u"urn:node1", "GENI 3"))
+        finally:
+            pool.thread_pool.stop()
+            pool.pool.terminate()
+        self.assertEqual(parsed, to_plain(FakeParser.parse(u"urn:node1", "GENI 3")))
+        self.assertEqual(parsed["resource"][0]["location"], (48.85, 2.35))
+
+    def test_without_worker_processes(self):
+        results = list()
+        make_pool(0).parse(FakeParser, "parse", "urn:node1", "GENI 3").addCallback(results.append)
+        self.assertEqual(results[0]["version"], "GENI 3")
+        self.assertIsInstance(results[0]["resource"][0], Record)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import Queue, threading, unittest
+
+from manifold.core.query    import Query
+from manifold.core.record   import LastRecord
+
+try:
+    from manifold.gateways            import postgresql
+    from manifold.gateways.postgresql import PostgreSQLGateway
+except ImportError:
+    # psycopg2 and pgdb are not installed
+    PostgreSQLGateway = None
+
+class FakeCursor(object):
+    """
+    A DB-API cursor returning the rows given to its FakeConnection.
+    """
+    def __init__(self, connection, name):
+        self.connection  = connection
+        self.name        = name
+        self.rows        = list()
+        self.description = None
+        self.rowcount    = -1
+        self.lastrowid   = None
+        self.fetches     = 0
+        self.closed      = False
+
+    def execute(self, query, params = None):
+        self.connection.executed.append((self.name, query, params))
+        if query.lstrip().upper().startswith(("SELECT", "EXECUTE")):
+            self.rows = list(self.connection.rows)
+            self.description = [(column,) for column in self.connection.columns]
+
+    def fetchmany(self, size):
+        self.fetches += 1
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self.rows = self.rows, list()
+        return rows
+
+    def close(self):
+        self.closed = True
+
+class FakeConnection(object):
+    """
+    A psycopg2 connection whose SELECT queries return a given result set.
+    """
+    encoding = "UTF8"
+    closed   = 0
+
+    def __init__(self, columns, rows):
+        self.columns  = columns
+        self.rows     = rows
+        self.executed = list()
+        self.cursors  = list()
+        self.prepared = set()
+        self.commits  = 0
+
+    def cursor(self, name = None, cursor_factory = None):
+        cursor = FakeCursor(self, name)
+        self.cursors.append(cursor)
+        return cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+def make_gateway(query, rows, **config):
+    gateway = PostgreSQLGateway(None, "test", query, config, None, None)
+    gateway.connection = FakeConnection(["slice_hrn", "authority"], rows)
+    return gateway
+
+ROWS = [("slice%d" % i, "authority%d" % (i % 3)) for i in range(5)]
+
+@unittest.skipIf(PostgreSQLGateway is None, "psycopg2 is not installed")
+class IterSelectTests(unittest.TestCase):
+
+    def test_server_side_cursor(self):
+        gateway = make_gateway(Query().get("slice").select("slice_hrn", "authority"), ROWS)
+        records = list(gateway.iterselect("SELECT * FROM slice", itersize = 2))
+
+        self.assertEqual([record["slice_hrn"] for record in records], [row[0] for row in ROWS])
+        # Records share their schema
+        self.assertTrue(all(record.get_schema() is records[0].get_schema() for record in records))
+        cursor, = gateway.connection.cursors
+        # A named (server-side) cursor fetched by batches, then closed
+        self.assertTrue(cursor.name.startswith("manifold_"))
+        self.assertEqual(cursor.fetches, 4)
+        self.assertTrue(cursor.closed)
+
+    def test_lazy_fetch(self):
+        gateway = make_gateway(Query().get("slice").select("slice_hrn", "authority"), ROWS)
+        records = gateway.iterselect("SELECT * FROM slice", itersize = 2)
+        records.next()
+        cursor, = gateway.connection.cursors
+        self.assertEqual(cursor.fetches, 1)
+        records.close()
+        self.assertTrue(cursor.closed)
+
+    def test_itersize_zero_uses_selectall(self):
+        gateway = make_gateway(Query().get("slice").select("slice_hrn", "authority"), ROWS, itersize = 0)
+        records = list(gateway.iterselect("SELECT * FROM slice"))
+        self.assertEqual(len(records), len(ROWS))
+        cursor, = gateway.connection.cursors
+        self.assertIsNone(cursor.name)
+
+    def test_get_query_sends_records(self):
+        gateway = make_gateway(Query().get("slice").select("slice_hrn", "authority"), ROWS, pool_size = 0, prepare = False)
+        received = list()
+        gateway.set_callback(received.append)
+        gateway.start()
+        self.assertEqual(len(received), len(ROWS) + 1)
+        self.assertTrue(received[-1].is_last())
+
+    def test_stop_closes_the_cursor(self):
+        gateway = make_gateway(Query().get("slice").select("slice_hrn", "authority"), ROWS, pool_size = 0, prepare = False, itersize = 2)
+        received = list()
+        def callback(record):
+            received.append(record)
+            if len(received) == 2:
+                gateway.stop()
+        gateway.set_callback(callback)
+        connection = gateway.connection
+        gateway.start()
+        self.assertEqual(len(received), 3)
+        self.assertTrue(received[-1].is_last())
+        cursor, = connection.cursors
+        self.assertEqual(cursor.fetches, 2)
+        self.assertTrue(cursor.closed)
+
+@unittest.skipIf(PostgreSQLGateway is None, "psycopg2 is not installed")
+class PreparedStatementTests(unittest.TestCase):
+
+    def make_query(self, slice_hrns):
+        return Query().get("slice").filter_by("slice_hrn", "INCLUDED", slice_hrns).select("slice_hrn", "authority")
+
+    def test_lists_are_bound_as_arrays(self):
+        params1, params2 = list(), list()
+        statement1 = PostgreSQLGateway.to_sql(self.make_query(["a", "b"]), params1)
+        statement2 = PostgreSQLGateway.to_sql(self.make_query(["a", "b", "c"]), params2)
+        self.assertTrue('"slice_hrn" = ANY($1)' in statement1)
+        self.assertEqual(statement1, statement2)
+        self.assertEqual(params1, [["a", "b"]])
+        self.assertEqual(params2, [["a", "b", "c"]])
+
+    def test_statements_are_prepared_once(self):
+        gateway = make_gateway(self.make_query(["a", "b"]), ROWS, prepare = True)
+        connection = gateway.connection
+        connection.prepared = set()
+        for slice_hrns in [["a"], ["b", "c"]]:
+            gateway.query = self.make_query(slice_hrns)
+            records = list(gateway.get_records())
+            self.assertEqual(len(records), len(ROWS))
+            gateway.connection = connection
+
+        queries = [query for _, query, _ in connection.executed]
+        self.assertEqual(len([query for query in queries if query.startswith("PREPARE")]), 1)
+        executes = [(query, params) for _, query, params in connection.executed if query.startswith("EXECUTE")]
+        self.assertEqual(len(executes), 2)
+        self.assertEqual(executes[1][1], {"p0": ["b", "c"]})
+
+    def test_bound_values_are_not_logged(self):
+        messages = list()
+        class RecordingLog(object):
+            def __getattr__(self, level):
+                return lambda *msg, **ctx: messages.append((level, msg))
+        gateway = make_gateway(self.make_query(["secret"]), ROWS, prepare = True)
+        log, postgresql.Log = postgresql.Log, RecordingLog()
+        try:
+            list(gateway.get_records())
+        finally:
+            postgresql.Log = log
+        self.assertFalse("tmp" in [level for level, _ in messages])
+        self.assertFalse("secret" in repr(messages))
+
+@unittest.skipIf(PostgreSQLGateway is None, "psycopg2 is not installed")
+class ThreadPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        # Run the calls "from the reactor" in this thread
+        self.blockingCallFromThread = postgresql.blockingCallFromThread
+        self.batches = list()
+        def blockingCallFromThread(reactor, f, *args):
+            self.batches.append(list(args[-1]))
+            return f(*args)
+        postgresql.blockingCallFromThread = blockingCallFromThread
+
+    def tearDown(self):
+        postgresql.blockingCallFromThread = self.blockingCallFromThread
+
+    def test_records_are_sent_by_batches(self):
+        gateway = make_gateway(Query().get("slice").select("slice_hrn", "authority"), ROWS, itersize = 2, prepare = False)
+        connection = gateway.connection
+        received = list()
+        gateway.set_callback(received.append)
+        gateway.fetch_records(None)
+
+        self.assertEqual([len(batch) for batch in self.batches], [2, 2, 1])
+        self.assertEqual([record["slice_hrn"] for record in received], [row[0] for row in ROWS])
+        # The cursor is closed and the connection released
+        self.assertTrue(connection.cursors[0].closed)
+        self.assertIsNone(gateway.connection)
+
+    def test_errors_are_reported(self):
+        from twisted.python.failure import Failure
+        gateway = make_gateway(Query().get("slice").select("slice_hrn"), ROWS)
+        received = list()
+        gateway.set_callback(received.append)
+        try:
+            raise RuntimeError("connection lost")
+        except RuntimeError:
+            gateway.on_error(Failure())
+        self.assertTrue(received[-1].is_last())
+        self.assertEqual(len(gateway.get_result_value()), 1)
+
+    def test_thread_pool_per_platform(self):
+        gateway = make_gateway(Query().get("slice").select("slice_hrn"), ROWS, pool_size = 3)
+        thread_pool = gateway.get_thread_pool()
+        try:
+            self.assertIs(make_gateway(Query().get("slice").select("slice_hrn"), ROWS).get_thread_pool(), thread_pool)
+            self.assertEqual(thread_pool.max, 3)
+        finally:
+            thread_pool.stop()
+            PostgreSQLGateway.thread_pools.pop(gateway.get_platform(), None)
+
+class FakeReactor(object):
+    def getThreadPool(self):
+        return None
+
+class FakeReactorThread(object):
+    """
+    Stands for the ReactorThread singleton.
+    """
+    reactor  = FakeReactor()
+    triggers = list()
+
+    def addReactorEventTrigger(self, phase, eventType, callable):
+        self.triggers.append((phase, eventType, callable))
+
+@unittest.skipIf(PostgreSQLGateway is None, "psycopg2 is not installed")
+class ShutdownTests(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = postgresql.blockingCallFromThread, postgresql.deferToThreadPool, postgresql.ReactorThread
+        # The calls "from the reactor" are processed by this thread
+        self.calls = Queue.Queue()
+        def blockingCallFromThread(reactor, f, *args):
+            done = threading.Event()
+            self.calls.put((f, args, done))
+            done.wait()
+        def deferToThreadPool(reactor, thread_pool, f, *args):
+            thread = threading.Thread(target = f, args = args)
+            thread.start()
+            return thread
+        postgresql.blockingCallFromThread = blockingCallFromThread
+        postgresql.deferToThreadPool = deferToThreadPool
+        postgresql.ReactorThread = FakeReactorThread
+
+    def tearDown(self):
+        # Release the workers in case of failure
+        while not self.calls.empty():
+            self.calls.get()[2].set()
+        for thread_pool in PostgreSQLGateway.thread_pools.values():
+            thread_pool.stop()
+        PostgreSQLGateway.thread_pools.clear()
+        PostgreSQLGateway.inflight.clear()
+        del FakeReactorThread.triggers[:]
+        postgresql.blockingCallFromThread, postgresql.deferToThreadPool, postgresql.ReactorThread = self.saved
+
+    def test_shutdown_with_a_query_in_flight(self):
+        gateway = make_gateway(Query().get("slice").select("slice_hrn"), ROWS, itersize = 2, pool_size = 1, prepare = False)
+        received = list()
+        gateway.set_callback(received.append)
+        platform = gateway.get_platform()
+        thread_pool = gateway.get_thread_pool()
+        PostgreSQLGateway.inflight[platform] = set([gateway])
+        thread_pool.callInThread(gateway.fetch_records, None)
+
+        # The worker waits for the reactor to send the first batch
+        f, args, done = self.calls.get(timeout = 5)
+        (phase, event_type, stop), = FakeReactorThread.triggers
+        self.assertEqual((phase, event_type), ("before", "shutdown"))
+        stopping = stop()
+        self.assertTrue(gateway.stopped)
+        self.assertFalse(platform in PostgreSQLGateway.thread_pools)
+
+        # The reactor keeps on running while the ThreadPool is stopped
+        f(*args)
+        done.set()
+        stopping.join(5)
+        self.assertFalse(stopping.is_alive())
+        self.assertEqual(len(received), 2)
+        self.assertIsNone(gateway.connection)
+
+    def test_stopped_queries_are_not_run(self):
+        gateway = make_gateway(Query().get("slice").select("slice_hrn"), ROWS, prepare = False)
+        connection = gateway.connection
+        gateway.stop()
+        gateway.fetch_records(None)
+        self.assertEqual(connection.executed, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from manifold.core.filter           import Filter
+from manifold.core.query            import Query
+from manifold.core.query_plan_cache import QueryPlanCache
+from manifold.operators             import Node
+from manifold.util.predicate        import Predicate, eq
+
+class FakeAST(object):
+    def __init__(self):
+        self.user = None
+
+class FakeQueryPlan(object):
+    """
+    Stands for a QueryPlan: it embeds the Predicates of the Query and a
+    Predicate of its own.
+    """
+    def __init__(self, query):
+        self.ast       = FakeAST()
+        self.node      = Node()
+        self.filter    = Filter(query.get_where())
+        # Introduced by the plan, it carries the same value as a query Predicate
+        self.partition = Predicate("authority", eq, "a")
+
+def make_query(slice_hrn, authority):
+    return Query().get("slice").filter_by("slice_hrn", "==", slice_hrn).filter_by("authority", "==", authority).select("slice_hrn")
+
+def get_value(filter, key):
+    return [p.get_value() for p in filter if p.get_key() == key][0]
+
+class QueryPlanCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = QueryPlanCache()
+        self.cache.validate("stamp")
+        query = make_query("a", "a")
+        self.cache.mark(query)
+        self.cache.add(query, ["ple"], None, FakeQueryPlan(query))
+
+    def test_hit_binds_values_by_position(self):
+        query_plan = self.cache.get(make_query("b", "c"), ["ple"], None)
+        self.assertIsNotNone(query_plan)
+        self.assertEqual(get_value(query_plan.filter, "slice_hrn"), "b")
+        self.assertEqual(get_value(query_plan.filter, "authority"), "c")
+        # Predicates which do not come from the Query are not rebound
+        self.assertEqual(query_plan.partition.get_value(), "a")
+
+    def test_clones_are_independent(self):
+        first  = self.cache.get(make_query("b", "b"), ["ple"], None)
+        second = self.cache.get(make_query("c", "c"), ["ple"], None)
+        self.assertIsNot(first.node, second.node)
+        self.assertEqual(get_value(first.filter, "slice_hrn"), "b")
+
+    def test_miss_on_other_shape(self):
+        query = Query().get("slice").filter_by("slice_hrn", "==", "a").select("slice_hrn")
+        self.assertIsNone(self.cache.get(query, ["ple"], None))
+        self.assertIsNone(self.cache.get(make_query("a", "a"), ["ple", "omf"], None))
+
+    def test_validate_drops_templates(self):
+        self.cache.validate("stamp")
+        self.assertEqual(len(self.cache), 1)
+        self.cache.validate("other stamp")
+        self.assertEqual(len(self.cache), 0)
+
+if __name__ == '__main__':
+    unittest.main()
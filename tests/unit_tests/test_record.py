@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import cPickle, copy, pickle, unittest
+
+from manifold.core.cache_entry      import Entry
+from manifold.core.query            import Query
+from manifold.core.record           import Record, RecordSchema, SharedRecord, LastRecord, MAX_EXTENSIONS
+from manifold.operators.from_cache  import FromCache
+
+class RecordTests(unittest.TestCase):
+
+    def test_pickle(self):
+        record = Record({"slice_hrn": "a", "users": ["u1"]})
+        record.set_annotation("cache", "cache")
+        for module in [pickle, cPickle]:
+            for protocol in [0, 1, 2]:
+                clone = module.loads(module.dumps(record, protocol))
+                self.assertEqual(clone, record)
+                self.assertEqual(clone.get_annotations(), {"cache": "cache"})
+                self.assertIs(clone.get_schema(), record.get_schema())
+
+    def test_pickle_shared_record(self):
+        record = Record({"slice_hrn": "a"})
+        clone = pickle.loads(pickle.dumps(SharedRecord(record), 0))
+        clone["slice_hrn"] = "b"
+        self.assertEqual(record["slice_hrn"], "a")
+        self.assertEqual(copy.deepcopy(clone), {"slice_hrn": "b"})
+
+    def test_extensions_are_bounded(self):
+        schema = RecordSchema.get(("test_extensions_are_bounded",))
+        for i in range(MAX_EXTENSIONS * 2):
+            record = Record.from_values(schema, [None])
+            record["field%d" % i] = i
+            self.assertEqual(record.keys(), ["test_extensions_are_bounded", "field%d" % i])
+        self.assertEqual(len(schema._extensions), MAX_EXTENSIONS)
+
+class SharedRecordTests(unittest.TestCase):
+
+    def test_copy_on_write(self):
+        record = Record({"slice_hrn": "a", "users": ["u1"]})
+        view = SharedRecord(record)
+        self.assertEqual(view, record)
+
+        view["slice_hrn"] = "b"
+        view["resources"] = []
+        del view["users"]
+        self.assertEqual(record, {"slice_hrn": "a", "users": ["u1"]})
+        self.assertEqual(view, {"slice_hrn": "b", "resources": []})
+
+    def test_annotations_are_not_shared(self):
+        record = Record({"slice_hrn": "a"})
+        record.set_annotation("origin", "gateway")
+        view = SharedRecord(record, record.get_annotations())
+        view.set_annotation("cache", "cache")
+        self.assertEqual(record.get_annotations(), {"origin": "gateway"})
+        self.assertEqual(view.get_annotation("origin"), "gateway")
+
+    def test_from_cache_sends_views(self):
+        record = Record({"slice_hrn": "a"})
+        entry = Entry()
+        entry.append_record(record)
+        entry.append_record(LastRecord())
+
+        node = FromCache(Query().get("slice").select("slice_hrn"), entry)
+        received = list()
+        node.set_callback(received.append)
+        node.start()
+
+        self.assertTrue(received[-1].is_last())
+        received[0]["slice_hrn"] = "b"
+        self.assertEqual(record["slice_hrn"], "a")
+        self.assertIsNone(record.get_annotation("cache"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from twisted.internet               import defer
+
+try:
+    from manifold.gateways.sfa      import rspec_cache
+    from manifold.gateways.sfa.rspec_cache import RSpecCache
+except ImportError:
+    # sfa is not installed
+    RSpecCache = None
+
+class Fetch(object):
+    """
+    Fetches advertisements whose result is given once the test fires them.
+    """
+    def __init__(self):
+        self.deferreds = list()
+
+    def __call__(self):
+        d = defer.Deferred()
+        self.deferreds.append(d)
+        return d
+
+class Clock(object):
+    """
+    Stands for the time module.
+    """
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+def make_cache():
+    cache = object.__new__(RSpecCache)
+    cache.__init__()
+    return cache
+
+def collect(d):
+    results = list()
+    d.addBoth(results.append)
+    return results
+
+@unittest.skipIf(RSpecCache is None, "sfa is not installed")
+class RSpecCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = make_cache()
+        self.fetch = Fetch()
+        self.clock = Clock(1000.0)
+        self.time  = rspec_cache.time
+        rspec_cache.time = self.clock
+
+    def tearDown(self):
+        rspec_cache.time = self.time
+
+    def get(self):
+        return collect(self.cache.get("ple", self.fetch, ttl = 10, stale = 100))
+
+    def test_fresh_entries_are_copies(self):
+        first = self.get()
+        self.fetch.deferreds[0].callback({"resource": ["node1"]})
+        second = self.get()
+        self.assertEqual(len(self.fetch.deferreds), 1)
+        self.assertEqual(first, second)
+        self.assertIsNot(first[0], second[0])
+        second[0]["resource"].append("node2")
+        self.assertEqual(self.get()[0], {"resource": ["node1"]})
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+    def test_concurrent_fetches_are_coalesced(self):
+        first, second = self.get(), self.get()
+        self.assertEqual(len(self.fetch.deferreds), 1)
+        self.fetch.deferreds[0].callback({"resource": ["node1"]})
+        self.assertEqual(first, second)
+
+    def test_stale_entries_are_revalidated(self):
+        self.get()
+        self.fetch.deferreds[0].callback({"resource": ["node1"]})
+        self.clock.now += 50
+        stale = self.get()
+        # The stale entry is returned while it is refreshed
+        self.assertEqual(stale, [{"resource": ["node1"]}])
+        self.assertEqual(len(self.fetch.deferreds), 2)
+        # A single refresh is in progress
+        self.get()
+        self.assertEqual(len(self.fetch.deferreds), 2)
+        self.fetch.deferreds[1].callback({"resource": ["node2"]})
+        self.assertEqual(self.get(), [{"resource": ["node2"]}])
+        self.assertEqual(self.cache.stales, 2)
+
+    def test_expired_entries_are_fetched(self):
+        self.get()
+        self.fetch.deferreds[0].callback({"resource": ["node1"]})
+        self.clock.now += 200
+        result = self.get()
+        self.assertEqual(result, [])
+        self.fetch.deferreds[1].callback({"resource": ["node2"]})
+        self.assertEqual(result, [{"resource": ["node2"]}])
+
+    def test_empty_results_are_not_cached(self):
+        self.get()
+        self.fetch.deferreds[0].callback({})
+        self.get()
+        self.assertEqual(len(self.fetch.deferreds), 2)
+
+if __name__ == '__main__':
+    unittest.main()
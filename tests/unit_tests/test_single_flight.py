@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from twisted.internet               import defer
+
+from manifold.util                  import single_flight
+from manifold.util.single_flight    import SingleFlight, DIGEST_MIN_LENGTH
+
+class Call(object):
+    """
+    A remote call whose result is given once the test fires it.
+    """
+    def __init__(self):
+        self.deferreds = list()
+
+    def __call__(self, *args):
+        d = defer.Deferred()
+        self.deferreds.append(d)
+        return d
+
+def collect(d):
+    results = list()
+    d.addBoth(results.append)
+    return results
+
+class SingleFlightTests(unittest.TestCase):
+
+    def setUp(self):
+        self.single_flight = SingleFlight("test")
+        self.call = Call()
+
+    def test_identical_calls_are_coalesced(self):
+        key = SingleFlight.get_key("http://am", "ListResources", (["cred"], {"call_id": "1", "list_leases": "all"}))
+        same = SingleFlight.get_key("http://am", "ListResources", (["cred"], {"list_leases": "all", "call_id": "2"}))
+        self.assertEqual(key, same)
+
+        first  = collect(self.single_flight.call(key, self.call))
+        second = collect(self.single_flight.call(same, self.call))
+        self.assertEqual(len(self.call.deferreds), 1)
+        self.call.deferreds[0].callback({"value": ["rspec"]})
+        self.assertEqual(first, second)
+        self.assertIsNot(first[0], second[0])
+        self.assertEqual(self.single_flight.get_stats(), {"calls": 2, "saved": 1, "inflight": 0})
+
+        # Once the call is done, a new call is issued
+        self.single_flight.call(key, self.call)
+        self.assertEqual(len(self.call.deferreds), 2)
+
+    def test_distinct_calls(self):
+        for method, args in [("ListResources", (["cred"], {})), ("Resolve", (["cred"], {})), ("ListResources", (["other"], {}))]:
+            self.single_flight.call(SingleFlight.get_key("http://am", method, args), self.call)
+        # Calls which must not be coalesced
+        self.single_flight.call(None, self.call)
+        self.single_flight.call(None, self.call)
+        self.assertEqual(len(self.call.deferreds), 5)
+
+    def test_failures_are_shared(self):
+        key = SingleFlight.get_key("http://am", "GetVersion", ())
+        first  = collect(self.single_flight.call(key, self.call))
+        second = collect(self.single_flight.call(key, self.call))
+        self.call.deferreds[0].errback(ValueError("timeout"))
+        for results in [first, second]:
+            self.assertTrue(results[0].check(ValueError))
+        self.assertEqual(self.single_flight.inflight, {})
+
+    def test_secrets_and_long_strings_are_digested(self):
+        credential = "x" * DIGEST_MIN_LENGTH
+        auth = {"AuthMethod": "password", "Username": "alice", "AuthString": "secret"}
+        key = SingleFlight.get_key("https://plc/PLCAPI/", "GetSlices", (auth, credential))
+        self.assertFalse("secret" in repr(key))
+        self.assertFalse(credential in repr(key))
+        # Distinct passwords lead to distinct keys
+        other = SingleFlight.get_key("https://plc/PLCAPI/", "GetSlices", (dict(auth, AuthString = "other"), credential))
+        self.assertNotEqual(key, other)
+        hash(key)
+
+    def test_stats_are_logged_periodically(self):
+        messages = list()
+        class RecordingLog(object):
+            def __getattr__(self, level):
+                return lambda *msg: messages.append((level, msg))
+        saved = single_flight.Log, single_flight.STATS_PERIOD
+        single_flight.Log, single_flight.STATS_PERIOD = RecordingLog(), 3
+        try:
+            key = SingleFlight.get_key("http://am", "GetVersion", ())
+            for i in range(7):
+                self.single_flight.call(key, self.call)
+        finally:
+            single_flight.Log, single_flight.STATS_PERIOD = saved
+        infos = [msg[0] for level, msg in messages if level == "info"]
+        self.assertEqual(infos, ["test: 2/3 calls saved, 1 in flight", "test: 5/6 calls saved, 1 in flight"])
+
+if __name__ == '__main__':
+    unittest.main()
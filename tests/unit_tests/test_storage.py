@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading, unittest
+
+from manifold.util.storage  import DBStorage
+
+class DBStorageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.get_url = DBStorage.get_url
+        self.engine  = DBStorage._engine
+        DBStorage.get_url = staticmethod(lambda: "sqlite://")
+        DBStorage._engine = None
+
+    def tearDown(self):
+        DBStorage.get_url = staticmethod(self.get_url)
+        DBStorage._engine = self.engine
+
+    def test_engine_is_shared(self):
+        engine = DBStorage.get_engine()
+        self.assertIs(DBStorage.get_engine(), engine)
+        self.assertEqual(str(engine.url), "sqlite://")
+
+    def test_sessions_are_thread_local(self):
+        # manifold.models creates its session factory on the shared engine
+        from manifold.models import db, engine
+        self.assertIs(engine, DBStorage.get_engine())
+        sessions = list()
+        thread = threading.Thread(target = lambda: sessions.append(db()))
+        thread.start()
+        thread.join()
+        self.assertIs(db(), db())
+        self.assertIsNot(sessions[0], db())
+        self.assertIs(sessions[0].get_bind(), engine)
+
+if __name__ == '__main__':
+    unittest.main()
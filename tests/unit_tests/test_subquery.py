@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from manifold.core.query            import Query
+from manifold.core.record           import Record
+from manifold.core.relation         import Relation
+from manifold.operators.from_table  import FromTable
+from manifold.operators.subquery    import SubQuery
+from manifold.util.predicate        import Predicate, eq
+
+def make_subquery(**kwargs):
+    parent = FromTable(
+        Query().get("slice").select("slice_hrn"),
+        [Record({"slice_hrn": "a"}), Record({"slice_hrn": "b"}), Record({"slice_hrn": "c"})],
+        "slice_hrn"
+    )
+    child = FromTable(
+        Query().get("resource").select("hrn", "slice"),
+        [
+            Record({"hrn": "r1", "slice": "b"}),
+            Record({"hrn": "r2", "slice": "a"}),
+            Record({"hrn": "r3", "slice": "b"}),
+            Record({"hrn": "r4", "slice": "z"})
+        ],
+        "hrn"
+    )
+    relation = Relation(Relation.types.LINK_1N_BACKWARDS, Predicate("slice_hrn", eq, "slice"), "resource")
+    return SubQuery(parent, [(child, relation)], **kwargs)
+
+def run(subquery):
+    records = list()
+    subquery.set_callback(records.append)
+    subquery.start()
+    return records
+
+class SubQueryTests(unittest.TestCase):
+
+    def check(self, records):
+        self.assertTrue(records[-1].is_last())
+        resources = dict(
+            (record["slice_hrn"], [resource["hrn"] for resource in record["resource"]])
+            for record in records[:-1]
+        )
+        # Child records are dispatched to their parent, in their order
+        self.assertEqual(resources, {"a": ["r2"], "b": ["r1", "r3"], "c": []})
+
+    def test_dispatch(self):
+        self.check(run(make_subquery(chunk_size = 0)))
+
+    def test_chunked_dispatch(self):
+        for chunk_size in [1, 2, 5]:
+            for max_chunks in [1, 2]:
+                self.check(run(make_subquery(chunk_size = chunk_size, max_chunks = max_chunks)))
+
+    def test_chunk_options_default(self):
+        subquery = make_subquery()
+        self.assertEqual((subquery.chunk_size, subquery.max_chunks), SubQuery.get_chunk_options())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from manifold.core.query                    import Query
+from manifold.core.record                   import Record
+from manifold.operators.from_table          import FromTable
+from manifold.operators.symmetric_hash_join import SymmetricHashJoin
+from manifold.util.predicate                import Predicate, eq
+
+class SymmetricHashJoinTests(unittest.TestCase):
+
+    def make_join(self, right_records):
+        left = FromTable(
+            Query().get("slice").select("slice_hrn"),
+            [Record({"slice_hrn": "a"}), Record({"slice_hrn": "b"}), Record({"slice_hrn": "c"})],
+            "slice_hrn"
+        )
+        right = FromTable(Query().get("slice").select("hrn", "nodes"), right_records, "hrn")
+        return SymmetricHashJoin(left, right, Predicate("slice_hrn", eq, "hrn"))
+
+    def run_join(self, join):
+        records = list()
+        join.set_callback(records.append)
+        join.start()
+        return records
+
+    def test_left_join(self):
+        records = self.run_join(self.make_join([
+            Record({"hrn": "b", "nodes": 2}),
+            Record({"hrn": "a", "nodes": 1}),
+            # Only the first right record of a key is joined
+            Record({"hrn": "a", "nodes": 3}),
+            Record({"hrn": "z", "nodes": 4})
+        ]))
+        self.assertTrue(records[-1].is_last())
+        joined = dict((record["slice_hrn"], record.get("nodes")) for record in records[:-1])
+        # Unmatched left records are kept
+        self.assertEqual(joined, {"a": 1, "b": 2, "c": None})
+
+    def test_benefits_from_injection(self):
+        # FromTable nodes are not From nodes, they might use the keys
+        self.assertTrue(SymmetricHashJoin.benefits_from_injection(self.make_join([]).right))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from manifold.core.capabilities     import Capabilities
+from manifold.core.field            import Field
+from manifold.core.filter           import Filter
+from manifold.core.key              import Key
+from manifold.core.query            import Query, ORDER_ASC, ORDER_DESC
+from manifold.core.record           import Record, LastRecord
+from manifold.gateways              import Gateway
+from manifold.operators.From        import From
+from manifold.operators.from_table  import FromTable
+from manifold.operators.selection   import Selection
+from manifold.operators.top_k       import TopK
+from manifold.operators.union       import Union
+
+RANKS = [3, 1, 4, 5, 2]
+KEY   = Key([Field([], "string", "slice_hrn")])
+
+class StreamGateway(Gateway):
+    """
+    Sends its records one by one, unless it is stopped.
+    """
+    def __init__(self, records):
+        super(StreamGateway, self).__init__(None, "ple")
+        self.records = records
+        self.sent    = 0
+
+    def start(self):
+        for record in self.records:
+            if self.stopped:
+                break
+            self.sent += 1
+            self.send(record)
+        self.send(LastRecord())
+
+def make_query():
+    return Query().get("slice").select("slice_hrn", "rank")
+
+def make_records():
+    return [Record({"slice_hrn": "s%d" % rank, "rank": rank}) for rank in RANKS]
+
+def make_from(*capabilities):
+    caps = Capabilities()
+    for capability in capabilities:
+        setattr(caps, capability, True)
+    node = From("ple", make_query(), caps, KEY)
+    node.set_gateway(StreamGateway(make_records()))
+    return node
+
+def run(node):
+    records = list()
+    node.set_callback(records.append)
+    node.start()
+    return records
+
+def get_ranks(records):
+    return [record["rank"] for record in records if not record.is_last()]
+
+class TopKTests(unittest.TestCase):
+
+    def test_order_by_limit_offset(self):
+        child = FromTable(make_query(), make_records(), "slice_hrn")
+        records = run(TopK(child, [("rank", ORDER_DESC)], 2, 1))
+        self.assertEqual(get_ranks(records), [4, 3])
+        self.assertTrue(records[-1].is_last())
+        self.assertEqual(len([record for record in records if record.is_last()]), 1)
+
+    def test_order_by_without_limit(self):
+        child = FromTable(make_query(), make_records(), "slice_hrn")
+        records = run(TopK(child, [("rank", ORDER_ASC)], None, 3))
+        self.assertEqual(get_ranks(records), [4, 5])
+
+    def test_limit_stops_the_gateway(self):
+        node = make_from()
+        records = run(TopK(node, list(), 2, 1))
+        self.assertEqual(get_ranks(records), RANKS[1:3])
+        self.assertEqual(len([record for record in records if record.is_last()]), 1)
+        self.assertTrue(node.gateway.stopped)
+        self.assertEqual(node.gateway.sent, 3)
+
+    def test_zero_limit(self):
+        node = make_from()
+        records = run(TopK(node, list(), 0))
+        self.assertEqual(len(records), 1)
+        self.assertTrue(records[0].is_last())
+        self.assertEqual(node.gateway.sent, 0)
+
+class FromOptimizeLimitTests(unittest.TestCase):
+
+    order_by = [("rank", ORDER_DESC)]
+
+    def test_push_everything(self):
+        node = make_from("sort", "limit", "offset")
+        self.assertIs(node.optimize_limit(self.order_by, 2, 1), node)
+        self.assertEqual((node.query.get_order_by(), node.query.get_limit(), node.query.get_offset()), (self.order_by, 2, 1))
+
+    def test_push_limit_without_offset(self):
+        node = make_from("sort", "limit")
+        top_k = node.optimize_limit(self.order_by, 2, 1)
+        self.assertIsInstance(top_k, TopK)
+        self.assertEqual((top_k.order_by, top_k.limit, top_k.offset), ([], 2, 1))
+        self.assertEqual((node.query.get_order_by(), node.query.get_limit(), node.query.get_offset()), (self.order_by, 3, 0))
+
+    def test_push_sort_only(self):
+        node = make_from("sort")
+        top_k = node.optimize_limit(self.order_by, 2, 1)
+        self.assertEqual((top_k.order_by, top_k.limit, top_k.offset), ([], 2, 1))
+        self.assertEqual((node.query.get_order_by(), node.query.get_limit()), (self.order_by, None))
+
+    def test_no_capability(self):
+        node = make_from("limit", "offset")
+        top_k = node.optimize_limit(self.order_by, 2, 1)
+        self.assertEqual((top_k.order_by, top_k.limit, top_k.offset), (self.order_by, 2, 1))
+        self.assertEqual((node.query.get_order_by(), node.query.get_limit()), ([], None))
+        self.assertEqual(get_ranks(run(top_k)), [4, 3])
+
+class TopKOptimizeSelectionTests(unittest.TestCase):
+
+    def test_filter_is_applied_before_limit(self):
+        for capabilities in [(), ("selection",)]:
+            node = make_from(*capabilities)
+            top_k = TopK(node, [("rank", ORDER_DESC)], 2)
+            self.assertIs(top_k.optimize_selection(Filter.from_list([("rank", "<", 4)])), top_k)
+            if capabilities:
+                # The filter is pushed into the gateway
+                self.assertIs(top_k.child, node)
+                self.assertEqual(len(node.query.get_where()), 1)
+            else:
+                self.assertIsInstance(top_k.child, Selection)
+                self.assertEqual(get_ranks(run(top_k)), [3, 2])
+
+class UnionOptimizeLimitTests(unittest.TestCase):
+
+    order_by = [("rank", ORDER_DESC)]
+
+    def test_children_are_not_limited(self):
+        children = [make_from("sort", "limit", "offset"), make_from()]
+        union = Union(children, KEY)
+        top_k = union.optimize_limit(self.order_by, 2, 1)
+        self.assertEqual((top_k.order_by, top_k.limit, top_k.offset), (self.order_by, 2, 1))
+        self.assertEqual(union.children, children)
+        self.assertEqual((children[0].query.get_order_by(), children[0].query.get_limit()), (self.order_by, None))
+        self.assertEqual(children[1].query.get_order_by(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import copy, unittest
+
+from manifold.core.record   import Record
+from manifold.operators     import Node
+from manifold.util.trace    import Tracer, TRACE_COUNTERS, TRACE_SAMPLED
+
+class FakeGateway(object):
+    def __init__(self, identifier):
+        self.identifier = identifier
+        self.callback   = lambda record: None
+
+class TracerTests(unittest.TestCase):
+
+    def make_node(self, tracer):
+        node = Node()
+        node.set_callback(lambda record: None)
+        tracer.install(node)
+        return node
+
+    def test_counters_per_instance(self):
+        tracer = Tracer(TRACE_COUNTERS, 1, 10)
+        node = self.make_node(tracer)
+        # Gateways get the identifier of their From Node
+        gateway = FakeGateway(node.identifier)
+        tracer.install(gateway)
+
+        node.send(Record({"a": 1}))
+        node.send(Record({"a": 2}))
+        gateway.send(Record({"a": 1}))
+
+        counts = sorted((class_name, count) for _, class_name, count in tracer.counters.values())
+        self.assertEqual(counts, [("FakeGateway", 1), ("Node", 2)])
+        self.assertEqual(len(tracer.events), 0)
+
+    def test_copies_are_traced(self):
+        tracer = Tracer(TRACE_COUNTERS, 1, 10)
+        node = self.make_node(tracer)
+        clone = copy.deepcopy(node)
+        self.assertIs(clone.tracer, tracer)
+        clone.send(Record({"a": 1}))
+        self.assertEqual([count for _, _, count in tracer.counters.values()], [1])
+
+    def test_sampling(self):
+        tracer = Tracer(TRACE_SAMPLED, 3, 2)
+        node = self.make_node(tracer)
+        for i in range(12):
+            node.send(Record({"a": i}))
+        # One event out of 3, the last 2 ones are kept
+        self.assertEqual([event[3]["a"] for event in tracer.events], [8, 11])
+        self.assertTrue("12 record(s)" in tracer.dump())
+
+if __name__ == '__main__':
+    unittest.main()